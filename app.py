@@ -1,11 +1,10 @@
 import os
 import sys
 import json
-import uuid
 import time
-import threading
 import requests
 import secrets
+import base64
 from datetime import datetime, timedelta
 
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
@@ -17,6 +16,7 @@ from authlib.integrations.flask_client import OAuth
 
 # Core Imports
 from core.extensions import login_manager, csrf, limiter, db_manager
+from core.database import sale_item_counts
 from core.models import User
 from core.auth import AuthManager
 from core.config import Config
@@ -27,6 +27,8 @@ from core.services.dl_client import DLClient
 from core.services.analytics_service import analytics_service
 from core.automation_engine import AutomationEngine
 from core.agent_middleware import AgentMiddleware
+from core.job_queue import JobQueue, QueueFull
+from core.product_search import get_product_search_index
 sys.stdout.reconfigure(encoding='utf-8')
 
 # Allow OAuth over HTTP for local development
@@ -41,11 +43,6 @@ config = Config()
 utils = Utils()
 db = db_manager  # Alias for convenience
 
-# In-Memory Job Store (For Async AI Tasks)
-# Structure: { job_id: { "status": "processing", "result": None, "start_time": timestamp } }
-AI_JOBS = {}
-JOBS_DIR = os.path.join(os.getcwd(), 'jobs')
-os.makedirs(JOBS_DIR, exist_ok=True)
 
 # Central subscription plans (used in wallet/subscription logic)
 SUBSCRIPTION_PLANS = {
@@ -186,6 +183,8 @@ def create_app(config_object=None):
     auth_manager = AuthManager(db_manager)
     agent_middleware = AgentMiddleware(db_manager)
     automation_engine = AutomationEngine(db_manager)
+    if getattr(cfg, 'AUTOMATION_SCHEDULER_ENABLED', False) and not getattr(cfg, 'TESTING', False):
+        automation_engine.start()
     db = db_manager
     flask_app.extensions['auth_manager'] = auth_manager
     flask_app.extensions['agent_middleware'] = agent_middleware
@@ -379,8 +378,9 @@ def sale_page():
 @app.route('/api/products/search')
 @login_required
 def search_products():
-    query = request.args.get('q', '').lower()
+    query = request.args.get('q', '')
     random_mode = request.args.get('random') == 'true'
+    limit = max(1, min(request.args.get('limit', 5, type=int), 50))
     
     try:
         catalog_path = os.path.join(app.root_path, 'dl_service/data/product_catalogs.json')
@@ -389,18 +389,14 @@ def search_products():
              # Try absolute path based on workspace exploration
              catalog_path = os.path.join(os.getcwd(), 'dl_service/data/product_catalogs.json')
              
-        with open(catalog_path, 'r', encoding='utf-8') as f:
-            products = json.load(f)
+        # Indexed once per process, rebuilt when the file changes (see core/product_search.py)
+        index = get_product_search_index(catalog_path)
             
         if random_mode:
             import random
-            results = random.sample(products, min(len(products), 8))
+            results = random.sample(index.products, min(len(index), 8))
         else:
-            # Filter products
-            results = [
-                p for p in products 
-                if query in p.get('name', '').lower() or query in str(p.get('id', '')).lower()
-            ][:5] # Limit to 5
+            results = index.search(query, limit=limit)
             
         return jsonify(results)
     except Exception as e:
@@ -412,19 +408,23 @@ def search_products():
 def create_sale():
     data = request.json
     try:
-        db = Database()
-        conn = db.get_connection()
+        db_manager.ensure_sales_schema()
+        db_manager.ensure_rollups_schema()
+        conn = db_manager.get_connection()
         c = conn.cursor()
         
-        items_json = json.dumps(data.get('items', []))
+        items = data.get('items', [])
+        items_json = json.dumps(items)
+        item_count, total_qty = sale_item_counts(items)
         
         # Determine workspace_id (default to user's personal if not provided, or NULL)
         # For now we don't have active workspace in session easily accessble here unless passed
         workspace_id = data.get('workspace_id')
         
         c.execute('''
-            INSERT INTO sales (user_id, total_amount, amount_given, change_amount, items, payment_method, workspace_id, category)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO sales (user_id, total_amount, amount_given, change_amount, items, payment_method, workspace_id, category,
+                               item_count, total_qty)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             current_user.id,
             data.get('total_amount'),
@@ -433,92 +433,123 @@ def create_sale():
             items_json,
             data.get('payment_method', 'cash'),
             workspace_id,
-            data.get('category', 'Retail')
+            data.get('category', 'Retail'),
+            item_count,
+            total_qty
         ))
+        db_manager.record_rollup(c, 'sale', data.get('total_amount'))
         
         conn.commit()
+        conn.close()
         return jsonify({'success': True, 'message': 'Sale recorded successfully'})
     except Exception as e:
         print(f"Error creating sale: {e}")
         try:
              conn.rollback()
+             conn.close()
         except: 
              pass
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _encode_sales_cursor(created_at, sale_id):
+    raw = f"{created_at}|{sale_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_sales_cursor(cursor):
+    """(created_at, id) from an X-Next-Cursor value, or None if malformed."""
+    try:
+        created_at, sale_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(sale_id)
+    except (ValueError, UnicodeError):
+        return None
+
 @app.route('/api/sales/history', methods=['GET'])
 @login_required
 def get_sales_history():
+    """
+    Newest sales first, paged by (created_at, id).
+
+    Query args: q (sale id or payment method), limit, cursor (X-Next-Cursor of
+    the previous page), include_items=0 to leave out the items payload.
+    """
     try:
         search_query = request.args.get('q', '').strip()
-        limit = request.args.get('limit', 10, type=int)
+        limit = max(1, min(request.args.get('limit', 10, type=int), 200))
+        include_items = request.args.get('include_items', '1') != '0'
+        cursor = request.args.get('cursor')
 
-        db = Database()
-        conn = db.get_connection()
+        db_manager.ensure_sales_schema()
+        conn = db_manager.get_connection()
         c = conn.cursor()
         
-        # Base query
+        # items is only read when requested, or for legacy rows without counts
         base_query = '''
-            SELECT id, created_at, total_amount, payment_method, items 
+            SELECT id, created_at, total_amount, payment_method, item_count, total_qty,
+                   CASE WHEN ? = 1 OR total_qty IS NULL THEN items END
             FROM sales 
             WHERE user_id = ?
         '''
-        params = [current_user.id]
+        params = [1 if include_items else 0, current_user.id]
 
         # Add search filter
         if search_query:
             if search_query.isdigit():
-                # Search by ID if it's a number
-                if Config.USE_POSTGRES:
-                     base_query += " AND CAST(id AS TEXT) LIKE ?"
-                else:
-                     base_query += " AND CAST(id AS TEXT) LIKE ?"
-                params.append(f"%{search_query}%")
+                # Exact sale id (primary key lookup)
+                base_query += " AND id = ?"
+                params.append(int(search_query))
             else:
                 # Search by payment_method (case insensitive)
                 base_query += " AND LOWER(payment_method) LIKE ?"
                 params.append(f"%{search_query.lower()}%")
 
-        # Order and Limit
-        base_query += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
+        if cursor:
+            position = _decode_sales_cursor(cursor)
+            if position is None:
+                conn.close()
+                return jsonify({'error': 'Invalid cursor'}), 400
+            base_query += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params.extend([position[0], position[0], position[1]])
+
+        # Order and Limit (one extra row tells us whether there is a next page)
+        base_query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
         
         c.execute(base_query, tuple(params))
         rows = c.fetchall()
+        conn.close()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         history = []
         for row in rows:
-            # row: 0=id, 1=created_at, 2=total, 3=method, 4=items
-            # Parse items to get count
-            try:
-                # Handle case where items might be None or not JSON
-                if not row[4]:
-                     items = []
-                elif isinstance(row[4], str):
-                     items = json.loads(row[4])
-                elif isinstance(row[4], (dict, list)):
-                     items = row[4] # psycopg2 might decode json automatically if column type is JSON (it's TEXT here but let's be safe)
-                else:
-                     items = []
-
-                if isinstance(items, list):
-                    item_count = sum(int(item.get('qty', 0)) for item in items if isinstance(item, dict))
-                else:
-                    item_count = 0
-            except Exception as e:
-                print(f"Error parsing items for sale {row[0]}: {e}")
-                item_count = 0
-            
-            history.append({
+            # row: 0=id, 1=created_at, 2=total, 3=method, 4=item_count, 5=total_qty, 6=items (or NULL)
+            items = None
+            if row[6] is not None:
+                try:
+                    items = json.loads(row[6]) if isinstance(row[6], str) else row[6]
+                except ValueError:
+                    print(f"Skipping malformed items JSON for sale {row[0]}")
+                    items = []
+            line_count, total_qty = row[4], row[5]
+            if total_qty is None:
+                line_count, total_qty = sale_item_counts(items)
+
+            sale = {
                 'id': row[0],
                 'date': format_display_datetime(row[1]) or str(row[1]),
                 'amount': row[2],
                 'payment_method': row[3] or 'Cash',
-                'item_count': item_count,
-                'items': items # Pass full items list for details view
-            })
+                'item_count': total_qty,  # units sold, as shown in the history badge
+                'line_count': line_count,
+            }
+            if include_items:
+                sale['items'] = items or []  # Pass full items list for details view
+            history.append(sale)
             
-        return jsonify(history)
+        resp = jsonify(history)
+        if has_more and rows:
+            resp.headers['X-Next-Cursor'] = _encode_sales_cursor(rows[-1][1], rows[-1][0])
+        return resp
     except Exception as e:
         print(f"Error fetching history: {e}")
         import traceback
@@ -529,28 +560,19 @@ def get_sales_history():
 @login_required
 def delete_sale(sale_id):
     try:
-        if Config.USE_POSTGRES:
-            # Postgres
-            db = Database()
-            conn = db.get_connection()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM sales WHERE id = %s", (sale_id,))
-            if cur.rowcount == 0:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Sale not found'}), 404
-            conn.commit()
-            conn.close()
-        else:
-            # SQLite
-            db = Database()
-            conn = db.get_connection()
-            c = conn.cursor()
-            c.execute("DELETE FROM sales WHERE id = ?", (sale_id,))
-            if c.rowcount == 0:
-                conn.close()
-                return jsonify({'success': False, 'message': 'Sale not found'}), 404
-            conn.commit()
+        db_manager.ensure_rollups_schema()
+        conn = db_manager.get_connection()
+        c = conn.cursor()
+        c.execute("SELECT total_amount, created_at FROM sales WHERE id = ?", (sale_id,))
+        sale = c.fetchone()
+        if not sale:
             conn.close()
+            return jsonify({'success': False, 'message': 'Sale not found'}), 404
+        c.execute("DELETE FROM sales WHERE id = ?", (sale_id,))
+        # Take the sale back out of its day's rollup
+        db_manager.record_rollup(c, 'sale', -float(sale[0] or 0), count=-1, day=str(sale[1])[:10])
+        conn.commit()
+        conn.close()
             
         return jsonify({'success': True, 'message': 'Sale deleted successfully'})
     except Exception as e:
@@ -1044,7 +1066,11 @@ def admin_get_stats():
             'managers': 0,
             'products': 0,
             'customers': 0
-        }
+        },
+        'db_pool': db_manager.pool_stats(),
+        'user_cache': auth_manager.user_cache.stats(),
+        'ai_jobs': ai_jobs.stats(),
+        'google_services': google_integration.get_service_cache_stats()
     })
 
 @app.route('/api/products', methods=['GET', 'POST'])
@@ -1281,6 +1307,7 @@ def delete_user_account(user_id):
     c.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    auth_manager.invalidate_user(user_id)
     
     return jsonify({'success': True, 'message': 'User deleted successfully'})
 
@@ -1317,6 +1344,7 @@ def reset_user_password(user_id):
     c.execute('UPDATE users SET password = ? WHERE id = ?', (hashed_password, user_id))
     conn.commit()
     conn.close()
+    auth_manager.invalidate_user(user_id)
     
     return jsonify({'success': True, 'message': 'Password reset successfully'})
 
@@ -1336,6 +1364,7 @@ def admin_delete_user(user_id):
     c.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    auth_manager.invalidate_user(user_id)
     
     return jsonify({'success': True, 'message': 'User deleted successfully'})
 
@@ -1381,6 +1410,7 @@ def admin_promote_user():
         c.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
         conn.commit()
         conn.close()
+        auth_manager.invalidate_user(user_id)
         
         db_manager.log_activity(current_user.id, 'Promote User', f'Promoted user {user_id} to {new_role}', request.remote_addr)
         
@@ -1430,6 +1460,7 @@ def admin_demote_user():
         c.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
         conn.commit()
         conn.close()
+        auth_manager.invalidate_user(user_id)
         
         db_manager.log_activity(current_user.id, 'Demote User', f'Demoted user {user_id} to {new_role}', request.remote_addr)
         
@@ -1615,6 +1646,7 @@ def api_create_import():
     if not items:
         return jsonify({'success': False, 'message': 'No items in import'}), 400
 
+    db_manager.ensure_rollups_schema()
     conn = db_manager.get_connection()
     c = conn.cursor()
     
@@ -1631,6 +1663,7 @@ def api_create_import():
                      VALUES (?, ?, ?, ?, ?)''',
                   (code, supplier_name, total_amount, notes, current_user.id))
         import_id = c.lastrowid
+        db_manager.record_rollup(c, 'import', total_amount)
         
         # Create details and update stock
         for item in items:
@@ -1741,6 +1774,7 @@ def api_create_export():
     if not items:
         return jsonify({'success': False, 'message': 'No items in export'}), 400
 
+    db_manager.ensure_rollups_schema()
     conn = db_manager.get_connection()
     c = conn.cursor()
     
@@ -1757,6 +1791,7 @@ def api_create_export():
                      VALUES (?, ?, ?, ?, ?)''',
                   (code, customer_id, total_amount, notes, current_user.id))
         export_id = c.lastrowid
+        db_manager.record_rollup(c, 'export', total_amount)
         
         # Create details and update stock
         updated_products = []
@@ -1785,12 +1820,8 @@ def api_create_export():
         
         conn.commit()
         
-        # Trigger automations in background (or just call it, it's fast enough)
-        for pid, stock in updated_products:
-            try:
-                automation_engine.check_low_stock(pid, stock)
-            except Exception as e:
-                print(f"Error triggering automation: {e}")
+        # Low stock automations are evaluated for the whole export on the automation worker
+        automation_engine.queue_low_stock_check(updated_products)
 
         return jsonify({'success': True, 'message': 'Export created successfully', 'id': export_id})
         
@@ -1892,16 +1923,10 @@ def api_get_dashboard_stats():
         conn = db_manager.get_connection()
         c = conn.cursor()
         
-        # Revenue (This Month)
+        # Revenue (This Month) and New Orders (Today) from daily_rollups
         today = datetime.now()
-        start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0).strftime('%Y-%m-%d %H:%M:%S')
-        c.execute("SELECT SUM(total_amount) FROM export_transactions WHERE created_at >= ?", (start_of_month,))
-        revenue = c.fetchone()[0] or 0
-        
-        # New Orders (Today)
-        start_of_day = today.replace(hour=0, minute=0, second=0, microsecond=0).strftime('%Y-%m-%d %H:%M:%S')
-        c.execute("SELECT COUNT(*) FROM export_transactions WHERE created_at >= ?", (start_of_day,))
-        new_orders = c.fetchone()[0] or 0
+        revenue = db_manager.get_rollup_totals(today.strftime('%Y-%m-01'))['revenue']
+        new_orders = db_manager.get_rollup_totals(today.strftime('%Y-%m-%d'))['orders']
         
         # Pending Returns (Mock - assuming we might have a returns table later, or use status)
         # For now, let's count 'pending' exports as a proxy or just 0
@@ -1941,13 +1966,10 @@ def api_get_report_stats():
     today = datetime.now()
     start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0).strftime('%Y-%m-%d %H:%M:%S')
     
-    # Revenue (Exports)
-    c.execute("SELECT SUM(total_amount) FROM export_transactions WHERE created_at >= ?", (start_of_month,))
-    revenue = c.fetchone()[0] or 0
-    
-    # Expense (Imports)
-    c.execute("SELECT SUM(total_amount) FROM import_transactions WHERE created_at >= ?", (start_of_month,))
-    expense = c.fetchone()[0] or 0
+    # Revenue (Exports) and Expense (Imports) from daily_rollups
+    month_totals = db_manager.get_rollup_totals(today.strftime('%Y-%m-01'))
+    revenue = month_totals['revenue']
+    expense = month_totals['expense']
     
     profit = revenue - expense
     
@@ -2065,7 +2087,9 @@ def api_create_automation():
                      (name, type, config, created_by)
                      VALUES (?, ?, ?, ?)''',
                   (name, type, config, current_user.id))
+        automation_id = c.lastrowid
         conn.commit()
+        automation_engine.automation_changed(automation_id)
         return jsonify({'success': True, 'message': 'Automation created successfully'})
     except Exception as e:
         conn.rollback()
@@ -2108,6 +2132,7 @@ def api_update_automation(automation_id):
             c.execute('UPDATE se_automations SET config = ? WHERE id = ?', (config, automation_id))
 
         conn.commit()
+        automation_engine.automation_changed(automation_id)
         return jsonify({'success': True, 'message': 'Automation updated successfully'})
     except Exception as e:
         conn.rollback()
@@ -2124,6 +2149,7 @@ def api_delete_automation(automation_id):
     c.execute('DELETE FROM se_automations WHERE id = ?', (automation_id,))
     conn.commit()
     conn.close()
+    automation_engine.automation_removed(automation_id)
     return jsonify({'success': True, 'message': 'Automation deleted successfully'})
 
 # ============= SUBSCRIPTION MANAGEMENT API =============
@@ -2469,6 +2495,8 @@ def api_check_expired_subscriptions():
             demoted_count += 1
         
         conn.commit()
+        for (user_id,) in expired_users:
+            auth_manager.invalidate_user(user_id)
         return jsonify({
             'success': True, 
             'demoted_count': demoted_count,
@@ -2577,6 +2605,7 @@ def api_update_profile():
         c = conn.cursor()
         c.execute("UPDATE users SET name = ? WHERE id = ?", (name, current_user.id))
         conn.commit()
+        auth_manager.invalidate_user(current_user.id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -2780,6 +2809,7 @@ def api_upgrade_subscription():
                      VALUES (?, ?, 'VND', 'subscription', 'completed', 'wallet', ?, ?, ?)''', (current_user.id, -plan['amount'], txn_id, f'Upgrade {plan["name"]}', metadata))
 
         conn.commit()
+        auth_manager.invalidate_user(current_user.id)
 
         c.execute('SELECT balance FROM wallets WHERE user_id = ?', (current_user.id,))
         new_balance = c.fetchone()[0]
@@ -2961,6 +2991,7 @@ def google_authorize():
             c.execute("UPDATE users SET google_token = ?, google_email = ? WHERE id = ?", (token_json, email, current_user.id))
             conn.commit()
             conn.close()
+            auth_manager.invalidate_user(current_user.id)
             
             flash('Google account connected successfully!', 'success')
             # Redirect to builder if that's where they came from, or workspace
@@ -2996,6 +3027,7 @@ def google_authorize():
             c.execute("UPDATE users SET google_token = ?, google_email = ?, avatar = ? WHERE id = ?", 
                      (token_json, email, avatar_url, user_id))
             conn.commit()
+            auth_manager.invalidate_user(user_id)
         else:
             # User does not exist -> Automatically register new
             # Random password because Google login
@@ -3384,78 +3416,47 @@ def ai_upload():
 
 # AI Chat Integration
 # --- ASYNC AI WORKER ---
-# --- UPDATED AI WORKER WITH MEMORY ---
-# --- ROBUST FILE-BASED JOB SYSTEM ---
-JOBS_DIR = os.path.join(os.getcwd(), 'jobs')
-os.makedirs(JOBS_DIR, exist_ok=True)
+def background_ai_task(user_id, message):
+    """Runs on an ai_jobs worker; the returned dict becomes the job status."""
+    history_str = db_manager.get_ai_history(user_id, limit=6)
 
-# --- JOB HELPERS ---
-def save_job_file(job_id, data):
-     with open(os.path.join(JOBS_DIR, f"{job_id}.json"), 'w') as f: json.dump(data, f)
-def load_job_file(job_id):
-    try:
-        with open(os.path.join(JOBS_DIR, f"{job_id}.json"), 'r') as f: return json.load(f)
-    except: return None
+    with open('secrets/ai_config.json') as f:
+        conf = json.load(f)
+        url = conf.get('HF_BASE_URL').rstrip('/') + '/chat'
+        token = conf.get('HF_TOKEN')
+
+    mw = agent_middleware or AgentMiddleware(db_manager)
+    system_context = mw.get_system_context()
+    full_msg = f"[SYSTEM CONTEXT]\n{system_context}\n\n[CONVERSATION HISTORY]\n{history_str}\n\n[USER REQUEST]\n{message}"
+
+    headers = {"Content-Type": "application/json"}
+    if token: headers["Authorization"] = f"Bearer {token}"
+
+    res = requests.post(url, json={"user_id": user_id, "store_id": 1, "message": full_msg}, headers=headers, timeout=120)
+
+    if res.status_code != 200:
+        return {"status": "failed", "error": f"AI Error {res.status_code}"}
+
+    ai_text = res.json().get('response', '')
+
+    # Process Actions
+    final_text, action = mw.process_ai_response(ai_text, user_id)
+
+    # Save Clean Response to History
+    db_manager.add_ai_message(user_id, 'assistant', final_text)
+
+    return {"status": "completed", "response": final_text, "action": action}
+
+# Fixed worker pool instead of one thread per message; finished jobs expire after AI_JOB_TTL
+ai_jobs = JobQueue(
+    background_ai_task,
+    max_workers=Config.AI_JOB_WORKERS,
+    max_queue=Config.AI_JOB_QUEUE_SIZE,
+    ttl=Config.AI_JOB_TTL,
+    persist_path=Config.AI_JOB_DB_PATH if Config.AI_JOB_PERSIST else None,
+    name='AI Jobs',
+)
 
-def background_ai_task(job_id, user_id, message):
-    import json  # Explicitly import in thread context
-    import traceback
-    try:
-        save_job_file(job_id, {"status": "processing", "start_time": time.time()})
-    except Exception as e:
-        print(f"[ERROR] Failed to save initial job file: {e}\n{traceback.format_exc()}")
-    
-    try:
-        # Debug: Verify json module is available
-        print(f"[DEBUG] json module available: {json is not None}")
-        print(f"[DEBUG] json.dumps available: {hasattr(json, 'dumps')}")
-        
-        db = Database()
-        mw = AgentMiddleware(db)
-        history_str = db.get_ai_history(user_id, limit=6)
-        
-        with open('secrets/ai_config.json') as f:
-            conf = json.load(f)
-            url = conf.get('HF_BASE_URL').rstrip('/') + '/chat'
-            token = conf.get('HF_TOKEN')
-            
-        system_context = mw.get_system_context()
-        full_msg = f"[SYSTEM CONTEXT]\n{system_context}\n\n[CONVERSATION HISTORY]\n{history_str}\n\n[USER REQUEST]\n{message}"
-        
-        headers = {"Content-Type": "application/json"}
-        if token: headers["Authorization"] = f"Bearer {token}"
-        
-        res = requests.post(url, json={"user_id": user_id, "store_id": 1, "message": full_msg}, headers=headers, timeout=120)
-        
-        if res.status_code == 200:
-            ai_resp = res.json()
-            ai_text = ai_resp.get('response', '')
-            
-            # Process Actions
-            final_text, action = mw.process_ai_response(ai_text, user_id)
-            
-            # Save Clean Response to History
-            db.add_ai_message(user_id, 'assistant', final_text)
-            
-            save_job_file(job_id, {"status": "completed", "response": final_text, "action": action})
-        else:
-            save_job_file(job_id, {"status": "failed", "error": f"AI Error {res.status_code}"})
-            
-    except Exception as e:
-        import traceback
-        import sys
-        full_trace = traceback.format_exc()
-        exc_type, exc_value, exc_tb = sys.exc_info()
-        print(f"[CRITICAL] Bg Thread Error: {e}")
-        print(f"[CRITICAL] Error Type: {exc_type}")
-        print(f"[CRITICAL] Full Traceback:\n{full_trace}")
-        try:
-            save_job_file(job_id, {"status": "failed", "error": str(e), "error_type": str(exc_type), "traceback": full_trace})
-        except Exception as save_err:
-            print(f"[CRITICAL] Failed to save job file: {save_err}")
-            print(f"[CRITICAL] Trying alternate save...")
-            with open(os.path.join(JOBS_DIR, f"{job_id}.json"), 'w') as f:
-                f.write(f'{{"status":"failed","error":"{str(e)}","traceback":"{full_trace.replace(chr(34), chr(39))}"}}')
 # --- ROUTES ---
 
 
@@ -3476,10 +3477,13 @@ def ai_chat():
         db_manager.add_ai_message(current_user.id, 'assistant', reply)
         return jsonify({"status": "completed", "response": reply, "action": None})
 
-    job_id = str(uuid.uuid4())
-    save_job_file(job_id, {"status": "pending"})
-    threading.Thread(target=background_ai_task, args=(job_id, current_user.id, msg)).start()
-    return jsonify({"status": "processing", "job_id": job_id}) 
+    try:
+        job_id = ai_jobs.submit(current_user.id, msg, owner=current_user.id)
+    except QueueFull:
+        resp = jsonify({"status": "failed", "error": "AI assistant is busy, please retry shortly"})
+        resp.headers['Retry-After'] = '5'
+        return resp, 429
+    return jsonify({"status": "processing", "job_id": job_id})
 
 
 @app.route('/api/ai/history', methods=['GET'])
@@ -3500,8 +3504,9 @@ def get_chat_history():
 @app.route('/api/ai/status/<job_id>', methods=['GET'])
 @login_required
 def ai_job_status(job_id):
-    job = load_job_file(job_id)
-    if not job: return jsonify({"status": "failed", "error": "Job not found"}), 404
+    job = ai_jobs.get(job_id)
+    if not job or str(job.pop('owner', None)) != str(current_user.id):
+        return jsonify({"status": "failed", "error": "Job not found"}), 404
     return jsonify(job)
 
 @app.route('/api/ai/history', methods=['DELETE'])
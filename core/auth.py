@@ -1,11 +1,79 @@
+import copy
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import session, redirect, url_for, flash, request, jsonify
+from core.config import Config
 from core.google_integration import send_email
 
+class UserCache:
+    """TTL-bounded LRU cache of user rows keyed by user id (used by the Flask-Login user_loader)."""
+    def __init__(self, ttl=60, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()  # user_id -> (expires_at, user_dict)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id):
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return user_id
+
+    def get(self, user_id):
+        user_id = self._key(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry and entry[0] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._data[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, user):
+        user_id = self._key(user_id)
+        with self._lock:
+            self._data[user_id] = (time.monotonic() + self.ttl, copy.deepcopy(user))
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drop one user (or everyone when user_id is None)."""
+        with self._lock:
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(self._key(user_id), None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'invalidations': self.invalidations
+            }
+
 class AuthManager:
     def __init__(self, database):
         self.db = database
+        self.user_cache = UserCache(ttl=Config.USER_CACHE_TTL, max_size=Config.USER_CACHE_MAX_SIZE)
     
     @staticmethod
     def hash_password(password):
@@ -96,7 +164,12 @@ The Workflow Automation Team
         finally:
             conn.close()
     
-    def get_user_by_id(self, user_id):
+    def get_user_by_id(self, user_id, use_cache=True):
+        if use_cache:
+            cached = self.user_cache.get(user_id)
+            if cached is not None:
+                return cached
+
         conn = self.db.get_connection()
         try:
             c = conn.cursor()
@@ -104,7 +177,7 @@ The Workflow Automation Team
             user = c.fetchone()
             
             if user:
-                return {
+                user_data = {
                     'id': user[0],
                     'email': user[1], 
                     'first_name': user[2].split()[0] if user[2] else '',
@@ -113,6 +186,8 @@ The Workflow Automation Team
                     'role': user[4],
                     'google_token': user[5]
                 }
+                self.user_cache.set(user_id, user_data)
+                return user_data
             return None
         except Exception as e:
             print(f"Error getting user by id: {e}")
@@ -120,6 +195,10 @@ The Workflow Automation Team
         finally:
             conn.close()
     
+    def invalidate_user(self, user_id=None):
+        """Call after any write to the users table so the user_loader sees it."""
+        self.user_cache.invalidate(user_id)
+
     def get_user_workspaces(self, user_id):
         conn = self.db.get_connection()
         c = conn.cursor()
@@ -1,134 +1,278 @@
+import heapq
+import itertools
 import json
 import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .config import Config
+from .cron import CronError, parse_timestamp, schedule_from_config
 
 class AutomationEngine:
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.running = False
         self.thread = None
+        # Scheduled automations: heap of (fire_at timestamp, version, auto_id).
+        # Rescheduling bumps the version in _entries; stale heap items are skipped when popped.
+        self._heap = []
+        self._entries = {}  # auto_id -> {'version', 'fire_at', 'schedule', 'config'}
+        self._versions = itertools.count()
+        self._cond = threading.Condition()
+        # Low stock rules, rebuilt lazily after automation CRUD; checks run on one worker thread
+        self._low_stock_rules = None
+        self._rules_lock = threading.Lock()
+        self._low_stock_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='automation')
 
     def start(self):
         if self.running:
             return
         self.running = True
+        self.reload_schedule()
         self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.thread.start()
         print("[Automation] Engine started")
 
-    def _run_scheduler(self):
-        while self.running:
-            try:
-                self.check_scheduled_automations()
-            except Exception as e:
-                print(f"[Automation] Error in scheduler: {e}")
-            time.sleep(60)  # Check every minute
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
 
-    def check_scheduled_automations(self):
+    # --- Scheduled automations ---
+    def reload_schedule(self):
+        """Rebuild the timer heap from se_automations; runs missed since last_run fire once right away."""
         conn = self.db_manager.get_connection()
         c = conn.cursor()
         try:
-            # Get active scheduled automations
             c.execute("SELECT id, config, last_run FROM se_automations WHERE type = 'scheduled' AND enabled = 1")
             rows = c.fetchall()
-            
-            now = datetime.now()
-            current_weekday = now.strftime('%A').lower()
-            current_time = now.strftime('%H:%M')
-            
-            for row in rows:
-                auto_id = row[0]
-                config = json.loads(row[1]) if row[1] else {}
-                last_run = row[2]
-                
-                # Check if it should run
-                should_run = False
-                
-                freq = config.get('frequency', 'weekly')
-                target_time = config.get('time', '09:00')
-                target_day = config.get('day', 'monday').lower()
-                
-                # Simple check: if current time matches target time
-                # And if it hasn't run today (or recently)
-                
-                if current_time == target_time:
-                    if freq == 'daily':
-                        should_run = True
-                    elif freq == 'weekly' and current_weekday == target_day:
-                        should_run = True
-                    elif freq == 'monthly' and now.day == 1: # Simplified monthly
-                        should_run = True
-                
-                # Prevent double run in the same minute if loop is fast, 
-                # but we sleep 60s so it might be fine. 
-                # Better: check if last_run was today
-                if should_run and last_run:
-                    last_run_dt = datetime.strptime(last_run, '%Y-%m-%d %H:%M:%S')
-                    if last_run_dt.date() == now.date():
-                        should_run = False
-
-                if should_run:
-                    print(f"[Automation] Running scheduled automation {auto_id}")
-                    # For scheduled, we might need to check all products for low stock?
-                    # Or just create a placeholder import?
-                    # The UI implies "Automatically import on schedule".
-                    # Let's assume it checks for low stock products and orders them.
-                    self.execute_scheduled_import(auto_id, config)
-                    
-                    # Update last_run
-                    c.execute("UPDATE se_automations SET last_run = ? WHERE id = ?", 
-                              (now.strftime('%Y-%m-%d %H:%M:%S'), auto_id))
-                    conn.commit()
-                    
         except Exception as e:
-            print(f"[Automation] Error checking scheduled: {e}")
+            print(f"[Automation] Error loading scheduled automations: {e}")
+            rows = []
         finally:
             conn.close()
 
-    def check_low_stock(self, product_id, current_stock):
-        """Called when stock changes"""
+        with self._cond:
+            self._heap = []
+            self._entries = {}
+            for auto_id, config, last_run in rows:
+                self._schedule(auto_id, config, last_run, catch_up=True)
+            self._cond.notify()
+        print(f"[Automation] {len(self._entries)} scheduled automations loaded")
+
+    def schedule_automation(self, auto_id):
+        """Re-read one automation after it is created or updated; drops it if no longer an enabled scheduled one."""
         conn = self.db_manager.get_connection()
         c = conn.cursor()
         try:
-            # Get active low_stock automations
-            c.execute("SELECT id, config FROM se_automations WHERE type = 'low_stock' AND enabled = 1")
-            rows = c.fetchall()
-            
-            for row in rows:
-                auto_id = row[0]
-                config = json.loads(row[1]) if row[1] else {}
-                
+            c.execute("SELECT id, config, last_run FROM se_automations WHERE id = ? AND type = 'scheduled' AND enabled = 1",
+                      (auto_id,))
+            row = c.fetchone()
+        finally:
+            conn.close()
+
+        with self._cond:
+            if row:
+                self._schedule(row[0], row[1], row[2], catch_up=False)
+            else:
+                self._entries.pop(auto_id, None)
+            self._cond.notify()
+
+    def unschedule_automation(self, auto_id):
+        with self._cond:
+            self._entries.pop(auto_id, None)
+            self._cond.notify()
+
+    def next_runs(self):
+        """auto_id -> next fire time, for status displays"""
+        with self._cond:
+            return {auto_id: entry['fire_at'] for auto_id, entry in self._entries.items()}
+
+    def _schedule(self, auto_id, config, last_run, catch_up):
+        # Caller holds self._cond
+        try:
+            config = json.loads(config) if config else {}
+            schedule = schedule_from_config(config)
+        except (CronError, ValueError, TypeError, AttributeError) as e:
+            print(f"[Automation] Invalid schedule for automation {auto_id}: {e}")
+            self._entries.pop(auto_id, None)
+            return
+
+        now = datetime.now()
+        fire_at = schedule.next_after(now)
+        if catch_up:
+            last_run_dt = parse_timestamp(last_run)
+            if last_run_dt:
+                missed = schedule.next_after(last_run_dt)
+                if missed <= now and now - missed <= timedelta(seconds=Config.AUTOMATION_CATCHUP_WINDOW):
+                    print(f"[Automation] Catching up automation {auto_id} missed at {missed}")
+                    fire_at = now
+        self._push(auto_id, fire_at, schedule, config)
+
+    def _push(self, auto_id, fire_at, schedule, config):
+        version = next(self._versions)
+        self._entries[auto_id] = {'version': version, 'fire_at': fire_at, 'schedule': schedule, 'config': config}
+        heapq.heappush(self._heap, (fire_at.timestamp(), version, auto_id))
+
+    def _pop_due(self):
+        """(auto_id, config) of the next due automation, or None; caller holds self._cond"""
+        while self._heap:
+            fire_ts, version, auto_id = self._heap[0]
+            entry = self._entries.get(auto_id)
+            if entry is None or entry['version'] != version:
+                heapq.heappop(self._heap)  # stale: rescheduled or removed
+                continue
+            if fire_ts > time.time():
+                return None
+            heapq.heappop(self._heap)
+            # Queue the following run before executing, so an edit made meanwhile replaces it
+            after = max(entry['fire_at'], datetime.now())
+            self._push(auto_id, entry['schedule'].next_after(after), entry['schedule'], entry['config'])
+            return auto_id, entry['config']
+        return None
+
+    def _run_scheduler(self):
+        while self.running:
+            with self._cond:
+                due = self._pop_due()
+                if due is None:
+                    # Wake for the next timer; the 60s cap resyncs with wall-clock changes
+                    timeout = self._heap[0][0] - time.time() if self._heap else 60
+                    self._cond.wait(max(0, min(timeout, 60)))
+                    continue
+            try:
+                self.run_scheduled_automation(*due)
+            except Exception as e:
+                print(f"[Automation] Error in scheduler: {e}")
+
+    def run_scheduled_automation(self, auto_id, config):
+        print(f"[Automation] Running scheduled automation {auto_id}")
+        # Scheduled automations restock every low stock product
+        self.execute_scheduled_import(auto_id, config)
+
+        conn = self.db_manager.get_connection()
+        c = conn.cursor()
+        try:
+            c.execute("UPDATE se_automations SET last_run = ? WHERE id = ?",
+                      (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), auto_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # --- Low stock automations ---
+    def automation_changed(self, auto_id):
+        """Called after an automation is created or updated"""
+        self.schedule_automation(auto_id)
+        self.invalidate_low_stock_rules()
+
+    def automation_removed(self, auto_id):
+        self.unschedule_automation(auto_id)
+        self.invalidate_low_stock_rules()
+
+    def invalidate_low_stock_rules(self):
+        with self._rules_lock:
+            self._low_stock_rules = None
+
+    def _get_low_stock_rules(self):
+        """
+        Enabled low_stock automations indexed by scope, built on first use after a change:
+        {'all': [rule], 'product': {product_id: [rule]}, 'category': {category: [rule]}}
+        where rule is (auto_id, threshold, config)
+        """
+        with self._rules_lock:
+            if self._low_stock_rules is not None:
+                return self._low_stock_rules
+
+            conn = self.db_manager.get_connection()
+            c = conn.cursor()
+            try:
+                c.execute("SELECT id, config FROM se_automations WHERE type = 'low_stock' AND enabled = 1")
+                rows = c.fetchall()
+            finally:
+                conn.close()
+
+            rules = {'all': [], 'product': {}, 'category': {}}
+            for auto_id, config in rows:
+                try:
+                    config = json.loads(config) if config else {}
+                    rule = (auto_id, int(config.get('threshold', 10)), config)
+                except (ValueError, TypeError) as e:
+                    print(f"[Automation] Skipping low stock automation {auto_id}: {e}")
+                    continue
                 scope = config.get('product_id', 'all')
-                threshold = int(config.get('threshold', 10))
-                
-                should_trigger = False
                 if scope == 'all':
-                    if current_stock < threshold:
-                        should_trigger = True
+                    rules['all'].append(rule)
                 elif scope == 'category':
-                    # Need to check category, but for now skip
-                    pass
-                elif str(scope) == str(product_id):
-                    if current_stock < threshold:
-                        should_trigger = True
-                
-                if should_trigger:
-                    print(f"[Automation] Triggering low stock automation {auto_id} for product {product_id}")
-                    self.execute_import_automation(auto_id, config, product_id)
-                    
-                    # Update last_run
-                    c.execute("UPDATE se_automations SET last_run = ? WHERE id = ?", 
-                              (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), auto_id))
-                    conn.commit()
-                    
+                    category = str(config.get('category') or '').strip().lower()
+                    if category:
+                        rules['category'].setdefault(category, []).append(rule)
+                else:
+                    rules['product'].setdefault(str(scope), []).append(rule)
+            self._low_stock_rules = rules
+            return rules
+
+    def check_low_stock(self, product_id, current_stock):
+        """Called when stock changes"""
+        self.check_low_stock_many([(product_id, current_stock)])
+
+    def queue_low_stock_check(self, updated_products):
+        """Run check_low_stock_many on the automation worker instead of the request thread"""
+        return self._low_stock_executor.submit(self._safe_check_low_stock_many, list(updated_products))
+
+    def _safe_check_low_stock_many(self, updated_products):
+        try:
+            self.check_low_stock_many(updated_products)
         except Exception as e:
             print(f"[Automation] Error checking low stock: {e}")
-        finally:
-            conn.close()
+
+    def check_low_stock_many(self, updated_products):
+        """Evaluate low stock automations for [(product_id, new_stock), ...] in one pass"""
+        rules = self._get_low_stock_rules()
+        if not (rules['all'] or rules['product'] or rules['category']):
+            return
+
+        categories = {}
+        if rules['category']:
+            product_ids = [pid for pid, _ in updated_products]
+            conn = self.db_manager.get_connection()
+            c = conn.cursor()
+            try:
+                placeholders = ','.join('?' * len(product_ids))
+                c.execute(f"SELECT id, category FROM products WHERE id IN ({placeholders})", product_ids)
+                categories = {str(row[0]): str(row[1] or '').strip().lower() for row in c.fetchall()}
+            finally:
+                conn.close()
+
+        triggered = set()
+        for product_id, current_stock in updated_products:
+            candidates = rules['all'] + rules['product'].get(str(product_id), [])
+            category = categories.get(str(product_id))
+            if category:
+                candidates += rules['category'].get(category, [])
+            for auto_id, threshold, config in candidates:
+                if current_stock < threshold:
+                    print(f"[Automation] Triggering low stock automation {auto_id} for product {product_id}")
+                    self.execute_import_automation(auto_id, config, product_id)
+                    triggered.add(auto_id)
+
+        if triggered:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            conn = self.db_manager.get_connection()
+            c = conn.cursor()
+            try:
+                c.executemany("UPDATE se_automations SET last_run = ? WHERE id = ?",
+                              [(now, auto_id) for auto_id in triggered])
+                conn.commit()
+            except Exception as e:
+                print(f"[Automation] Error checking low stock: {e}")
+                conn.rollback()
+            finally:
+                conn.close()
 
     def execute_import_automation(self, auto_id, config, product_id):
         # Create an import transaction
+        self.db_manager.ensure_rollups_schema()
         conn = self.db_manager.get_connection()
         c = conn.cursor()
         try:
@@ -152,6 +296,7 @@ class AutomationEngine:
                             VALUES (?, ?, ?, ?, ?, ?)''',
                         (code, supplier_id, total_price, 'pending', f'Auto-generated by automation #{auto_id}', 1)) # 1 is usually admin
             import_id = c.lastrowid
+            self.db_manager.record_rollup(c, 'import', total_price)
             
             c.execute('''INSERT INTO import_details 
                             (import_id, product_id, quantity, unit_price, total_price)
@@ -171,6 +316,7 @@ class AutomationEngine:
         # For scheduled import, maybe we check all products below a certain threshold?
         # Or just create a dummy import?
         # Let's implement a "Restock all low stock items" logic for scheduled import
+        self.db_manager.ensure_rollups_schema()
         conn = self.db_manager.get_connection()
         c = conn.cursor()
         try:
@@ -204,6 +350,7 @@ class AutomationEngine:
                             VALUES (?, ?, ?, ?, ?, ?)''',
                         (code, supplier_id, total_amount, 'pending', f'Scheduled Import #{auto_id}', 1))
             import_id = c.lastrowid
+            self.db_manager.record_rollup(c, 'import', total_amount)
             
             for item in items:
                 c.execute('''INSERT INTO import_details 
@@ -24,6 +24,36 @@ class Config:
                 USE_POSTGRES = True
     except FileNotFoundError:
         pass # Fallback to SQLite
+
+    # Connection pool (see core/db_pool.py)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_PING_INTERVAL = float(os.environ.get('DB_POOL_PING_INTERVAL', 10))
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+
+    # User cache for the Flask-Login user_loader (see core/auth.py)
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 1024))
+
+    # Workflow DAG execution (see core/workflow_engine.py)
+    WORKFLOW_MAX_CONCURRENCY = int(os.environ.get('WORKFLOW_MAX_CONCURRENCY', 4))  # per workflow run
+    WORKFLOW_IO_WORKERS = int(os.environ.get('WORKFLOW_IO_WORKERS', 16))  # shared across runs
+    WORKFLOW_BATCH_SHEET_WRITES = os.environ.get('WORKFLOW_BATCH_SHEET_WRITES', '1') == '1'  # coalesce google_sheet_write nodes per run
+
+    # AI chat job queue (see core/job_queue.py)
+    AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 4))
+    AI_JOB_QUEUE_SIZE = int(os.environ.get('AI_JOB_QUEUE_SIZE', 64))  # waiting jobs before /api/ai/chat returns 429
+    AI_JOB_TTL = float(os.environ.get('AI_JOB_TTL', 3600))  # seconds a finished job can still be polled
+    AI_JOB_PERSIST = os.environ.get('AI_JOB_PERSIST', '0') == '1'
+    AI_JOB_DB_PATH = os.environ.get('AI_JOB_DB_PATH', 'ai_jobs.db')
+
+    # POS product search (see core/product_search.py)
+    PRODUCT_SEARCH_RELOAD_CHECK = float(os.environ.get('PRODUCT_SEARCH_RELOAD_CHECK', 5))  # seconds between catalog mtime checks
+
+    # Scheduled automations (see core/automation_engine.py)
+    AUTOMATION_CATCHUP_WINDOW = float(os.environ.get('AUTOMATION_CATCHUP_WINDOW', 24 * 3600))  # seconds; older missed runs are skipped
+    # Run the scheduler thread in this process (opt-in); enable it in exactly one worker when running several
+    AUTOMATION_SCHEDULER_ENABLED = os.environ.get('AUTOMATION_SCHEDULER_ENABLED', 'False').lower() == 'true'
     
     # Site domain and base URL (override with env vars)
     SITE_DOMAIN = os.environ.get('SITE_DOMAIN', 'auto-flowai.com')
@@ -58,6 +88,11 @@ class Config:
         'projects'
     ]
 
+    # Google API client cache (see core/google_integration.py)
+    GOOGLE_SERVICE_CACHE_SIZE = int(os.environ.get('GOOGLE_SERVICE_CACHE_SIZE', 64))
+    GOOGLE_TOKEN_REFRESH_MARGIN = float(os.environ.get('GOOGLE_TOKEN_REFRESH_MARGIN', 300))  # seconds before expiry
+    SHEET_TITLES_TTL = float(os.environ.get('SHEET_TITLES_TTL', 600))  # seconds
+
     # --- Google Analytics & OAuth ---
     # Numeric Google Analytics Property ID (replace with your property id or set env var `GA_PROPERTY_ID`)
     GA_PROPERTY_ID = os.environ.get('GA_PROPERTY_ID', '517047582')
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+_MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+_DAY_NAMES = {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+
+# (low, high, names) for minute, hour, day of month, month, day of week
+_FIELDS = [
+    (0, 59, {}),
+    (0, 23, {}),
+    (1, 31, {}),
+    (1, 12, _MONTH_NAMES),
+    (0, 7, _DAY_NAMES),  # 0 and 7 are both Sunday
+]
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_value(token, low, high, names):
+    token = token.lower()
+    if token[:3] in names:
+        value = names[token[:3]]
+    else:
+        try:
+            value = int(token)
+        except ValueError:
+            raise CronError(f"Invalid value '{token}'")
+    if not low <= value <= high:
+        raise CronError(f"Value {value} out of range {low}-{high}")
+    return value
+
+
+def _parse_field(field, low, high, names):
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_str = part.split('/', 1)
+            if not step_str.isdigit() or int(step_str) == 0:
+                raise CronError(f"Invalid step '{step_str}'")
+            step = int(step_str)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (_parse_value(p, low, high, names) for p in part.split('-', 1))
+        else:
+            start = _parse_value(part, low, high, names)
+            end = high if step > 1 else start
+        if start > end:
+            raise CronError(f"Invalid range '{part}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """
+    Standard 5-field cron expression: minute hour day-of-month month day-of-week
+
+    Supports *, lists (1,15), ranges (1-5), steps (*/10, 8-18/2) and
+    month/day names (jan, mon). As in cron, when both day fields are
+    restricted a day matches if either one does.
+    """
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise CronError(f"Expected 5 fields, got {len(fields)}: '{expr}'")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, *spec) for field, spec in zip(fields, _FIELDS))
+        # cron counts Sunday as 0; datetime.weekday() counts Monday as 0
+        self.weekdays = {(d - 1) % 7 for d in weekdays}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        in_month = dt.day in self.days
+        in_week = dt.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, after):
+        """First matching datetime strictly after `after` (naive, second precision dropped)"""
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise CronError(f"'{self.expr}' never fires")
+
+    def __repr__(self):
+        return f"CronExpression('{self.expr}')"
+
+
+def schedule_from_config(config):
+    """
+    CronExpression for a scheduled automation's config
+
+    Uses config['cron'] when present, otherwise the UI fields
+    frequency (daily|weekly|monthly), time ('HH:MM') and day ('monday').
+    """
+    if config.get('cron'):
+        return CronExpression(config['cron'])
+
+    try:
+        hour, minute = (int(p) for p in str(config.get('time') or '09:00').split(':')[:2])
+    except ValueError:
+        raise CronError(f"Invalid time '{config.get('time')}'")
+    freq = config.get('frequency', 'weekly')
+    if freq == 'daily':
+        return CronExpression(f"{minute} {hour} * * *")
+    if freq == 'monthly':
+        return CronExpression(f"{minute} {hour} 1 * *")
+    day = str(config.get('day') or 'monday').lower()[:3]
+    return CronExpression(f"{minute} {hour} * * {day}")
+
+
+def parse_timestamp(value):
+    """last_run column value (str from SQLite, datetime from Postgres) -> datetime or None"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
@@ -1,8 +1,11 @@
 import sqlite3
 import hashlib
+import json
 import re
+import threading
 from datetime import datetime
 from .config import Config
+from .db_pool import ConnectionPool, PooledConnection
 
 # Compatibility shim
 try:
@@ -54,14 +57,81 @@ class PGShimCursor:
     def close(self): self._cursor.close()
     def __getattr__(self, name): return getattr(self._cursor, name)
 
-class PGShimConnection:
-    def __init__(self, conn):
-        self._conn = conn
+class PGShimConnection(PooledConnection):
+    def __init__(self, conn, pool=None):
+        super().__init__(conn, pool)
         self.row_factory = None
     def cursor(self): return PGShimCursor(self._conn.cursor())
-    def commit(self): self._conn.commit()
-    def rollback(self): self._conn.rollback()
-    def close(self): self._conn.close()
+
+class SQLitePooledConnection(PooledConnection):
+    """Pooled sqlite3 connection; row_factory is forwarded to the real connection."""
+    @property
+    def row_factory(self): return self._conn.row_factory
+    @row_factory.setter
+    def row_factory(self, value): self._conn.row_factory = value
+
+# --- Connection pools (one per database target, shared by all Database instances) ---
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def _ping(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute('SELECT 1')
+        cur.fetchone()
+    finally:
+        cur.close()
+
+def _reset_pg(conn):
+    # Clears an open or aborted transaction so the next borrower starts clean
+    conn.rollback()
+
+def _reset_sqlite(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    conn.row_factory = None
+
+def get_pool(use_postgres, db_path=None):
+    key = ('postgres', Config.POSTGRES_URL) if use_postgres else ('sqlite', db_path)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            if use_postgres:
+                import psycopg2
+                connect = lambda: psycopg2.connect(Config.POSTGRES_URL)
+                reset = _reset_pg
+            else:
+                # Connections move between request threads, one borrower at a time
+                connect = lambda: sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+                reset = _reset_sqlite
+            pool = ConnectionPool(
+                connect, ping=_ping, reset=reset,
+                max_size=Config.DB_POOL_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                ping_interval=Config.DB_POOL_PING_INTERVAL,
+                max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+                name=key[0],
+            )
+            _POOLS[key] = pool
+        return pool
+
+def sale_item_counts(items):
+    """(line items, total quantity) for a sale's items list or its JSON text."""
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except ValueError:
+            return 0, 0
+    if not isinstance(items, list):
+        return 0, 0
+    lines = [item for item in items if isinstance(item, dict)]
+    total_qty = 0
+    for item in lines:
+        try:
+            total_qty += int(item.get('qty', 0))
+        except (TypeError, ValueError):
+            pass
+    return len(lines), total_qty
 
 class Database:
     def __init__(self):
@@ -93,17 +163,251 @@ class Database:
                 except: pass
 
     def get_connection(self):
+        """Borrow a pooled connection; conn.close() returns it to the pool."""
+        pool = get_pool(self.use_postgres, self.db_path)
         if self.use_postgres:
-            import psycopg2
-            conn = psycopg2.connect(Config.POSTGRES_URL)
-            return PGShimConnection(conn)
-        else:
-            return sqlite3.connect(self.db_path, timeout=30.0)
+            return pool.connection(PGShimConnection)
+        return pool.connection(SQLitePooledConnection)
+
+    def pool_stats(self):
+        """Size, checkout and wait-time counters for this database's pool."""
+        return get_pool(self.use_postgres, self.db_path).stats()
     
     def init_database(self):
         # ... (Keep existing SQLite init logic if needed, omitted for brevity) ...
         pass
 
+    # --- SALES ---
+    _sales_schema_ready = False
+    _schema_lock = threading.Lock()
+
+    def ensure_sales_schema(self):
+        """
+        Adds the denormalized item_count / total_qty columns and the
+        (user_id, created_at, id) index used by sales history paging.
+        Runs once per process. Existing rows keep NULL counts (readers compute
+        them from items) until scripts/backfill_sales_item_counts.py fills them.
+        """
+        if Database._sales_schema_ready:
+            return
+        with Database._schema_lock:
+            if Database._sales_schema_ready:
+                return
+            conn = self.get_connection()
+            c = conn.cursor()
+            try:
+                columns = self.get_table_columns('sales', cursor=c)
+                for column in ('item_count', 'total_qty'):
+                    if column not in columns:
+                        c.execute(f'ALTER TABLE sales ADD COLUMN {column} INTEGER')
+                c.execute('CREATE INDEX IF NOT EXISTS idx_sales_user_created ON sales (user_id, created_at, id)')
+                conn.commit()
+                Database._sales_schema_ready = True
+            except Exception as e:
+                print(f"[DB] Sales schema migration failed: {e}")
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def backfill_sale_item_counts(self, batch_size=1000):
+        """Fills item_count / total_qty for sales recorded before those columns existed."""
+        self.ensure_sales_schema()
+        conn = self.get_connection()
+        c = conn.cursor()
+        backfilled = 0
+        try:
+            while True:
+                c.execute('SELECT id, items FROM sales WHERE total_qty IS NULL LIMIT ?', (batch_size,))
+                rows = c.fetchall()
+                if not rows:
+                    break
+                # Committed per batch so the write lock is only held briefly
+                c.executemany('UPDATE sales SET item_count = ?, total_qty = ? WHERE id = ?',
+                              [(*sale_item_counts(items), sale_id) for sale_id, items in rows])
+                conn.commit()
+                backfilled += len(rows)
+            return backfilled
+        except Exception as e:
+            print(f"[DB] Sales item count backfill failed: {e}")
+            conn.rollback()
+            return backfilled
+        finally:
+            conn.close()
+
+    # --- DAILY ROLLUPS ---
+    # Per-day totals kept in step with export/import/sale inserts so dashboard
+    # stats read O(days) rows instead of scanning the transaction tables.
+    # kind -> (amount column, count column, source table)
+    ROLLUP_KINDS = {
+        'export': ('revenue', 'orders', 'export_transactions'),
+        'import': ('expense', 'imports', 'import_transactions'),
+        'sale': ('sales_revenue', 'sales_count', 'sales'),
+    }
+    _rollups_ready = False
+    _rollups_filled = False
+
+    def ensure_rollups_schema(self):
+        """
+        Creates daily_rollups (and its daily_rollups_state marker table) on
+        first use. The table starts empty: inserts record their deltas from
+        here on, and scripts/backfill_daily_rollups.py fills in history.
+        Until that has run, get_rollup_totals sums the transaction tables.
+        """
+        if Database._rollups_ready:
+            return
+        with Database._schema_lock:
+            if Database._rollups_ready:
+                return
+            conn = self.get_connection()
+            c = conn.cursor()
+            try:
+                id_column = 'id SERIAL PRIMARY KEY' if self.use_postgres else 'id INTEGER PRIMARY KEY'
+                c.execute(f'''CREATE TABLE IF NOT EXISTS daily_rollups (
+                                {id_column},
+                                day TEXT NOT NULL UNIQUE,
+                                revenue REAL DEFAULT 0, orders INTEGER DEFAULT 0,
+                                expense REAL DEFAULT 0, imports INTEGER DEFAULT 0,
+                                sales_revenue REAL DEFAULT 0, sales_count INTEGER DEFAULT 0)''')
+                # One row, written by _refill_daily_rollups, once history is in daily_rollups
+                c.execute(f'CREATE TABLE IF NOT EXISTS daily_rollups_state ({id_column}, filled_at TEXT)')
+                conn.commit()
+                Database._rollups_ready = True
+            except Exception as e:
+                print(f"[DB] daily_rollups setup failed: {e}")
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def record_rollup(self, cursor, kind, amount, count=1, day=None):
+        """
+        Adds a transaction to its day's rollup using the caller's cursor, so it
+        commits (or rolls back) together with the transaction itself.
+        day defaults to the database's CURRENT_DATE, the clock created_at uses.
+        """
+        amount_col, count_col, _ = self.ROLLUP_KINDS[kind]
+        day_sql = '?' if day else 'CAST(CURRENT_DATE AS TEXT)'
+        params = ((day,) if day else ()) + (float(amount or 0), count)
+        cursor.execute(f'''INSERT INTO daily_rollups (day, {amount_col}, {count_col}) VALUES ({day_sql}, ?, ?)
+                           ON CONFLICT (day) DO UPDATE SET
+                               {amount_col} = daily_rollups.{amount_col} + excluded.{amount_col},
+                               {count_col} = daily_rollups.{count_col} + excluded.{count_col}''', params)
+
+    def rollups_filled(self):
+        """Whether daily_rollups holds full history (see scripts/backfill_daily_rollups.py)."""
+        if Database._rollups_filled:
+            return True
+        self.ensure_rollups_schema()
+        conn = self.get_connection()
+        c = conn.cursor()
+        try:
+            c.execute('SELECT COUNT(*) FROM daily_rollups_state')
+            row = c.fetchone()
+            Database._rollups_filled = bool(row and row[0])
+            return Database._rollups_filled
+        except Exception as e:
+            print(f"[DB] daily_rollups state check failed: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def rebuild_daily_rollups(self):
+        """Recomputes every day from export_transactions, import_transactions and sales."""
+        self.ensure_rollups_schema()
+        conn = self.get_connection()
+        c = conn.cursor()
+        try:
+            days = self._refill_daily_rollups(c)
+            conn.commit()
+            print(f"[DB] Rebuilt daily_rollups: {days} days")
+            return days
+        except Exception as e:
+            print(f"[DB] Rollup rebuild failed: {e}")
+            conn.rollback()
+            return 0
+        finally:
+            conn.close()
+
+    def _refill_daily_rollups(self, c):
+        """
+        Replaces daily_rollups with fresh totals inside the caller's transaction.
+
+        The write lock is taken before counting (SQLite: BEGIN IMMEDIATE,
+        Postgres: EXCLUSIVE lock on daily_rollups), so a concurrent insert plus
+        record_rollup commits either before the count, and is counted, or after
+        the refill, and adds its delta on top; never in between.
+        """
+        if self.use_postgres:
+            c.execute('LOCK TABLE daily_rollups IN EXCLUSIVE MODE')
+        elif not c.connection.in_transaction:
+            c.execute('BEGIN IMMEDIATE')
+
+        days = {}
+        for kind, (amount_col, count_col, table) in self.ROLLUP_KINDS.items():
+            # A failed query would abort the transaction (and drop the lock) on Postgres
+            if not self.get_table_columns(table, cursor=c):
+                print(f"[DB] Skipping {table} in rollup rebuild: table not found")
+                continue
+            c.execute(f'''SELECT SUBSTR(CAST(created_at AS TEXT), 1, 10) AS day,
+                                SUM(total_amount), COUNT(*)
+                         FROM {table} GROUP BY SUBSTR(CAST(created_at AS TEXT), 1, 10)''')
+            for day, amount, count in c.fetchall():
+                if day:
+                    days.setdefault(day, {})[amount_col] = float(amount or 0)
+                    days[day][count_col] = count
+
+        c.execute('DELETE FROM daily_rollups')
+        columns = [col for kind in self.ROLLUP_KINDS.values() for col in kind[:2]]
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        for day, totals in sorted(days.items()):
+            c.execute(f"INSERT INTO daily_rollups (day, {', '.join(columns)}) VALUES ({placeholders})",
+                      (day, *(totals.get(col, 0) for col in columns)))
+        c.execute('DELETE FROM daily_rollups_state')
+        c.execute('INSERT INTO daily_rollups_state (filled_at) VALUES (?)',
+                  (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        return len(days)
+
+    def get_rollup_totals(self, start_day, end_day=None):
+        """Summed rollup columns for start_day..end_day inclusive ('YYYY-MM-DD')."""
+        if not self.rollups_filled():
+            return self._direct_totals(start_day, end_day)
+        columns = [col for kind in self.ROLLUP_KINDS.values() for col in kind[:2]]
+        query = f"SELECT {', '.join(f'SUM({col})' for col in columns)} FROM daily_rollups WHERE day >= ?"
+        params = [start_day]
+        if end_day:
+            query += " AND day <= ?"
+            params.append(end_day)
+        conn = self.get_connection()
+        c = conn.cursor()
+        try:
+            c.execute(query, tuple(params))
+            row = c.fetchone() or ()
+            return {col: (row[i] if i < len(row) and row[i] is not None else 0) for i, col in enumerate(columns)}
+        finally:
+            conn.close()
+
+    def _direct_totals(self, start_day, end_day=None):
+        """get_rollup_totals computed from the transaction tables, for before daily_rollups is filled."""
+        totals = {}
+        conn = self.get_connection()
+        c = conn.cursor()
+        try:
+            for amount_col, count_col, table in self.ROLLUP_KINDS.values():
+                totals[amount_col] = totals[count_col] = 0
+                if not self.get_table_columns(table, cursor=c):
+                    continue
+                query = f"SELECT SUM(total_amount), COUNT(*) FROM {table} WHERE created_at >= ?"
+                params = [start_day]
+                if end_day:
+                    query += " AND SUBSTR(CAST(created_at AS TEXT), 1, 10) <= ?"
+                    params.append(end_day)
+                c.execute(query, tuple(params))
+                row = c.fetchone() or (0, 0)
+                totals[amount_col] = row[0] or 0
+                totals[count_col] = row[1] or 0
+            return totals
+        finally:
+            conn.close()
+
     # --- USER & CORE METHODS (Keep your existing ones) ---
     def get_user_by_id(self, user_id):
         conn = self.get_connection()
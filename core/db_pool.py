@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PooledConnection:
+    """
+    Proxy around a DB-API connection borrowed from a ConnectionPool.
+
+    close() hands the connection back to the pool instead of closing it, so
+    existing `conn = db.get_connection() ... conn.close()` call sites keep
+    working unchanged. Used as a context manager it commits (or rolls back
+    on error) and then returns the connection.
+    """
+
+    def __init__(self, conn, pool=None):
+        self._conn = conn
+        self._pool = pool
+        self._released = False
+
+    def cursor(self): return self._conn.cursor()
+    def commit(self): self._conn.commit()
+    def rollback(self): self._conn.rollback()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        if self._pool is not None:
+            self._pool.checkin(self._conn)
+        else:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        # Safety net for routes that return before reaching conn.close()
+        try:
+            if not getattr(self, '_released', True):
+                self.close()
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    - connect: zero-arg factory that opens a new raw connection
+    - ping: callable(conn) that raises if the connection is unusable;
+      run on borrow when the connection has been idle for ping_interval seconds
+    - reset: callable(conn) run on checkin to clear per-request state
+    - max_size: hard cap on open connections (idle + in use)
+    - timeout: seconds a checkout waits for a free slot before PoolTimeout
+    - max_lifetime: connections older than this are closed and replaced
+    """
+
+    def __init__(self, connect, ping=None, reset=None, max_size=10, timeout=30.0,
+                 ping_interval=10.0, max_lifetime=1800.0, name='db'):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.max_lifetime = max_lifetime
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # (conn, created_at, last_used), most recent on the right
+        self._born = {}       # id(conn) -> created_at for checked-out connections
+        self._size = 0
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connects': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+        }
+
+    def checkout(self, timeout=None):
+        """Borrow a raw connection, opening a new one if under max_size."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            entry = None
+            open_new = False
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"[{self.name}] no connection available after {timeout:.1f}s "
+                            f"(max_size={self.max_size})")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+                    open_new = True
+
+            if open_new:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                now = time.monotonic()
+                with self._cond:
+                    self._stats['connects'] += 1
+                    self._born[id(conn)] = now
+                return self._record_checkout(conn, start, waited)
+
+            conn, created_at, last_used = entry
+            if self._healthy(conn, created_at, last_used):
+                with self._cond:
+                    self._born[id(conn)] = created_at
+                return self._record_checkout(conn, start, waited)
+            # Stale or broken: drop it and loop to get another one
+            self._discard(conn)
+
+    def checkin(self, conn):
+        """Return a connection to the pool; broken connections are discarded."""
+        with self._cond:
+            created_at = self._born.pop(id(conn), None)
+        if created_at is None:
+            # Not ours (or already returned)
+            return
+        try:
+            if self._reset:
+                self._reset(conn)
+        except Exception:
+            self._discard(conn)
+            return
+        if self.max_lifetime and time.monotonic() - created_at > self.max_lifetime:
+            with self._cond:
+                self._stats['recycled'] += 1
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def connection(self, wrapper=PooledConnection, timeout=None):
+        """Checkout wrapped in a proxy whose close() returns it to this pool."""
+        return wrapper(self.checkout(timeout), self)
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                'name': self.name,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        s['wait_time_avg_ms'] = round(s['wait_time_total'] / s['waits'] * 1000, 2) if s['waits'] else 0.0
+        s['wait_time_max_ms'] = round(s.pop('wait_time_max') * 1000, 2)
+        s['wait_time_total_ms'] = round(s.pop('wait_time_total') * 1000, 2)
+        return s
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones are unaffected."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            try: conn.close()
+            except Exception: pass
+
+    # --- internals ---
+    def _healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            with self._cond:
+                self._stats['recycled'] += 1
+            return False
+        if getattr(conn, 'closed', 0):
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+        if self._ping and now - last_used >= self.ping_interval:
+            try:
+                self._ping(conn)
+            except Exception:
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def _record_checkout(self, conn, start, waited):
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += elapsed
+                if elapsed > self._stats['wait_time_max']:
+                    self._stats['wait_time_max'] = elapsed
+        return conn
+
+    def _discard(self, conn):
+        try: conn.close()
+        except Exception: pass
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
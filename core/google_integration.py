@@ -1,7 +1,12 @@
 import time
 import os.path
 import json
-from datetime import datetime, timezone
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from .config import Config
 
 # --- Google API Setup (Placeholder/Real) ---
 # In a real environment, you would install:
@@ -30,20 +35,131 @@ CREDENTIALS_FILE = os.path.join(BASE_DIR, 'secrets', 'google_oauth.json')
 TOKEN_FILE = os.path.join(BASE_DIR, 'secrets', 'token.json')
 ADMIN_TOKEN_FILE = os.path.join(BASE_DIR, 'secrets', 'token adminmail.json')
 
+# --- Service client cache ---
+# Built clients keyed by (credential fingerprint, service, version), LRU-evicted.
+# Each entry keeps its Credentials object so the token can be refreshed in place.
+_service_cache = OrderedDict()
+_service_cache_lock = threading.Lock()
+_service_cache_stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'evictions': 0}
+
+
+def _credential_fingerprint(token_info=None, token_path=None):
+    """Stable cache key for the credential source a client is built from, or None if it can't be identified."""
+    if token_info:
+        # The refresh token survives access-token refreshes, so prefer it
+        secret = token_info.get('refresh_token') or token_info.get('token') or token_info.get('access_token')
+        if not secret:
+            return None
+        return 'user:' + hashlib.sha256(secret.encode('utf-8')).hexdigest()[:32]
+    if token_path and os.path.exists(token_path):
+        return f'file:{token_path}:{os.path.getmtime(token_path)}'
+    return None
+
+
+def _get_cached_service(key, Request):
+    with _service_cache_lock:
+        entry = _service_cache.get(key)
+        if entry is None:
+            _service_cache_stats['misses'] += 1
+            return None
+        _service_cache.move_to_end(key)
+
+    creds = entry['creds']
+    with entry['lock']:
+        # Refresh shortly before expiry so requests never go out with a stale token
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        margin = timedelta(seconds=Config.GOOGLE_TOKEN_REFRESH_MARGIN)
+        if creds.refresh_token and creds.expiry and creds.expiry - now < margin:
+            try:
+                creds.refresh(Request())
+                with _service_cache_lock:
+                    _service_cache_stats['refreshes'] += 1
+            except Exception as e:
+                print(f"[Google] Token refresh failed: {e}")
+
+    if not creds.valid:
+        with _service_cache_lock:
+            _service_cache.pop(key, None)
+            _service_cache_stats['misses'] += 1
+        return None
+    with _service_cache_lock:
+        _service_cache_stats['hits'] += 1
+    return entry['service']
+
+
+def _cache_service(key, service, creds):
+    with _service_cache_lock:
+        _service_cache[key] = {'service': service, 'creds': creds, 'lock': threading.Lock()}
+        _service_cache.move_to_end(key)
+        while len(_service_cache) > Config.GOOGLE_SERVICE_CACHE_SIZE:
+            _service_cache.popitem(last=False)
+            _service_cache_stats['evictions'] += 1
+
+
+def _build_service(service_name, version, creds):
+    """
+    Build a client from the discovery document bundled with google-api-python-client
+    (no discovery HTTP fetch). Every request gets its own authorized Http, because
+    httplib2 is not thread-safe and cached clients are shared across workflow nodes.
+    """
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.discovery import build
+    from googleapiclient.http import HttpRequest
+
+    def request_builder(http, *args, **kwargs):
+        return HttpRequest(google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()), *args, **kwargs)
+
+    return build(
+        service_name, version,
+        http=google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()),
+        requestBuilder=request_builder,
+        static_discovery=True,
+        cache_discovery=False,
+    )
+
+
+def get_service_cache_stats():
+    with _service_cache_lock:
+        return dict(_service_cache_stats, size=len(_service_cache), max_size=Config.GOOGLE_SERVICE_CACHE_SIZE)
+
+
+def clear_service_cache():
+    with _service_cache_lock:
+        _service_cache.clear()
+
+
 def get_google_service(service_name, version, token_info=None):
     """
     Attempts to authenticate and return a Google API service.
     Returns None if credentials are missing or libraries are not installed.
+    Clients are cached per credential, service and version (see _service_cache).
     """
     try:
         from google.auth.transport.requests import Request
         from google.oauth2.credentials import Credentials
         from google_auth_oauthlib.flow import InstalledAppFlow
-        from googleapiclient.discovery import build
     except ImportError:
         print("[Google] Google API libraries not installed. Using Mock mode.")
         return None
 
+    # The file token.json stores the user's access and refresh tokens, and is
+    # created automatically when the authorization flow completes for the first time.
+    # Check for ADMIN_TOKEN_FILE first if we are sending email (or generally prefer it if it exists)
+    # For now, we check ADMIN_TOKEN_FILE first, then TOKEN_FILE
+    token_path_to_use = TOKEN_FILE
+    if os.path.exists(ADMIN_TOKEN_FILE):
+        token_path_to_use = ADMIN_TOKEN_FILE
+
+    if token_info:
+        fingerprint = _credential_fingerprint(token_info=token_info)
+    else:
+        fingerprint = _credential_fingerprint(token_path=token_path_to_use)
+    if fingerprint:
+        service = _get_cached_service((fingerprint, service_name, version), Request)
+        if service is not None:
+            return service
+
     def _load_client_credentials():
         """Load client_id/client_secret from secrets file or environment."""
         client_id = os.environ.get('GOOGLE_CLIENT_ID')
@@ -101,23 +217,16 @@ def get_google_service(service_name, version, token_info=None):
         )
 
     creds = None
+    creds_from_token_info = False
     
     if token_info:
         try:
             # Use provided token info (from DB)
             creds = _build_credentials_from_token(token_info)
+            creds_from_token_info = True
         except Exception as e:
             print(f"[Google] Error loading provided token info: {e}")
             creds = None
-
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first time.
-    # Check for ADMIN_TOKEN_FILE first if we are sending email (or generally prefer it if it exists)
-    # For now, we check ADMIN_TOKEN_FILE first, then TOKEN_FILE
-    
-    token_path_to_use = TOKEN_FILE
-    if os.path.exists(ADMIN_TOKEN_FILE):
-        token_path_to_use = ADMIN_TOKEN_FILE
         
     if not creds and os.path.exists(token_path_to_use):
         try:
@@ -159,6 +268,7 @@ def get_google_service(service_name, version, token_info=None):
                 # Save the credentials for the next run
                 with open(TOKEN_FILE, 'w') as token:
                     token.write(creds.to_json())
+                token_path_to_use = TOKEN_FILE
             except Exception as e:
                 print(f"[Google] Authentication failed: {e}")
                 print("[Google] It seems you are using a Web Client ID which requires a specific Redirect URI.")
@@ -176,7 +286,15 @@ def get_google_service(service_name, version, token_info=None):
             # print(f"[Google] DEBUG: Credentials valid. Scopes: {creds.scopes}")
             pass
 
-        service = build(service_name, version, credentials=creds)
+        service = _build_service(service_name, version, creds)
+        # Key by where creds actually came from: a token_info that failed to load
+        # falls back to the token files, and must not cache that client under the user's key
+        if creds_from_token_info:
+            fingerprint = _credential_fingerprint(token_info=token_info)
+        else:
+            fingerprint = _credential_fingerprint(token_path=token_path_to_use)
+        if fingerprint:
+            _cache_service((fingerprint, service_name, version), service, creds)
         return service
     except Exception as e:
         print(f"[Google] Error building service: {e}")
@@ -214,6 +332,35 @@ def list_files(token_info=None, mime_types=None, query_text=None, page_size=50,
         print(f"[Google] list_files error: {e}")
         return {'files': [], 'nextPageToken': None, 'error': str(e)}
 
+# Sheet titles per spreadsheet id, used to correct ranges like "Sheet1!A1"
+# when the first sheet has a localized name (e.g. "Trang tính1")
+_sheet_titles_cache = {}
+_sheet_titles_lock = threading.Lock()
+
+
+def get_sheet_titles(service, sheet_id):
+    """Titles of the sheets in a spreadsheet, in order; cached for SHEET_TITLES_TTL seconds."""
+    now = time.time()
+    with _sheet_titles_lock:
+        cached = _sheet_titles_cache.get(sheet_id)
+    if cached and now - cached[1] < Config.SHEET_TITLES_TTL:
+        return cached[0]
+    metadata = service.spreadsheets().get(
+        spreadsheetId=sheet_id, fields='sheets.properties.title').execute()
+    titles = [sh.get('properties', {}).get('title') for sh in metadata.get('sheets', [])]
+    with _sheet_titles_lock:
+        _sheet_titles_cache[sheet_id] = (titles, now)
+    return titles
+
+
+def _range_on_first_sheet(service, sheet_id, range_name):
+    titles = get_sheet_titles(service, sheet_id)
+    if not titles:
+        return None
+    cell_range = range_name.split('!', 1)[1] if '!' in range_name else range_name
+    return f"'{titles[0]}'!{cell_range}"
+
+
 def read_sheet(sheet_id, range_name, token_info=None):
     """
     Reads data from a Google Sheet.
@@ -235,12 +382,11 @@ def read_sheet(sheet_id, range_name, token_info=None):
             if "Unable to parse range" in error_str or "400" in error_str:
                 print(f"[Google] Range error detected. Attempting to auto-detect correct sheet name...")
                 try:
-                    # Fetch metadata to find real sheet names
-                    metadata = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-                    sheets = metadata.get('sheets', [])
-                    if sheets:
+                    # Find real sheet names (metadata cached per spreadsheet)
+                    sheet_titles = get_sheet_titles(service, sheet_id)
+                    if sheet_titles:
                         # Get the title of the very first sheet
-                        first_sheet_title = sheets[0].get('properties', {}).get('title')
+                        first_sheet_title = sheet_titles[0]
                         print(f"[Google] Found first sheet: '{first_sheet_title}'")
                         
                         # Extract the cell part of the original range (e.g. "A1:B10" from "Sheet1!A1:B10")
@@ -385,10 +531,9 @@ def write_sheet(sheet_id, range_name, values, method='append', token_info=None):
             if "Unable to parse range" in error_str or "400" in error_str:
                 print(f"[Google] Range error detected during WRITE. Attempting to auto-detect correct sheet name...")
                 try:
-                    metadata = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-                    sheets = metadata.get('sheets', [])
-                    if sheets:
-                        first_sheet_title = sheets[0].get('properties', {}).get('title')
+                    sheet_titles = get_sheet_titles(service, sheet_id)
+                    if sheet_titles:
+                        first_sheet_title = sheet_titles[0]
                         print(f"[Google] Found first sheet: '{first_sheet_title}'")
                         
                         if '!' in range_name:
@@ -431,10 +576,9 @@ def write_sheet(sheet_id, range_name, values, method='append', token_info=None):
             if "Unable to parse range" in error_str or "400" in error_str:
                 print(f"[Google] Range error detected. Attempting to auto-detect correct sheet name...")
                 try:
-                    metadata = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-                    sheets = metadata.get('sheets', [])
-                    if sheets:
-                        first_sheet_title = sheets[0].get('properties', {}).get('title')
+                    sheet_titles = get_sheet_titles(service, sheet_id)
+                    if sheet_titles:
+                        first_sheet_title = sheet_titles[0]
                         print(f"[Google] Found first sheet: '{first_sheet_title}'")
                         
                         if '!' in range_name:
@@ -465,6 +609,133 @@ def write_sheet(sheet_id, range_name, values, method='append', token_info=None):
     time.sleep(1)
     return {"status": "mock_success", "message": "Data written (simulated)"}
 
+class SheetWriteBuffer:
+    """
+    Collects sheet writes during one workflow run and sends them per spreadsheet
+    in as few requests as the API allows:
+
+    - consecutive 'update' writes -> one values:batchUpdate
+    - consecutive 'append' writes to the same range -> one values:append with
+      the rows concatenated (batchUpdate cannot append)
+
+    Write order within a spreadsheet is preserved. add() returns a placeholder
+    result; flush() returns {key: result} with the same shape write_sheet returns,
+    and every flushed result is also kept in .results.
+    """
+
+    def __init__(self, token_info=None):
+        self.token_info = token_info
+        self._pending = OrderedDict()  # sheet_id -> [(key, range_name, values, method)]
+        self.results = {}
+        self._lock = threading.Lock()
+        self._sheet_locks = {}  # sheet_id -> Lock held while that spreadsheet is flushed
+        self.requests_sent = 0
+        self.writes_buffered = 0
+
+    def add(self, key, sheet_id, range_name, values, method='append'):
+        with self._lock:
+            self._pending.setdefault(sheet_id, []).append((key, range_name, values, method))
+            self.writes_buffered += 1
+        return {"status": "queued", "spreadsheetId": sheet_id, "range": range_name, "rows": len(values)}
+
+    def has_pending(self, sheet_id=None):
+        with self._lock:
+            return bool(self._pending.get(sheet_id) if sheet_id else self._pending)
+
+    def flush(self, sheet_id=None):
+        """
+        Send pending writes (for one spreadsheet or all); returns {key: result}.
+
+        Flushes of the same spreadsheet are serialized, so once flush(sheet_id)
+        returns, every write added to it before the call is in .results, even
+        if another thread's flush sent it.
+        """
+        with self._lock:
+            sheet_ids = list(self._pending) if sheet_id is None else [sheet_id]
+        results = {}
+        for sid in sheet_ids:
+            with self._lock:
+                sheet_lock = self._sheet_locks.setdefault(sid, threading.Lock())
+            with sheet_lock:
+                with self._lock:
+                    writes = self._pending.pop(sid, [])
+                if not writes:
+                    continue
+                sent = self._flush_spreadsheet(sid, writes)
+                with self._lock:
+                    self.results.update(sent)
+            results.update(sent)
+        return results
+
+    def _flush_spreadsheet(self, sheet_id, writes):
+        service = get_google_service('sheets', 'v4', self.token_info)
+        if not service:
+            # Mock mode: fall back to one write_sheet per node
+            return {key: write_sheet(sheet_id, rng, values, method=method, token_info=self.token_info)
+                    for key, rng, values, method in writes}
+
+        # Group consecutive writes that can share a request
+        groups = []
+        for write in writes:
+            key, rng, values, method = write
+            last = groups[-1] if groups else None
+            if last and last[0] == method == 'update':
+                last[1].append(write)
+            elif last and last[0] == method == 'append' and last[1][0][1] == rng:
+                last[1].append(write)
+            else:
+                groups.append((method, [write]))
+
+        results = {}
+        for method, group in groups:
+            try:
+                results.update(self._send(service, sheet_id, method, group, correct_range=False))
+            except Exception as e:
+                error_str = str(e)
+                if "Unable to parse range" in error_str or "400" in error_str:
+                    try:
+                        print(f"[Google] Range error in batched write to {sheet_id}. Retrying on first sheet...")
+                        results.update(self._send(service, sheet_id, method, group, correct_range=True))
+                        continue
+                    except Exception as retry_e:
+                        error_str = str(retry_e)
+                print(f"[Google] REAL API Failed: {error_str}")
+                for key, *_ in group:
+                    results[key] = {"status": "error", "message": error_str}
+        return results
+
+    def _send(self, service, sheet_id, method, group, correct_range):
+        def fix(rng):
+            return (_range_on_first_sheet(service, sheet_id, rng) or rng) if correct_range else rng
+
+        values_api = service.spreadsheets().values()
+        with self._lock:
+            self.requests_sent += 1
+        if method == 'update':
+            print(f"[Google] REAL API: BATCH UPDATE {len(group)} ranges in Sheet {sheet_id}...")
+            result = values_api.batchUpdate(spreadsheetId=sheet_id, body={
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': fix(rng), 'values': values} for _, rng, values, _ in group],
+            }).execute()
+            responses = result.get('responses', [])
+            return {
+                key: (responses[i] if i < len(responses) else {})
+                for i, (key, *_) in enumerate(group)
+            }
+
+        rng = fix(group[0][1])
+        rows = [row for _, _, values, _ in group for row in values]
+        print(f"[Google] REAL API: APPEND {len(rows)} rows from {len(group)} writes to Sheet {sheet_id} range {rng}...")
+        result = values_api.append(
+            spreadsheetId=sheet_id,
+            range=rng,
+            valueInputOption='USER_ENTERED',
+            body={'values': rows}
+        ).execute()
+        updates = result.get('updates', {})
+        return {key: dict(updates, batchedWrites=len(group)) for key, *_ in group}
+
+
 def send_email(to, subject, body_text, token_info=None):
     """
     Sends an email using the Gmail API.
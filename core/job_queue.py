@@ -0,0 +1,208 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the backlog is at max_queue."""
+
+
+class JobQueue:
+    """
+    Fixed-size worker pool with an in-memory job table.
+
+    - handler: callable(*args) run by a worker; returns a dict that is merged
+      into the job (e.g. {"status": "completed", "response": ...}). A raised
+      exception marks the job failed.
+    - max_workers: worker threads, started on first submit
+    - max_queue: jobs allowed to wait for a worker; submit raises QueueFull beyond it
+    - ttl: seconds a finished job stays queryable before it is evicted
+    - persist_path: optional SQLite file so job status survives a restart
+    """
+
+    def __init__(self, handler, max_workers=4, max_queue=64, ttl=3600.0,
+                 persist_path=None, name='jobs'):
+        self.name = name
+        self.handler = handler
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.ttl = ttl
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = {}  # job_id -> job dict
+        self._lock = threading.Lock()
+        self._workers = []
+        self._last_sweep = time.time()
+        self._running = 0
+
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'evicted': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'run_time_total': 0.0,
+            'run_time_max': 0.0,
+        }
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, data TEXT, updated_at REAL)")
+            self._db.commit()
+
+    def submit(self, *args, owner=None):
+        """Queue handler(*args); returns the new job id or raises QueueFull."""
+        self._ensure_workers()
+        self._maybe_sweep()
+        job_id = str(uuid.uuid4())
+        job = {'status': 'pending', 'owner': owner, 'created_at': time.time()}
+        with self._lock:
+            self._jobs[job_id] = job
+        # Persisted before a worker can see it, so its processing/completed rows always come later
+        self._persist(job_id, dict(job))
+        try:
+            self._queue.put_nowait((job_id, args))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+                self._stats['rejected'] += 1
+            self._unpersist(job_id)
+            raise QueueFull(f"[{self.name}] {self.max_queue} jobs already waiting")
+        with self._lock:
+            self._stats['submitted'] += 1
+        return job_id
+
+    def get(self, job_id):
+        """Copy of the job dict, or None if unknown or evicted."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self._load(job_id)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s.update({
+                'name': self.name,
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self._queue.qsize(),
+                'running': self._running,
+                'tracked_jobs': len(self._jobs),
+            })
+        started = s['completed'] + s['failed'] + s['running']
+        finished = s['completed'] + s['failed']
+        s['wait_time_avg_ms'] = round(s['wait_time_total'] / started * 1000, 2) if started else 0.0
+        s['run_time_avg_ms'] = round(s['run_time_total'] / finished * 1000, 2) if finished else 0.0
+        for key in ('wait_time_total', 'wait_time_max', 'run_time_total', 'run_time_max'):
+            s[f'{key}_ms'] = round(s.pop(key) * 1000, 2)
+        return s
+
+    # --- internals ---
+    def _ensure_workers(self):
+        if len(self._workers) >= self.max_workers:
+            return
+        with self._lock:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._work, name=f'{self.name}-worker-{len(self._workers)}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job_id, args = self._queue.get()
+            started = time.time()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                waited = started - job['created_at']
+                job.update({'status': 'processing', 'start_time': started})
+                self._running += 1
+                self._stats['wait_time_total'] += waited
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+                snapshot = dict(job)
+            self._persist(job_id, snapshot)
+
+            try:
+                update = self.handler(*args) or {}
+                update.setdefault('status', 'completed')
+            except Exception as e:
+                print(f"[{self.name}] Job {job_id} failed: {e}")
+                update = {'status': 'failed', 'error': str(e)}
+
+            finished = time.time()
+            elapsed = finished - started
+            with self._lock:
+                self._running -= 1
+                self._stats['failed' if update['status'] == 'failed' else 'completed'] += 1
+                self._stats['run_time_total'] += elapsed
+                self._stats['run_time_max'] = max(self._stats['run_time_max'], elapsed)
+                job.update(update)
+                job['finished_at'] = finished
+                snapshot = dict(job)
+            self._persist(job_id, snapshot)
+
+    def _maybe_sweep(self):
+        """Evict finished jobs older than ttl; runs at most every ttl/10 seconds."""
+        now = time.time()
+        if not self.ttl or now - self._last_sweep < self.ttl / 10:
+            return
+        self._last_sweep = now
+        cutoff = now - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('finished_at') and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._stats['evicted'] += len(expired)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+                self._db.commit()
+
+    def _persist(self, job_id, job):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO jobs (job_id, data, updated_at) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(job, default=str), time.time()))
+                self._db.commit()
+        except Exception as e:
+            print(f"[{self.name}] Failed to persist job {job_id}: {e}")
+
+    def _unpersist(self, job_id):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                self._db.commit()
+        except Exception as e:
+            print(f"[{self.name}] Failed to remove job {job_id}: {e}")
+
+    def _load(self, job_id):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT data, updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        job = json.loads(row[0])
+        if job.get('status') in ('pending', 'processing'):
+            # The worker that owned it is gone (process restarted)
+            job.update({'status': 'failed', 'error': 'Job interrupted by server restart'})
+        return job
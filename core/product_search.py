@@ -0,0 +1,155 @@
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from .config import Config
+
+
+def normalize_text(text):
+    """
+    Lowercase and strip Vietnamese diacritics, as dl_service's
+    utils.data_processor.normalize_text does; additionally folds 'đ' to 'd'
+    so shoppers can type plain ASCII.
+    """
+    if not isinstance(text, str):
+        return ''
+    normalized = unicodedata.normalize('NFD', text)
+    stripped = ''.join(ch for ch in normalized if not unicodedata.combining(ch)).lower()
+    return stripped.replace('đ', 'd')
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductSearchIndex:
+    """
+    Typeahead index over a product catalog ([{'id', 'name', 'price'}, ...])
+
+    - queries of 3+ characters: trigram postings intersected, then verified as
+      a substring of the normalized "name id" text
+    - shorter queries: word prefix lookup in a sorted token list
+    Results are ranked: exact name, name prefix, word prefix, substring; then
+    shorter names, then catalog order.
+    """
+
+    SHORT_QUERY_SCAN_LIMIT = 2000
+
+    def __init__(self, products):
+        self.products = products
+        self._texts = []
+        self._names = []
+        trigram_index = defaultdict(list)
+        tokens = []
+        for pos, product in enumerate(products):
+            name = normalize_text(product.get('name', ''))
+            text = f"{name} {normalize_text(str(product.get('id', '')))}"
+            self._names.append(name)
+            self._texts.append(text)
+            for gram in _trigrams(text):
+                trigram_index[gram].append(pos)
+            for token in set(text.split()):
+                tokens.append((token, pos))
+        self._trigram_index = {gram: frozenset(positions) for gram, positions in trigram_index.items()}
+        tokens.sort()
+        self._tokens = [t for t, _ in tokens]
+        self._token_positions = [p for _, p in tokens]
+
+    def __len__(self):
+        return len(self.products)
+
+    def _rank(self, pos, query):
+        name = self._names[pos]
+        if name == query:
+            tier = 0
+        elif name.startswith(query):
+            tier = 1
+        elif f' {query}' in f' {self._texts[pos]}':
+            tier = 2
+        else:
+            tier = 3
+        return (tier, len(name), pos)
+
+    def _substring_candidates(self, query):
+        postings = sorted((self._trigram_index.get(g, frozenset()) for g in _trigrams(query)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return candidates
+        return {pos for pos in candidates if query in self._texts[pos]}
+
+    def _prefix_candidates(self, query):
+        start = bisect.bisect_left(self._tokens, query)
+        candidates = set()
+        for i in range(start, min(len(self._tokens), start + self.SHORT_QUERY_SCAN_LIMIT)):
+            if not self._tokens[i].startswith(query):
+                break
+            candidates.add(self._token_positions[i])
+        return candidates
+
+    def search(self, query, limit=5):
+        """Top `limit` products matching query, best first"""
+        query = ' '.join(normalize_text(query).split())
+        if not query:
+            return []
+        if len(query) >= 3:
+            candidates = self._substring_candidates(query)
+        else:
+            candidates = self._prefix_candidates(query)
+        best = heapq.nsmallest(limit, (self._rank(pos, query) for pos in candidates))
+        return [self.products[pos] for _, _, pos in best]
+
+
+class ProductSearchCache:
+    """Process-wide index for one catalog file; rebuilt when its mtime or size changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < Config.PRODUCT_SEARCH_RELOAD_CHECK:
+            return self._index
+        with self._lock:
+            if self._index is not None and now - self._checked_at < Config.PRODUCT_SEARCH_RELOAD_CHECK:
+                return self._index
+            signature = self._file_signature()
+            if self._index is None or signature != self._signature:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    products = json.load(f)
+                self._index = ProductSearchIndex(products)
+                self._signature = signature
+                self.loads += 1
+                print(f"[Products] Search index built: {len(products)} products")
+            self._checked_at = now
+            return self._index
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_product_search_index(path):
+    """ProductSearchIndex for the catalog at path, shared across requests"""
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(path, ProductSearchCache(path))
+    return cache.get()
@@ -1,83 +1,579 @@
 import json
 import re
 import os
-from .google_integration import read_sheet, read_doc, write_doc, write_sheet, send_email
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from functools import lru_cache
+from .config import Config
+from .google_integration import read_sheet, read_doc, write_doc, write_sheet, send_email, SheetWriteBuffer
 from .make_integration import trigger_webhook
 from .services.dl_client import DLClient
 
+# Node types that block on network I/O; these run on the shared thread pool
+IO_NODE_TYPES = {
+    'google_sheet_read', 'google_sheet_write', 'google_doc_read', 'google_doc_write',
+    'make_webhook', 'slack_notify', 'discord_notify', 'gmail_send',
+    'invoice_ocr', 'invoice_forecast',
+}
+
+_io_executor = None
+_io_executor_lock = threading.Lock()
+
+class TemplateSyntaxError(ValueError):
+    """A {{...}} expression that is not a plain node.path accessor chain."""
+
+
+_TEMPLATE_RE = re.compile(r'\{\{(.*?)\}\}')
+_NODE_ID_RE = re.compile(r'[^.\[]*')
+_PATH_STEP_RE = re.compile(
+    r"""\s*(?:\.\s*([A-Za-z_]\w*)"""   # .field
+    r"""|\[\s*(-?\d+)\s*\]"""          # [0]
+    r"""|\[\s*'([^']*)'\s*\]"""         # ['key']
+    r"""|\[\s*"([^"]*)"\s*\])"""        # ["key"]
+)
+
+
+def _compile_path(path):
+    """
+    "1.data[0]['name']" -> ("1", (("attr", "data"), ("item", 0), ("item", "name")))
+
+    Returns (node_id, None) when the path has unsupported syntax.
+    """
+    path = path.strip()
+    node_id = _NODE_ID_RE.match(path).group(0).strip()
+    steps = []
+    pos = len(_NODE_ID_RE.match(path).group(0))
+    while pos < len(path):
+        step = _PATH_STEP_RE.match(path, pos)
+        if step is None or step.end() == pos:
+            return node_id, None
+        attr, index, single_quoted, double_quoted = step.groups()
+        if attr is not None:
+            steps.append(("attr", attr))
+        elif index is not None:
+            steps.append(("item", int(index)))
+        else:
+            steps.append(("item", single_quoted if single_quoted is not None else double_quoted))
+        pos = step.end()
+    return node_id, tuple(steps)
+
+
+@lru_cache(maxsize=2048)
+def _compile_template(template_str):
+    """
+    Compiles a template once into literal text and accessor chains.
+
+    Returns (segments, direct) where segments alternates str literals and
+    (node_id, steps) tuples, and direct is the accessor chain when the whole
+    template is a single {{...}} expression (else None).
+    """
+    segments = []
+    last = 0
+    for match in _TEMPLATE_RE.finditer(template_str):
+        segments.append(template_str[last:match.start()])
+        segments.append(_compile_path(match.group(1)))
+        last = match.end()
+    segments.append(template_str[last:])
+
+    direct = None
+    if template_str.startswith('{{') and template_str.endswith('}}') and template_str.count('{{') == 1:
+        direct = _compile_path(template_str[2:-2])
+    return tuple(segments), direct
+
+
+def _evaluate(accessor, context):
+    """Walks a compiled accessor chain; raises like the equivalent Python expression would."""
+    node_id, steps = accessor
+    if steps is None:
+        raise TemplateSyntaxError(f"Unsupported template expression for node '{node_id}'")
+    value = context[node_id]
+    for kind, key in steps:
+        if kind == "attr":
+            # .field reads dict keys as well as attributes
+            if isinstance(value, Mapping) and key in value:
+                value = value[key]
+            else:
+                value = getattr(value, key)
+        else:
+            value = value[key]
+    return value
+
+
 def resolve_template(template_str, context):
     """
     Replaces {{nodeId.path}} with actual values from context.
     Example: {{1.data[0][0]}} -> "Alice"
+
+    Paths support .field, [index] and ['key'] steps. Templates are compiled
+    once and cached by template string; nothing is passed to eval.
     """
     if not template_str:
         return ""
     
+    segments, direct = _compile_template(template_str)
+
     # --- Direct Object Reference Optimization ---
     # If the template is EXACTLY "{{...}}", return the object directly.
     # This allows passing Lists/Dicts between nodes without stringification issues.
-    if isinstance(template_str, str) and template_str.startswith('{{') and template_str.endswith('}}') and template_str.count('{{') == 1:
-        path = template_str[2:-2].strip()
-        parts = path.split('.')
-        node_id = parts[0]
-        
-        if node_id in context:
-            try:
-                rest = path[len(node_id):]
-                expr = f"ctx['{node_id}']{rest}"
-                return eval(expr, {"ctx": context})
-            except Exception as e:
-                print(f"Direct Template Error: {e}")
-                # Fallback to regex replacement if eval fails
-                pass
-
-    # If it's a JSON string, try to parse it first to handle structure
-    # But we need to resolve strings inside it.
-    # Simple approach: Regex replace on the string representation
-    
-    def replacer(match):
-        path = match.group(1) # e.g. "1.data[0][0]"
-        parts = path.split('.')
-        node_id = parts[0]
-        
-        if node_id not in context:
-            return "null"
-            
-        value = context[node_id]
-        
-        # Traverse the rest of the path (very basic implementation)
-        # This supports .field but not [index] properly in this simple regex version
-        # For a robust solution, we'd use a library like Jinja2
-        
-        # Hacky support for list access in the string like "data[0]"
-        # We will just eval it (DANGEROUS in prod, okay for test PoC)
+    if direct is not None and direct[0] in context:
         try:
-            # Construct a python expression: context['1']['data'][0]
-            # We need to map the path string to python accessors
-            
-            # Remove node_id from path
-            rest = path[len(node_id):] # e.g. ".data[0][0]"
-            
-            # Evaluate context[node_id] + rest
-            # We wrap context access in a safe way
-            expr = f"ctx['{node_id}']{rest}"
-            res = eval(expr, {"ctx": context})
-            return str(res)
+            return _evaluate(direct, context)
         except Exception as e:
-            print(f"Template Error: {e}")
-            return "null"
+            print(f"Direct Template Error: {e}")
+            # Fallback to string replacement if the lookup fails
 
-    # Replace {{...}}
-    resolved_str = re.sub(r'\{\{(.*?)\}\}', replacer, template_str)
+    # Replace {{...}} in a single pass over the compiled segments
+    parts = []
+    for segment in segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+        elif segment[0] not in context:
+            parts.append("null")
+        else:
+            try:
+                parts.append(str(_evaluate(segment, context)))
+            except Exception as e:
+                print(f"Template Error: {e}")
+                parts.append("null")
+    resolved_str = ''.join(parts)
     
     try:
         return json.loads(resolved_str)
     except:
         return resolved_str
 
+def _template_refs(value, refs=None):
+    """Node ids referenced by {{...}} templates anywhere in a (nested) config value."""
+    if refs is None:
+        refs = set()
+    if isinstance(value, str):
+        for match in _TEMPLATE_RE.finditer(value):
+            refs.add(_compile_path(match.group(1))[0])
+    elif isinstance(value, Mapping):
+        for item in value.values():
+            _template_refs(item, refs)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _template_refs(item, refs)
+    return refs
+
+
+def _ordering_dependencies(nodes, execution_order, parents_map):
+    """
+    Non-edge dependencies that keep the serial run's context guarantees:
+    a node waits for every node earlier in execution_order that its templates
+    reference, and a google_sheet_read waits for earlier google_sheet_writes
+    to the same spreadsheet. References to later nodes stay unresolved ("null"),
+    as they were when nodes ran one by one.
+
+    Returns {node_id: set of node ids}
+    """
+    position = {node_id: i for i, node_id in enumerate(execution_order)}
+    deps = {}
+    for node_id in execution_order:
+        node = nodes[node_id]
+        config = node.get('config', {})
+        earlier = {ref for ref in _template_refs(config)
+                   if ref in position and position[ref] < position[node_id]}
+        if node['type'] == 'google_sheet_read':
+            sheet_id = config.get('sheetId', 'dummy_id')
+            earlier.update(
+                other for other in execution_order[:position[node_id]]
+                if nodes[other]['type'] == 'google_sheet_write'
+                and nodes[other].get('config', {}).get('sheetId', 'dummy_id') == sheet_id
+            )
+        deps[node_id] = earlier - set(parents_map[node_id])
+    return deps
+
+
+def _run_node(node_id, node, parents, context, token_info, log, sheet_writes=None, send_write=False):
+    """
+    Runs a single node. Reads parent outputs from context but never writes it;
+    the scheduler records the returned result. When sheet_writes (a
+    SheetWriteBuffer) is given, sheet writes are queued on it instead of sent;
+    send_write flushes that spreadsheet right away so the node returns the real
+    write result (for writes whose output other nodes read).
+
+    Returns ("success", result) or ("stopped", reason); raises on node errors.
+    """
+    node_type = node['type']
+    config = node.get('config', {})
+
+    result = None
+
+    # --- Node Logic ---
+    if node_type == 'google_sheet_read':
+        sheet_id = config.get('sheetId', 'dummy_id')
+        range_name = config.get('range', 'A1:Z100')
+        if sheet_writes is not None:
+            # Read-after-write: send queued writes to this spreadsheet first (and
+            # wait for any flush of it already in flight on another thread)
+            if sheet_writes.has_pending(sheet_id):
+                log(f"[Workflow] Flushing queued writes to Sheet {sheet_id} before read")
+            sheet_writes.flush(sheet_id)
+        result = read_sheet(sheet_id, range_name, token_info)
+
+    elif node_type == 'google_sheet_write':
+        sheet_id = config.get('sheetId', 'dummy_id')
+        range_name = config.get('range', 'A1')
+        data_template = config.get('data', '')
+        write_mode = config.get('writeMode', 'json') # json, row, single
+        use_parent_data = config.get('useParentData', True)
+
+        log(f"[Workflow] Node {node_id} Write Mode: {write_mode}")
+
+        # Resolve data: prefer parent data if configured
+        if (use_parent_data or not data_template) and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_data = parent_data
+                log(f"[Workflow] Using parent node ({p_id}) data for write")
+            else:
+                resolved_data = resolve_template(data_template, context)
+                log(f"[Workflow] Parent data empty, using template")
+        else:
+            resolved_data = resolve_template(data_template, context)
+            log(f"[Workflow] Raw Template: '{data_template}'")
+
+        log(f"[Workflow] Resolved Data: '{resolved_data}' (Type: {type(resolved_data)})")
+
+        data_to_write = []
+        method = 'append' # Default method
+
+        if write_mode == 'json':
+            # Expecting a JSON string or a list object
+            if isinstance(resolved_data, str):
+                try:
+                    data_to_write = json.loads(resolved_data)
+                except:
+                    # Fallback: treat as single cell if JSON fails
+                    data_to_write = [[resolved_data]]
+            elif isinstance(resolved_data, list):
+                data_to_write = resolved_data
+            else:
+                data_to_write = [[str(resolved_data)]]
+
+        elif write_mode == 'row':
+            # Append Row (Comma Separated)
+            # "A, B, C" -> [["A", "B", "C"]]
+            if isinstance(resolved_data, str):
+                row_data = [x.strip() for x in resolved_data.split(',')]
+                data_to_write = [row_data]
+            elif isinstance(resolved_data, list):
+                data_to_write = [resolved_data]
+            else:
+                data_to_write = [[str(resolved_data)]]
+            method = 'append'
+
+        elif write_mode == 'column':
+            # Append Column (Newline Separated)
+            # "A\nB\nC" -> [["A"], ["B"], ["C"]]
+            if isinstance(resolved_data, str):
+                # Split by newline
+                rows = resolved_data.split('\n')
+                data_to_write = [[x.strip()] for x in rows if x.strip()]
+            elif isinstance(resolved_data, list):
+                # Assume list of strings -> column
+                data_to_write = [[str(x)] for x in resolved_data]
+            else:
+                data_to_write = [[str(resolved_data)]]
+            method = 'append'
+
+        elif write_mode == 'cell':
+            # Overwrite Single Cell
+            # Just one cell, but we use UPDATE method to overwrite specific range
+            data_to_write = [[str(resolved_data)]]
+            method = 'update'
+
+        # Final Safety Check: Ensure list of lists
+        if not isinstance(data_to_write, list):
+            data_to_write = [[str(data_to_write)]]
+        elif data_to_write and not isinstance(data_to_write[0], list):
+            data_to_write = [data_to_write]
+
+        log(f"[Workflow] Writing to Sheet {sheet_id} at {range_name}. Mode: {write_mode}, Method: {method}")
+        log(f"[Workflow] Payload: {data_to_write}")
+
+        if sheet_writes is not None:
+            result = sheet_writes.add(node_id, sheet_id, range_name, data_to_write, method=method)
+            if send_write:
+                sheet_writes.flush(sheet_id)
+                result = sheet_writes.results.get(node_id, result)
+        else:
+            result = write_sheet(sheet_id, range_name, data_to_write, method=method, token_info=token_info)
+
+    elif node_type == 'google_doc_read':
+        doc_id = config.get('docId', 'dummy_doc')
+        result = read_doc(doc_id, token_info)
+
+    elif node_type == 'google_doc_write':
+        doc_id = config.get('docId', 'dummy_doc')
+        content_template = config.get('content', '')
+        use_parent = config.get('useParentData', True)
+
+        if (use_parent or not content_template) and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_content = parent_data
+                log(f"[Workflow] Write Doc: using parent node ({p_id}) data")
+            else:
+                resolved_content = resolve_template(content_template, context)
+        else:
+            resolved_content = resolve_template(content_template, context)
+
+        # Convert dicts/lists to readable string
+        if isinstance(resolved_content, (dict, list)):
+            resolved_content = json.dumps(resolved_content, indent=2, ensure_ascii=False)
+
+        result = write_doc(doc_id, str(resolved_content), token_info)
+
+    elif node_type == 'make_webhook':
+        url = config.get('url', 'http://example.com/webhook')
+        method = config.get('method', 'POST')
+        body_template = config.get('body', '{}')
+        use_parent = config.get('useParentData', False)
+
+        # Resolve payload
+        if use_parent and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                payload = parent_data
+                log(f"[Workflow] Make webhook: using parent node ({p_id}) data")
+            else:
+                payload = resolve_template(body_template, context)
+        else:
+            payload = resolve_template(body_template, context)
+
+        if url.startswith("http"):
+            result = trigger_webhook(url, method, payload)
+        else:
+            result = {"status": "skipped", "reason": "Invalid URL"}
+
+    elif node_type == 'slack_notify':
+        url = config.get('url', '')
+        message_template = config.get('message', '')
+        use_parent = config.get('useParentData', False)
+
+        if use_parent and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_message = parent_data
+                log(f"[Workflow] Slack: using parent node ({p_id}) data")
+            else:
+                resolved_message = resolve_template(message_template, context)
+        elif not message_template and parents:
+            p_id = parents[0]
+            resolved_message = context.get(p_id)
+        else:
+            resolved_message = resolve_template(message_template, context)
+
+        payload = {"text": str(resolved_message)}
+
+        if url.startswith("http"):
+            result = trigger_webhook(url, "POST", payload)
+        else:
+            result = {"status": "error", "message": "Invalid Slack Webhook URL"}
+
+    elif node_type == 'discord_notify':
+        url = config.get('url', '')
+        message_template = config.get('message', '')
+        use_parent = config.get('useParentData', False)
+
+        if use_parent and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_message = parent_data
+                log(f"[Workflow] Discord: using parent node ({p_id}) data")
+            else:
+                resolved_message = resolve_template(message_template, context)
+        elif not message_template and parents:
+            p_id = parents[0]
+            resolved_message = context.get(p_id)
+        else:
+            resolved_message = resolve_template(message_template, context)
+
+        payload = {"content": str(resolved_message)}
+
+        if url.startswith("http"):
+            result = trigger_webhook(url, "POST", payload)
+        else:
+            result = {"status": "error", "message": "Invalid Discord Webhook URL"}
+
+    elif node_type == 'gmail_send':
+        to = config.get('to', '')
+        subject = config.get('subject', 'Workflow Notification')
+        title = config.get('title', '')
+        body_template = config.get('body', '')
+        use_parent = config.get('useParentData', False)
+
+        if use_parent and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_body = parent_data
+                log(f"[Workflow] Gmail: using parent node ({p_id}) data")
+            else:
+                resolved_body = resolve_template(body_template, context)
+        elif not body_template and parents:
+            p_id = parents[0]
+            resolved_body = context.get(p_id)
+        else:
+            resolved_body = resolve_template(body_template, context)
+
+        final_body = str(resolved_body)
+        if title:
+            final_body = f"{title}\n\n{final_body}"
+
+        result = send_email(to, subject, final_body, token_info)
+
+    elif node_type == 'filter':
+        # Basic Filter Logic
+        # Config: { "keyword": "Active" }
+        # Checks if ANY string in the parent context contains the keyword
+        keyword = config.get('keyword', '')
+
+        # Flatten context values to search
+        found = False
+        if not keyword:
+            found = True # Pass if no keyword
+        else:
+            # Search in immediate parents' output
+            for p_id in parents:
+                p_data = context.get(p_id)
+                if str(keyword).lower() in str(p_data).lower():
+                    found = True
+                    break
+
+        if found:
+            result = {"filtered": False, "message": "Condition met"}
+        else:
+            # If filter fails, we raise an exception or return a special status?
+            # Let's return a 'stopped' status so children are skipped
+            return "stopped", "Filter condition failed"
+
+    elif node_type == 'invoice_ocr':
+        # Deep Learning OCR Node
+        # Config: { "fileUrl": "..." } or use parent output
+        file_url = config.get('fileUrl', '')
+
+        # If no URL provided, try to find one in parent output
+        if not file_url and parents:
+            p_id = parents[0]
+            p_data = context.get(p_id)
+            # Heuristic: check if parent output looks like a URL or file path
+            if isinstance(p_data, str) and (p_data.startswith('http') or p_data.startswith('/')):
+                file_url = p_data
+
+        resolved_url = resolve_template(file_url, context)
+
+        client = DLClient()
+        # For now, we assume resolved_url is a local path or we need to fetch it
+        # If it's a local path (e.g. from upload), pass it directly
+        if os.path.exists(resolved_url):
+            result = client.detect_invoice(file_path=resolved_url)
+        else:
+            # TODO: Handle remote URLs by downloading them first
+            result = {"error": "Remote URL support not implemented yet", "url": resolved_url}
+
+    elif node_type == 'invoice_forecast':
+        # Deep Learning Forecast Node
+        # Config: { "data": ..., "useParentData": true/false }
+        data_template = config.get('data', '')
+        use_parent = config.get('useParentData', True)  # Default to using parent data
+
+        resolved_data = None
+
+        # Auto-pass parent output if configured or if no data template
+        if (use_parent or not data_template) and parents:
+            p_id = parents[0]
+            parent_data = context.get(p_id)
+            if parent_data is not None:
+                resolved_data = parent_data
+                log(f"[Forecast] Using parent node ({p_id}) data: {str(resolved_data)[:200]}")
+            else:
+                log(f"[Forecast] Warning: Parent node ({p_id}) returned no data")
+
+        # Fallback to template if parent data is empty
+        if resolved_data is None and data_template:
+            resolved_data = resolve_template(data_template, context)
+            log(f"[Forecast] Using template data: {str(resolved_data)[:200]}")
+
+        # Final fallback: try to build from all parent outputs
+        if resolved_data is None and parents:
+            for p_id in parents:
+                p_data = context.get(p_id)
+                if p_data is not None:
+                    resolved_data = p_data
+                    log(f"[Forecast] Fallback: using parent ({p_id}) data")
+                    break
+
+        if resolved_data is None:
+            log(f"[Forecast] Error: No data available for forecasting")
+            result = {"error": "No input data for forecasting. Connect a data source node (OCR, Read Sheet, etc.) or provide data manually.", "status": "failed"}
+        else:
+            client = DLClient()
+            result = client.forecast_quantity(resolved_data)
+            log(f"[Forecast] Result: {str(result)[:300]}")
+
+    else:
+        result = {"status": "skipped", "reason": "Unknown node type"}
+
+
+    return "success", result
+
+
+def _get_io_executor():
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=Config.WORKFLOW_IO_WORKERS, thread_name_prefix='workflow-io'
+            )
+    return _io_executor
+
+
+def _timed_run_node(*args):
+    started_at = datetime.now().isoformat()
+    start = time.perf_counter()
+    try:
+        outcome, error = _run_node(*args), None
+    except Exception as e:
+        outcome, error = None, e
+    timing = {
+        "started_at": started_at,
+        "finished_at": datetime.now().isoformat(),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return outcome, error, timing
+
+
 def execute_workflow(workflow_data, token_info=None):
     """
-    Executes the workflow defined in the JSON data using a topological sort.
+    Executes the workflow defined in the JSON data as a DAG.
+
+    A node starts as soon as all of its parents have finished. I/O-bound node
+    types (Google, webhooks, mail, DL service) run on a shared thread pool, at
+    most `maxConcurrency` (default Config.WORKFLOW_MAX_CONCURRENCY) at a time
+    per workflow; the rest run inline. Besides its parents, a node also waits
+    for earlier nodes (in topological order) that its templates reference, and
+    a google_sheet_read for earlier writes to its spreadsheet, so it sees the
+    same context a serial run in topological order would give it.
+    On the first error no new nodes are started and the workflow fails.
+
+    google_sheet_write nodes are buffered per run (Config.WORKFLOW_BATCH_SHEET_WRITES)
+    and sent per spreadsheet once the run ends, or before a google_sheet_read of the
+    same spreadsheet; their output is the write result once sent. A write whose
+    output is read (it has children or is referenced by a template) is sent,
+    with the writes queued before it, before its children are released.
     """
     logs = []
     def log(msg):
@@ -103,370 +599,106 @@ def execute_workflow(workflow_data, token_info=None):
             parents_map[target].append(source)
             in_degree[target] += 1
             
-    # 2. Topological Sort (Kahn's Algorithm)
-    queue = [node_id for node_id in nodes if in_degree[node_id] == 0]
+    # 2. Topological Sort (Kahn's Algorithm) - cycle check
+    remaining = dict(in_degree)
+    queue = deque(node_id for node_id in nodes if remaining[node_id] == 0)
     execution_order = []
     
     while queue:
-        current_id = queue.pop(0)
+        current_id = queue.popleft()
         execution_order.append(current_id)
         
         for neighbor in adj_list[current_id]:
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
+            remaining[neighbor] -= 1
+            if remaining[neighbor] == 0:
                 queue.append(neighbor)
                 
     if len(execution_order) != len(nodes):
         return {"status": "error", "message": "Cycle detected in workflow!", "logs": logs}
         
-    # 3. Execute Nodes in Order
+    # 3. Execute Nodes as soon as their parents are done
     context = {} # Stores output of each node: {node_id: output_data}
     node_results = {}
-    
-    for node_id in execution_order:
-        node = nodes[node_id]
-        node_type = node['type']
-        config = node.get('config', {})
-        
-        # --- Flow Control Check ---
-        # Check if all parents executed successfully
-        parents = parents_map[node_id]
-        parent_failed = False
-        for p_id in parents:
-            p_result = node_results.get(p_id, {})
-            if p_result.get('status') != 'success':
-                parent_failed = True
-                break
-        
-        if parent_failed:
-            log(f"Skipping Node {node_id} because parent failed/skipped.")
-            node_results[node_id] = {"status": "skipped", "reason": "Parent failed or skipped"}
-            continue
+    max_concurrency = max(1, int(workflow_data.get('maxConcurrency') or Config.WORKFLOW_MAX_CONCURRENCY))
+    sheet_writes = SheetWriteBuffer(token_info) if Config.WORKFLOW_BATCH_SHEET_WRITES else None
 
-        log(f"--- Running Node {node_id} ({node_type}) ---")
-        
-        try:
-            result = None
-            
-            # --- Node Logic ---
-            if node_type == 'google_sheet_read':
-                sheet_id = config.get('sheetId', 'dummy_id')
-                range_name = config.get('range', 'A1:Z100')
-                result = read_sheet(sheet_id, range_name, token_info)
-
-            elif node_type == 'google_sheet_write':
-                sheet_id = config.get('sheetId', 'dummy_id')
-                range_name = config.get('range', 'A1')
-                data_template = config.get('data', '')
-                write_mode = config.get('writeMode', 'json') # json, row, single
-                use_parent_data = config.get('useParentData', True)
-
-                log(f"[Workflow] Node {node_id} Write Mode: {write_mode}")
-
-                # Resolve data: prefer parent data if configured
-                if (use_parent_data or not data_template) and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_data = parent_data
-                        log(f"[Workflow] Using parent node ({p_id}) data for write")
-                    else:
-                        resolved_data = resolve_template(data_template, context)
-                        log(f"[Workflow] Parent data empty, using template")
-                else:
-                    resolved_data = resolve_template(data_template, context)
-                    log(f"[Workflow] Raw Template: '{data_template}'")
-                
-                log(f"[Workflow] Resolved Data: '{resolved_data}' (Type: {type(resolved_data)})")
-
-                data_to_write = []
-                method = 'append' # Default method
-
-                if write_mode == 'json':
-                    # Expecting a JSON string or a list object
-                    if isinstance(resolved_data, str):
-                        try:
-                            data_to_write = json.loads(resolved_data)
-                        except:
-                            # Fallback: treat as single cell if JSON fails
-                            data_to_write = [[resolved_data]]
-                    elif isinstance(resolved_data, list):
-                        data_to_write = resolved_data
-                    else:
-                        data_to_write = [[str(resolved_data)]]
-
-                elif write_mode == 'row':
-                    # Append Row (Comma Separated)
-                    # "A, B, C" -> [["A", "B", "C"]]
-                    if isinstance(resolved_data, str):
-                        row_data = [x.strip() for x in resolved_data.split(',')]
-                        data_to_write = [row_data]
-                    elif isinstance(resolved_data, list):
-                        data_to_write = [resolved_data]
-                    else:
-                        data_to_write = [[str(resolved_data)]]
-                    method = 'append'
-
-                elif write_mode == 'column':
-                    # Append Column (Newline Separated)
-                    # "A\nB\nC" -> [["A"], ["B"], ["C"]]
-                    if isinstance(resolved_data, str):
-                        # Split by newline
-                        rows = resolved_data.split('\n')
-                        data_to_write = [[x.strip()] for x in rows if x.strip()]
-                    elif isinstance(resolved_data, list):
-                        # Assume list of strings -> column
-                        data_to_write = [[str(x)] for x in resolved_data]
-                    else:
-                        data_to_write = [[str(resolved_data)]]
-                    method = 'append'
-
-                elif write_mode == 'cell':
-                    # Overwrite Single Cell
-                    # Just one cell, but we use UPDATE method to overwrite specific range
-                    data_to_write = [[str(resolved_data)]]
-                    method = 'update'
-                
-                # Final Safety Check: Ensure list of lists
-                if not isinstance(data_to_write, list):
-                    data_to_write = [[str(data_to_write)]]
-                elif data_to_write and not isinstance(data_to_write[0], list):
-                    data_to_write = [data_to_write]
-                
-                log(f"[Workflow] Writing to Sheet {sheet_id} at {range_name}. Mode: {write_mode}, Method: {method}")
-                log(f"[Workflow] Payload: {data_to_write}")
+    # Writes whose output someone reads can't stay queued behind a placeholder
+    referenced = set()
+    for node in nodes.values():
+        _template_refs(node.get('config', {}), referenced)
+    consumed = {node_id for node_id in nodes if adj_list[node_id] or node_id in referenced}
 
-                result = write_sheet(sheet_id, range_name, data_to_write, method=method, token_info=token_info)
-                
-            elif node_type == 'google_doc_read':
-                doc_id = config.get('docId', 'dummy_doc')
-                result = read_doc(doc_id, token_info)
-
-            elif node_type == 'google_doc_write':
-                doc_id = config.get('docId', 'dummy_doc')
-                content_template = config.get('content', '')
-                use_parent = config.get('useParentData', True)
-
-                if (use_parent or not content_template) and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_content = parent_data
-                        log(f"[Workflow] Write Doc: using parent node ({p_id}) data")
-                    else:
-                        resolved_content = resolve_template(content_template, context)
-                else:
-                    resolved_content = resolve_template(content_template, context)
-
-                # Convert dicts/lists to readable string
-                if isinstance(resolved_content, (dict, list)):
-                    resolved_content = json.dumps(resolved_content, indent=2, ensure_ascii=False)
-
-                result = write_doc(doc_id, str(resolved_content), token_info)
-                
-            elif node_type == 'make_webhook':
-                url = config.get('url', 'http://example.com/webhook')
-                method = config.get('method', 'POST')
-                body_template = config.get('body', '{}')
-                use_parent = config.get('useParentData', False)
-                
-                # Resolve payload
-                if use_parent and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        payload = parent_data
-                        log(f"[Workflow] Make webhook: using parent node ({p_id}) data")
-                    else:
-                        payload = resolve_template(body_template, context)
-                else:
-                    payload = resolve_template(body_template, context)
-                
-                if url.startswith("http"):
-                    result = trigger_webhook(url, method, payload)
-                else:
-                    result = {"status": "skipped", "reason": "Invalid URL"}
-
-            elif node_type == 'slack_notify':
-                url = config.get('url', '')
-                message_template = config.get('message', '')
-                use_parent = config.get('useParentData', False)
-                
-                if use_parent and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_message = parent_data
-                        log(f"[Workflow] Slack: using parent node ({p_id}) data")
-                    else:
-                        resolved_message = resolve_template(message_template, context)
-                elif not message_template and parents:
-                    p_id = parents[0]
-                    resolved_message = context.get(p_id)
-                else:
-                    resolved_message = resolve_template(message_template, context)
-                
-                payload = {"text": str(resolved_message)}
-                
-                if url.startswith("http"):
-                    result = trigger_webhook(url, "POST", payload)
-                else:
-                    result = {"status": "error", "message": "Invalid Slack Webhook URL"}
-
-            elif node_type == 'discord_notify':
-                url = config.get('url', '')
-                message_template = config.get('message', '')
-                use_parent = config.get('useParentData', False)
-                
-                if use_parent and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_message = parent_data
-                        log(f"[Workflow] Discord: using parent node ({p_id}) data")
-                    else:
-                        resolved_message = resolve_template(message_template, context)
-                elif not message_template and parents:
-                    p_id = parents[0]
-                    resolved_message = context.get(p_id)
-                else:
-                    resolved_message = resolve_template(message_template, context)
-                
-                payload = {"content": str(resolved_message)}
-                
-                if url.startswith("http"):
-                    result = trigger_webhook(url, "POST", payload)
-                else:
-                    result = {"status": "error", "message": "Invalid Discord Webhook URL"}
-            
-            elif node_type == 'gmail_send':
-                to = config.get('to', '')
-                subject = config.get('subject', 'Workflow Notification')
-                title = config.get('title', '')
-                body_template = config.get('body', '')
-                use_parent = config.get('useParentData', False)
-                
-                if use_parent and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_body = parent_data
-                        log(f"[Workflow] Gmail: using parent node ({p_id}) data")
-                    else:
-                        resolved_body = resolve_template(body_template, context)
-                elif not body_template and parents:
-                    p_id = parents[0]
-                    resolved_body = context.get(p_id)
-                else:
-                    resolved_body = resolve_template(body_template, context)
-                
-                final_body = str(resolved_body)
-                if title:
-                    final_body = f"{title}\n\n{final_body}"
+    waiting_on = dict(in_degree)
+    order_children = {node_id: [] for node_id in nodes}
+    for node_id, deps in _ordering_dependencies(nodes, execution_order, parents_map).items():
+        waiting_on[node_id] += len(deps)
+        for dep in deps:
+            order_children[dep].append(node_id)
+    ready = deque(node_id for node_id in execution_order if waiting_on[node_id] == 0)
+    running = {}  # future -> node_id
+    error_node = None
 
-                result = send_email(to, subject, final_body, token_info)
+    def release_children(node_id):
+        for child in adj_list[node_id] + order_children[node_id]:
+            waiting_on[child] -= 1
+            if waiting_on[child] == 0:
+                ready.append(child)
 
-            elif node_type == 'filter':
-                # Basic Filter Logic
-                # Config: { "keyword": "Active" }
-                # Checks if ANY string in the parent context contains the keyword
-                keyword = config.get('keyword', '')
-                
-                # Flatten context values to search
-                found = False
-                if not keyword:
-                    found = True # Pass if no keyword
-                else:
-                    # Search in immediate parents' output
-                    for p_id in parents:
-                        p_data = context.get(p_id)
-                        if str(keyword).lower() in str(p_data).lower():
-                            found = True
-                            break
-                
-                if found:
-                    result = {"filtered": False, "message": "Condition met"}
-                else:
-                    # If filter fails, we raise an exception or return a special status?
-                    # Let's return a 'stopped' status so children are skipped
-                    node_results[node_id] = {"status": "stopped", "reason": "Filter condition failed"}
-                    continue
-
-            elif node_type == 'invoice_ocr':
-                # Deep Learning OCR Node
-                # Config: { "fileUrl": "..." } or use parent output
-                file_url = config.get('fileUrl', '')
-                
-                # If no URL provided, try to find one in parent output
-                if not file_url and parents:
-                    p_id = parents[0]
-                    p_data = context.get(p_id)
-                    # Heuristic: check if parent output looks like a URL or file path
-                    if isinstance(p_data, str) and (p_data.startswith('http') or p_data.startswith('/')):
-                        file_url = p_data
-                
-                resolved_url = resolve_template(file_url, context)
-                
-                client = DLClient()
-                # For now, we assume resolved_url is a local path or we need to fetch it
-                # If it's a local path (e.g. from upload), pass it directly
-                if os.path.exists(resolved_url):
-                    result = client.detect_invoice(file_path=resolved_url)
-                else:
-                    # TODO: Handle remote URLs by downloading them first
-                    result = {"error": "Remote URL support not implemented yet", "url": resolved_url}
-
-            elif node_type == 'invoice_forecast':
-                # Deep Learning Forecast Node
-                # Config: { "data": ..., "useParentData": true/false }
-                data_template = config.get('data', '')
-                use_parent = config.get('useParentData', True)  # Default to using parent data
-                
-                resolved_data = None
-                
-                # Auto-pass parent output if configured or if no data template
-                if (use_parent or not data_template) and parents:
-                    p_id = parents[0]
-                    parent_data = context.get(p_id)
-                    if parent_data is not None:
-                        resolved_data = parent_data
-                        log(f"[Forecast] Using parent node ({p_id}) data: {str(resolved_data)[:200]}")
-                    else:
-                        log(f"[Forecast] Warning: Parent node ({p_id}) returned no data")
-                
-                # Fallback to template if parent data is empty
-                if resolved_data is None and data_template:
-                    resolved_data = resolve_template(data_template, context)
-                    log(f"[Forecast] Using template data: {str(resolved_data)[:200]}")
-                
-                # Final fallback: try to build from all parent outputs
-                if resolved_data is None and parents:
-                    for p_id in parents:
-                        p_data = context.get(p_id)
-                        if p_data is not None:
-                            resolved_data = p_data
-                            log(f"[Forecast] Fallback: using parent ({p_id}) data")
-                            break
-                
-                if resolved_data is None:
-                    log(f"[Forecast] Error: No data available for forecasting")
-                    result = {"error": "No input data for forecasting. Connect a data source node (OCR, Read Sheet, etc.) or provide data manually.", "status": "failed"}
-                else:
-                    client = DLClient()
-                    result = client.forecast_quantity(resolved_data)
-                    log(f"[Forecast] Result: {str(result)[:300]}")
-                
-            else:
-                result = {"status": "skipped", "reason": "Unknown node type"}
-            
-            # Store result
-            context[node_id] = result
-            node_results[node_id] = {"status": "success", "output": result}
-            
-        except Exception as e:
-            log(f"Error in Node {node_id}: {str(e)}")
-            node_results[node_id] = {"status": "error", "error": str(e)}
+    def record(node_id, outcome, error, timing):
+        nonlocal error_node
+        if error is not None:
+            log(f"Error in Node {node_id}: {str(error)}")
+            node_results[node_id] = {"status": "error", "error": str(error), **timing}
             # Stop execution on error? For now, yes.
-            return {"status": "failed", "node_results": node_results, "error_node": node_id, "logs": logs}
+            if error_node is None:
+                error_node = node_id
+            return
+        status, payload = outcome
+        if status == "stopped":
+            node_results[node_id] = {"status": "stopped", "reason": payload, **timing}
+        else:
+            # Store result
+            context[node_id] = payload
+            node_results[node_id] = {"status": "success", "output": payload, **timing}
+        release_children(node_id)
+
+    while ready or running:
+        while ready and error_node is None and len(running) < max_concurrency:
+            node_id = ready.popleft()
+            node = nodes[node_id]
+            parents = parents_map[node_id]
+
+            # --- Flow Control Check ---
+            # Check if all parents executed successfully
+            if any(node_results.get(p_id, {}).get('status') != 'success' for p_id in parents):
+                log(f"Skipping Node {node_id} because parent failed/skipped.")
+                node_results[node_id] = {"status": "skipped", "reason": "Parent failed or skipped"}
+                release_children(node_id)
+                continue
+
+            log(f"--- Running Node {node_id} ({node['type']}) ---")
+            args = (node_id, node, parents, context, token_info, log, sheet_writes, node_id in consumed)
+            if node['type'] in IO_NODE_TYPES:
+                running[_get_io_executor().submit(_timed_run_node, *args)] = node_id
+            else:
+                record(node_id, *_timed_run_node(*args))
+
+        if not running:
+            if error_node is not None:
+                break
+            continue
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            record(running.pop(future), *future.result())
+
+    if sheet_writes is not None and sheet_writes.writes_buffered:
+        sheet_writes.flush()
+        for node_id, write_result in sheet_writes.results.items():
+            context[node_id] = write_result
+            node_results[node_id]["output"] = write_result
+        log(f"[Workflow] {sheet_writes.writes_buffered} sheet writes sent in {sheet_writes.requests_sent} requests")
+
+    if error_node is not None:
+        return {"status": "failed", "node_results": node_results, "error_node": error_node, "logs": logs}
 
     return {"status": "completed", "node_results": node_results, "logs": logs}
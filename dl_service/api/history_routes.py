@@ -11,9 +11,11 @@ from utils.database import (
     get_invoices_from_db,
     get_forecasts_from_db,
     get_statistics,
+    get_invoice_writer_stats,
     clear_database
 )
 from utils.logger import get_logger
+from utils.ocr_cache import get_ocr_cache_stats
 
 # Create blueprint
 history_bp = Blueprint('history', __name__, url_prefix='/api')
@@ -129,7 +131,9 @@ def models_info():
         return jsonify({
             'success': True,
             'models': models,
-            'invoice_history_count': len(invoice_history)
+            'invoice_history_count': len(invoice_history),
+            'ocr_cache': get_ocr_cache_stats(),
+            'invoice_writer': get_invoice_writer_stats()
         })
         
     except Exception as e:
@@ -2,18 +2,20 @@
 Model 1 Routes
 Invoice Detection API endpoints
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 import cv2
 import numpy as np
 from werkzeug.utils import secure_filename
 from datetime import datetime
+import json
 import time
 import os
+import zipfile
 
 from services.invoice_service import process_invoice_image, format_invoice_response
-from config import ALLOWED_EXTENSIONS, UPLOAD_DIR
-from utils.validators import validate_image_file, ValidationError
-from utils.database import save_invoice_to_db
+from services.batch_pipeline import InvoiceBatchPipeline
+from config import ALLOWED_EXTENSIONS, UPLOAD_DIR, BATCH_MAX_FILES, BATCH_MAX_TOTAL_BYTES
+from utils.validators import validate_image_file, ValidationError, MAX_IMAGE_SIZE
 from utils.logger import get_logger, log_api_request
 
 # Create blueprint
@@ -59,11 +61,7 @@ def detect_invoice():
         invoice_data = process_invoice_image(image)
         logger.info(f"[ROUTE] Returned from process_invoice_image, got {len(invoice_data.get('products',[]))} products")
 
-        # Save to database
-        try:
-            save_invoice_to_db(invoice_data)
-        except Exception as db_error:
-            logger.warning(f"Failed to save invoice to database: {db_error}")
+        # process_invoice_image already queued the invoice for the database writer
 
         # Format response
         response = format_invoice_response(invoice_data)
@@ -91,3 +89,118 @@ def detect_invoice():
             'success': False,
             'message': f'Error processing image: {str(e)}'
         }), 500
+
+
+def _read_zip_member(archive, info):
+    """
+    Bytes of one zip member, held to the same limits as a plain upload
+
+    The declared size is checked before anything is decompressed, and the read
+    is capped too, since the header can lie.
+    """
+    if info.file_size == 0:
+        raise ValidationError(f'Empty file in zip: {info.filename}')
+    if info.file_size > MAX_IMAGE_SIZE:
+        raise ValidationError(f'File too large in zip: {info.filename} ({info.file_size} bytes). Max: {MAX_IMAGE_SIZE} bytes')
+    with archive.open(info) as member:
+        data = member.read(MAX_IMAGE_SIZE + 1)
+    if len(data) > MAX_IMAGE_SIZE:
+        raise ValidationError(f'File too large in zip: {info.filename}. Max: {MAX_IMAGE_SIZE} bytes')
+    return data
+
+
+def _collect_batch_files():
+    """
+    (filename, bytes) pairs from a batch upload: any number of 'files'
+    (or 'image'/'file') parts, each an image or a .zip of images
+
+    Every image must pass the single-upload limits, and the batch is capped at
+    BATCH_MAX_FILES images and BATCH_MAX_TOTAL_BYTES uncompressed.
+    """
+    uploads = request.files.getlist('files') + request.files.getlist('image') + request.files.getlist('file')
+    if not uploads:
+        raise ValidationError('No files provided. Upload images or a zip as "files".')
+
+    items = []
+    total_bytes = 0
+
+    def add(name, data):
+        nonlocal total_bytes
+        if len(items) >= BATCH_MAX_FILES:
+            raise ValidationError(f'Too many files in batch (max {BATCH_MAX_FILES})')
+        total_bytes += len(data)
+        if total_bytes > BATCH_MAX_TOTAL_BYTES:
+            raise ValidationError(f'Batch too large (max {BATCH_MAX_TOTAL_BYTES} bytes uncompressed)')
+        items.append((name, data))
+
+    for upload in uploads:
+        filename = upload.filename or ''
+        if filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(upload.stream) as archive:
+                    for info in archive.infolist():
+                        name = os.path.basename(info.filename)
+                        if info.is_dir() or name.startswith('.') or not allowed_file(name):
+                            continue
+                        if total_bytes + info.file_size > BATCH_MAX_TOTAL_BYTES:
+                            raise ValidationError(f'Batch too large (max {BATCH_MAX_TOTAL_BYTES} bytes uncompressed)')
+                        add(name, _read_zip_member(archive, info))
+            except zipfile.BadZipFile:
+                raise ValidationError(f'Invalid zip file: {filename}')
+        else:
+            validate_image_file(upload)
+            add(filename, upload.read())
+
+    if not items:
+        raise ValidationError('No images found in upload')
+    return items
+
+
+@model1_bp.route('/detect_batch', methods=['POST'])
+def detect_invoice_batch():
+    """
+    Detect many invoices; streams NDJSON as each one finishes
+
+    Lines:
+        {"type": "result", "index", "filename", "success", "data" | "error", "timings_ms", "pipeline": {...}}
+        {"type": "summary", "pipeline": {...}}   (last line)
+    """
+    try:
+        items = _collect_batch_files()
+    except ValidationError as e:
+        logger.warning(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+    logger.info(f"Processing invoice batch: {len(items)} files")
+    pipeline = InvoiceBatchPipeline()
+
+    def generate():
+        for result in pipeline.run(items):
+            line = {
+                'type': 'result',
+                'index': result['index'],
+                'filename': result['filename'],
+                'success': result['success'],
+                'timings_ms': result['timings_ms'],
+                'latency_ms': result['latency_ms'],
+            }
+            if result['success']:
+                line['data'] = result['invoice_data']
+            else:
+                line['error'] = result['error']
+            line['pipeline'] = pipeline.stats()
+            yield json.dumps(line, ensure_ascii=False, default=str) + '\n'
+
+        stats = pipeline.stats()
+        log_api_request('/api/model1/detect_batch', 'POST',
+                        params={'files': len(items)},
+                        status_code=200, duration=stats['elapsed_ms'])
+        logger.info(f"Invoice batch done: {stats['completed']} ok, {stats['failed']} failed, "
+                    f"{stats['throughput_per_sec']} invoices/s")
+        yield json.dumps({'type': 'summary', 'pipeline': stats}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
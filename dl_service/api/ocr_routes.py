@@ -45,6 +45,8 @@ def ocr_image():
             'text': result.get('text', ''),
             'backend': result.get('backend'),
             'confidence': float(result.get('confidence', 0.0)),
+            'backend_latency_ms': result.get('backend_latency_ms', {}),
+            'cached': result.get('cached', False),
             'message': 'OCR completed'
         }
 
@@ -0,0 +1,144 @@
+"""
+Micro-benchmark for CTPN box decoding in services/layout_service.py.
+
+Compares the old per-cell Python loop (+ pairwise NMS / merge) against the
+batched decoder on synthetic CTPN outputs shaped like a real 448x224 forward
+pass, checks both produce the same lines, and prints per-image decode time.
+
+Run from the repo root:
+    python dl_service/benchmark_layout_decode.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.getcwd(), 'dl_service'))
+
+from services.layout_service import (
+    CFG_IMG_H, CFG_IMG_W, N_ANCHOR, _decode_ctpn, _nms, _merge_horizontal
+)
+
+
+# --- Old implementation, kept here only as the benchmark baseline ---
+def _legacy_iou(a, b):
+    x0 = max(a[0], b[0])
+    y0 = max(a[1], b[1])
+    x1 = min(a[2], b[2])
+    y1 = min(a[3], b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0
+
+def _legacy_merge_horizontal(boxes, y_overlap=0.5, x_gap_ratio=2.0):
+    if not boxes: return boxes
+    boxes = sorted(boxes, key=lambda b: ((b[1] + b[3]) / 2, b[0]))
+    merged = []
+    used = [False] * len(boxes)
+    for i in range(len(boxes)):
+        if used[i]: continue
+        cur = list(boxes[i])
+        used[i] = True
+        h = cur[3] - cur[1]
+        for j in range(i + 1, len(boxes)):
+            if used[j]: continue
+            bj = boxes[j]
+            hj = bj[3] - bj[1]
+            overlap = min(cur[3], bj[3]) - max(cur[1], bj[1])
+            if overlap < y_overlap * min(h, hj): continue
+            gap = bj[0] - cur[2]
+            if gap > x_gap_ratio * max(h, hj): continue
+            cur[0] = min(cur[0], bj[0])
+            cur[1] = min(cur[1], bj[1])
+            cur[2] = max(cur[2], bj[2])
+            cur[3] = max(cur[3], bj[3])
+            cur[4] = max(cur[4], bj[4])
+            used[j] = True
+        merged.append(cur)
+    return merged
+
+def legacy_decode(out_1, out_2, out_3, orig_w, orig_h, conf_threshold):
+    scores = torch.softmax(out_1, dim=-1)[..., 1]
+    anchors = [5 * (2 ** (i / 2)) for i in range(N_ANCHOR)]
+    boxes = []
+    stride = 16
+    grid_h, grid_w = scores.size(1), scores.size(2)
+    for h_idx in range(grid_h):
+        for w_idx in range(grid_w):
+            for a_idx, ah in enumerate(anchors):
+                score = scores[0, h_idx, w_idx, a_idx].item()
+                if score < conf_threshold: continue
+                cx_anc, cy_anc = w_idx * stride + stride / 2, h_idx * stride + stride / 2
+                v_c = out_2[0, h_idx, w_idx, a_idx, 0].item()
+                v_h = out_2[0, h_idx, w_idx, a_idx, 1].item()
+                cy = v_c * ah + cy_anc
+                h = min(np.exp(v_h) * ah, CFG_IMG_H)
+                o = out_3[0, h_idx, w_idx, a_idx].item()
+                cx = cx_anc + o * stride
+                x0, y0, x1, y1 = cx - stride / 2, cy - h / 2, cx + stride / 2, cy + h / 2
+                x0, x1 = x0 / CFG_IMG_W * orig_w, x1 / CFG_IMG_W * orig_w
+                y0, y1 = y0 / CFG_IMG_H * orig_h, y1 / CFG_IMG_H * orig_h
+                boxes.append([x0, y0, x1, y1, score])
+    if not boxes: return []
+    boxes = sorted(boxes, key=lambda b: b[4], reverse=True)
+    keep = []
+    suppressed = set()
+    for i, bi in enumerate(boxes):
+        if i in suppressed: continue
+        keep.append(bi)
+        for j in range(i + 1, len(boxes)):
+            if j in suppressed: continue
+            if _legacy_iou(bi, boxes[j]) > 0.3: suppressed.add(j)
+    return _legacy_merge_horizontal(keep)
+
+
+def batched_decode(out_1, out_2, out_3, orig_w, orig_h, conf_threshold):
+    boxes = _decode_ctpn(out_1, out_2, out_3, orig_w, orig_h, conf_threshold)
+    if len(boxes) == 0:
+        return []
+    return _merge_horizontal(_nms(boxes, 0.3)).tolist()
+
+
+def synthetic_outputs(seed=0, n_lines=40):
+    """CTPN-shaped outputs with text-like horizontal runs of positive anchors."""
+    g = torch.Generator().manual_seed(seed)
+    grid_h, grid_w = CFG_IMG_H // 16, CFG_IMG_W // 16
+    logits = torch.randn(1, grid_h, grid_w, N_ANCHOR, 2, generator=g)
+    logits[..., 1] -= 3.0
+    for _ in range(n_lines):
+        row = int(torch.randint(0, grid_h, (1,), generator=g))
+        c0 = int(torch.randint(0, grid_w - 3, (1,), generator=g))
+        c1 = int(torch.randint(c0 + 2, grid_w, (1,), generator=g))
+        a = int(torch.randint(0, N_ANCHOR, (1,), generator=g))
+        logits[0, row, c0:c1, a, 1] += 6.0
+    out_2 = torch.randn(1, grid_h, grid_w, N_ANCHOR, 2, generator=g) * 0.1
+    out_3 = torch.randn(1, grid_h, grid_w, N_ANCHOR, generator=g) * 0.1
+    return logits, out_2, out_3
+
+
+def _time(fn, args, repeats):
+    fn(*args)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn(*args)
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+
+def run_benchmark(repeats=20):
+    orig_w, orig_h = 1080, 1920
+    for threshold in (0.5, 0.7):
+        outputs = synthetic_outputs()
+        args = (*outputs, orig_w, orig_h, threshold)
+        legacy_ms, legacy = _time(legacy_decode, args, repeats)
+        batched_ms, batched = _time(batched_decode, args, repeats)
+        same = len(legacy) == len(batched) and np.allclose(np.array(legacy), np.array(batched))
+        print(f"conf>={threshold}: legacy {legacy_ms:8.2f} ms/img | batched {batched_ms:6.2f} ms/img | "
+              f"speedup x{legacy_ms / max(batched_ms, 1e-6):.1f} | lines={len(batched)} | identical={same}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -31,8 +31,46 @@ LAYOUT_WEIGHTS_PATH = Path(os.getenv('LAYOUT_WEIGHTS_PATH', LAYOUT_WEIGHTS_DIR /
 LAYOUT_INFER_DEVICE = os.getenv('LAYOUT_INFER_DEVICE', 'auto')
 LAYOUT_METRICS_PATH = LAYOUT_WEIGHTS_DIR.parent / 'training_metrics.json'
 
+# VietOCR line recognition batching (see services/cpt_ocr.py)
+VIETOCR_MAX_BATCH_SIZE = int(os.getenv('VIETOCR_MAX_BATCH_SIZE', 16))
+VIETOCR_WIDTH_POLICY = os.getenv('VIETOCR_WIDTH_POLICY', 'sorted')  # exact | bucket | sorted
+VIETOCR_BUCKET_WIDTH = int(os.getenv('VIETOCR_BUCKET_WIDTH', 32))
+
+# OCR result cache, keyed by image bytes hash + backend version (see utils/ocr_cache.py)
+OCR_BACKEND_VERSION = os.getenv('OCR_BACKEND_VERSION', 'cascade-1')
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', '1') == '1'
+OCR_CACHE_MAX_ITEMS = int(os.getenv('OCR_CACHE_MAX_ITEMS', 256))
+OCR_CACHE_TTL_SECONDS = int(os.getenv('OCR_CACHE_TTL_SECONDS', 24 * 3600))
+OCR_CACHE_DISK_ENABLED = os.getenv('OCR_CACHE_DISK_ENABLED', '0') == '1'
+OCR_CACHE_DISK_PATH = Path(os.getenv('OCR_CACHE_DISK_PATH', BASE_DIR / 'database' / 'ocr_cache.db'))
+OCR_CACHE_DISK_MAX_ITEMS = int(os.getenv('OCR_CACHE_DISK_MAX_ITEMS', 5000))
+
+# OCR backend cascade (see services/ocr_service.py)
+# sequential: try backends in order; race: run them concurrently, first confident result wins
+OCR_CASCADE_MODE = os.getenv('OCR_CASCADE_MODE', 'sequential')
+# Worker threads per backend in race mode; each backend has its own pool so abandoned runs only hold up that backend
+OCR_RACE_MAX_WORKERS = int(os.getenv('OCR_RACE_MAX_WORKERS', 2))
+OCR_RACE_MIN_CONFIDENCE = float(os.getenv('OCR_RACE_MIN_CONFIDENCE', 0.5))
+OCR_RACE_DEFAULT_BUDGET = float(os.getenv('OCR_RACE_DEFAULT_BUDGET', 20))
+# Per-backend latency budget in seconds, keyed by cascade name
+OCR_BACKEND_BUDGETS = {
+    'EasyOCR': float(os.getenv('OCR_BUDGET_EASYOCR', 20)),
+    'PaddleOCR': float(os.getenv('OCR_BUDGET_PADDLE', 20)),
+    'VietOCR + ComputerVision': float(os.getenv('OCR_BUDGET_VIETOCR', 25)),
+    'Brain VLM (Qwen2-VL)': float(os.getenv('OCR_BUDGET_BRAIN', 30)),
+    'Tesseract': float(os.getenv('OCR_BUDGET_TESSERACT', 15)),
+}
+
+# OCR engines preloaded in the background at startup (see services/model_loader.py)
+OCR_PRELOAD_ENGINES = [n.strip() for n in os.getenv('OCR_PRELOAD_ENGINES', 'easyocr,paddleocr,vietocr').split(',') if n.strip()]
+OCR_WARMUP_WORKERS = int(os.getenv('OCR_WARMUP_WORKERS', 2))
+# Seconds a request waits for a still-loading engine once no warm backend produced text
+OCR_ENGINE_WAIT_SECONDS = float(os.getenv('OCR_ENGINE_WAIT_SECONDS', 60))
+
 # Data Paths
 CATALOG_PATH = DATA_DIR / 'product_catalogs.json'
+# Trigram similarity for catalog names with no exact substring match (0 = exact matching only)
+CATALOG_FUZZY_MIN_SCORE = float(os.getenv('CATALOG_FUZZY_MIN_SCORE', 0))
 DATASET_PATH = DATA_DIR / 'DATASET-tung1000.csv'
 
 # Image Settings
@@ -63,3 +101,20 @@ FLASK_PORT = 5000
 
 # History Storage
 MAX_INVOICE_HISTORY = 300
+
+# Invoice history writes (see utils/database.py): one background writer, batched commits
+INVOICE_WRITE_BATCH_SIZE = int(os.getenv('INVOICE_WRITE_BATCH_SIZE', 50))
+INVOICE_WRITE_FLUSH_INTERVAL = float(os.getenv('INVOICE_WRITE_FLUSH_INTERVAL', 0.2))  # seconds to wait for a batch to fill
+
+# Batch invoice detection (see services/batch_pipeline.py): workers per stage, bounded queues between stages
+BATCH_DECODE_WORKERS = int(os.getenv('BATCH_DECODE_WORKERS', 2))
+BATCH_LAYOUT_WORKERS = int(os.getenv('BATCH_LAYOUT_WORKERS', 1))
+BATCH_OCR_WORKERS = int(os.getenv('BATCH_OCR_WORKERS', 2))
+BATCH_PARSE_WORKERS = int(os.getenv('BATCH_PARSE_WORKERS', 2))
+BATCH_STAGE_QUEUE_SIZE = int(os.getenv('BATCH_STAGE_QUEUE_SIZE', 8))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 500))
+BATCH_MAX_TOTAL_BYTES = int(os.getenv('BATCH_MAX_TOTAL_BYTES', 256 * 1024 * 1024))  # uncompressed, whole batch
+
+# Latency tracing (see utils/tracing.py): histogram bucket bounds in seconds, exposed on /metrics
+TRACE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_SLOW_SPAN_MS = float(os.getenv('TRACE_SLOW_SPAN_MS', 0))  # log spans slower than this (0 = off)
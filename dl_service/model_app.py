@@ -23,14 +23,18 @@ warnings.filterwarnings('ignore', category=UserWarning, module='keras')
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 logging.getLogger('keras').setLevel(logging.ERROR)
 
-from flask import Flask, jsonify
+import time
+
+from flask import Flask, jsonify, request, g, Response
 from config import (
     TEMPLATE_DIR, STATIC_DIR, FLASK_DEBUG, FLASK_HOST, FLASK_PORT
 )
 
 # Import services
-from services.model_loader import initialize_models
-from utils.database import init_database
+from services import model_loader
+from services.model_loader import initialize_models, get_ocr_engine_status
+from utils.database import init_database, get_invoice_writer_stats
+from utils.tracing import observe, render_prometheus
 
 # Import API blueprints
 from api.model1_routes import model1_bp
@@ -55,10 +59,42 @@ def index():
 			'model1_detect': 'POST /api/model1/detect',
 			'model2_forecast': 'POST /api/model2/forecast',
 			'ocr': 'POST /api/ocr/',
-			'history': 'GET /api/history'
+			'history': 'GET /api/history',
+			'metrics': 'GET /metrics'
 		}
 	})
 
+# Request latency for every route, labelled by endpoint (not raw path, to keep cardinality low)
+@app.before_request
+def _start_request_timer():
+	g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_latency(response):
+	started = g.pop('request_started', None)
+	if started is not None and request.endpoint != 'metrics':
+		observe('http.request', time.perf_counter() - started,
+		        error=response.status_code >= 500,
+		        endpoint=request.endpoint or 'unknown', method=request.method)
+	return response
+
+@app.route('/metrics')
+def metrics():
+	"""Prometheus text: latency histograms from utils.tracing plus model readiness"""
+	lstm = model_loader.lstm_model
+	ready = [
+		({'model': 'layout'}, model_loader.layout_ready),
+		({'model': 'lstm'}, bool(lstm is not None and getattr(lstm, 'model', None) is not None)),
+	]
+	ready += [({'model': name}, get_ocr_engine_status(name) == 'ready')
+	          for name in model_loader.get_ocr_engines_info()]
+	writer = get_invoice_writer_stats()
+	gauges = {
+		'dl_model_ready': ('1 if the model is loaded and usable', ready),
+		'dl_invoice_writer_pending': ('Invoices queued for the database writer', [({}, writer['pending'])]),
+	}
+	return Response(render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
 # Register blueprints
 app.register_blueprint(model1_bp)
 app.register_blueprint(model2_bp)
@@ -85,6 +121,7 @@ if __name__ == '__main__':
     print(" POST /api/ocr/ - Upload image for OCR (field: 'image' or 'file')")
     print(" GET /api/history - View invoice history")
     print(" POST /api/history/clear - Clear history")
+    print(" GET /metrics - Latency histograms and model readiness (Prometheus)")
     print("="*70 + "\n")
 
     app.run(debug=FLASK_DEBUG, port=FLASK_PORT, host=FLASK_HOST, use_reloader=False)
@@ -159,23 +159,60 @@ class ImportForecastLSTM:
          days_since_import, initial_stock, retail_price]
         """
         try:
-            import numpy as np
-            from datetime import datetime
+            return self._predict_timescale_batch([(product_name, product_info)], imports_dict, sales_dict)[0]
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Prediction error: {str(e)}',
+                'predicted_quantity': 0,
+                'confidence': 0.0,
+                'trend': 'unknown'
+            }
+
+    def predict_batch_from_timescale_data(self, items, imports_dict, sales_dict):
+        """
+        Batched predict_from_timescale_data for many products.
+        
+        Args:
+            items: List of (product_name, product_info) pairs
+            imports_dict: Product name -> historical import quantity
+            sales_dict: Product name -> historical sales quantity
             
-            # Extract base data
+        Returns:
+            List of result dicts, same order and values as calling
+            predict_from_timescale_data once per product
+        """
+        if not items:
+            return []
+        try:
+            return self._predict_timescale_batch(items, imports_dict, sales_dict)
+        except Exception as e:
+            # Isolate the failing product(s) the same way the per-product path does
+            print(f"[WARNING] Batched forecast failed ({e}); predicting per product")
+            return [
+                self.predict_from_timescale_data(name, info, imports_dict, sales_dict)
+                for name, info in items
+            ]
+
+    def _predict_timescale_batch(self, items, imports_dict, sales_dict):
+        """One scaler.transform and one model call for (N, lookback, features) sequences."""
+        from datetime import datetime
+        
+        # Get current day info
+        today = datetime.now()
+        day_of_week = today.weekday() / 6.0  # Normalized to [0, 1]
+        is_weekend = 1 if today.weekday() >= 5 else 0
+        
+        import_qtys, sale_qtys, rows = [], [], []
+        for product_name, product_info in items:
             initial_stock = product_info.get('initial_stock', 0)
             retail_price = product_info.get('retail_price', 0)
-            import_qty = imports_dict.get(product_name, 0)
+            import_qtys.append(imports_dict.get(product_name, 0))
             sale_qty = sales_dict.get(product_name, 0)
+            sale_qtys.append(sale_qty)
             
-            # Get current day info
-            today = datetime.now()
-            day_of_week = today.weekday() / 6.0  # Normalized to [0, 1]
-            is_weekend = 1 if today.weekday() >= 5 else 0
-            
-            # Create 7-feature array matching training script:
             # [sale_qty, day_of_week, is_weekend, cumulative_sales, days_since_import, initial_stock, retail_price]
-            features = np.array([[
+            rows.append([
                 sale_qty,                      # sale_qty
                 day_of_week,                   # day_of_week (normalized)
                 is_weekend,                    # is_weekend
@@ -183,34 +220,38 @@ class ImportForecastLSTM:
                 min(1, 30) / 30.0,             # days_since_import (normalized, assume 1 day)
                 initial_stock,                 # initial_stock
                 retail_price                   # retail_price
-            ]])
-            
-            # Normalize using saved scaler
-            normalized_features = self.scaler.transform(features)
-            
-            # Create sequence by repeating features (padding for lookback)
-            sequence = np.repeat(normalized_features, self.lookback, axis=0).reshape(1, self.lookback, -1)
-            
-            # Predict
-            prediction_normalized = self.model.predict(sequence, verbose=0)[0][0]
+            ])
+        
+        # Normalize all products at once using saved scaler
+        normalized_features = self.scaler.transform(np.array(rows, dtype=float))
+        
+        # Create sequences by repeating each product's features (padding for lookback)
+        sequences = np.repeat(normalized_features[:, np.newaxis, :], self.lookback, axis=1)
+        
+        # Single forward pass for the whole invoice
+        predictions_normalized = np.asarray(self.model(sequences, training=False))[:, 0]
+        
+        # Denormalize (inverse transform for first feature - sale_qty/import prediction)
+        # Use target_scaler if available, otherwise fall back to feature scaler column 0
+        if hasattr(self, '_target_scaler') and self._target_scaler is not None:
+            predictions_denormalized = self._target_scaler.inverse_transform(
+                predictions_normalized.reshape(-1, 1)
+            )[:, 0]
+        else:
+            temp = np.zeros((len(rows), 7))  # Changed from 5 to 7 to match features
+            temp[:, 0] = predictions_normalized
+            predictions_denormalized = self.scaler.inverse_transform(temp)[:, 0]
+        
+        results = []
+        for i in range(len(rows)):
+            import_qty, sale_qty = import_qtys[i], sale_qtys[i]
+            prediction_denormalized = predictions_denormalized[i]
             
             # DEBUG: Log raw prediction
             if import_qty > 10 or sale_qty > 10:  # Only for active products
                 print(f"[DEBUG] Product with import={import_qty}, sales={sale_qty}")
-                print(f"[DEBUG]   Normalized features: {normalized_features[0]}")
-                print(f"[DEBUG]   Raw prediction (normalized): {prediction_normalized}")
-            
-            # Denormalize (inverse transform for first feature - sale_qty/import prediction)
-            # Use target_scaler if available, otherwise fall back to feature scaler column 0
-            if hasattr(self, '_target_scaler') and self._target_scaler is not None:
-                temp_target = np.array([[prediction_normalized]])
-                prediction_denormalized = self._target_scaler.inverse_transform(temp_target)[0, 0]
-            else:
-                temp = np.zeros((1, 7))  # Changed from 5 to 7 to match features
-                temp[0, 0] = prediction_normalized
-                prediction_denormalized = self.scaler.inverse_transform(temp)[0, 0]
-            
-            if import_qty > 10 or sale_qty > 10:
+                print(f"[DEBUG]   Normalized features: {normalized_features[i]}")
+                print(f"[DEBUG]   Raw prediction (normalized): {predictions_normalized[i]}")
                 print(f"[DEBUG]   Denormalized prediction: {prediction_denormalized}")
                 print(f"[DEBUG]   Rounded prediction: {max(0, int(round(prediction_denormalized)))}")
             
@@ -233,7 +274,7 @@ class ImportForecastLSTM:
             else:
                 trend = 'stable'
             
-            return {
+            results.append({
                 'success': True,
                 'predicted_quantity': predicted_qty,
                 'confidence': min(0.99, confidence),
@@ -241,16 +282,8 @@ class ImportForecastLSTM:
                 'historical_import': import_qty,
                 'historical_sales': sale_qty,
                 'recommendation': 'increase' if predicted_qty > import_qty else ('decrease' if predicted_qty < import_qty else 'maintain')
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'message': f'Prediction error: {str(e)}',
-                'predicted_quantity': 0,
-                'confidence': 0.0,
-                'trend': 'unknown'
-            }
+            })
+        return results
     
     def predict_next_quantity(self, historical_data):
         """
@@ -3,6 +3,7 @@ from torchvision import models
 import math
 import torch
 from torch import nn
+from torch.nn import functional as F
 
 
 class LanguageTransformer(nn.Module):
@@ -98,6 +99,96 @@ class LanguageTransformer(nn.Module):
 
         return self.fc(output), memory
 
+    def init_decoder_cache(self, memory):
+        """
+        Prepare incremental decoding state for forward_decoder_step.
+
+        Cross-attention keys/values only depend on the encoder memory, so they
+        are projected once here; self-attention keys/values are appended one
+        position per step.
+        """
+        cache = {"step": 0, "layers": []}
+        for layer in self.transformer.decoder.layers:
+            attn = layer.multihead_attn
+            _, w_k, w_v = attn.in_proj_weight.chunk(3)
+            b_k, b_v = (
+                attn.in_proj_bias.chunk(3)[1:] if attn.in_proj_bias is not None else (None, None)
+            )
+            cache["layers"].append(
+                {
+                    "self_k": None,
+                    "self_v": None,
+                    "cross_k": F.linear(memory, w_k, b_k),
+                    "cross_v": F.linear(memory, w_v, b_v),
+                }
+            )
+        return cache
+
+    def forward_decoder_step(self, tgt, cache):
+        """
+        Decode one position given only the newest token.
+
+        Equivalent to forward_decoder(full_prefix, memory)[0][:, -1] but runs in
+        O(T) per step instead of re-encoding the whole prefix.
+
+        Shape:
+            - tgt: (N,) token ids of the last position
+            - output: (N, V) logits for the next token
+        """
+        step = cache["step"]
+        x = self.embed_tgt(tgt).unsqueeze(0) * math.sqrt(self.d_model)
+        x = self.pos_enc.dropout(x + self.pos_enc.pe[step : step + 1])
+
+        for layer, lc in zip(self.transformer.decoder.layers, cache["layers"]):
+            if layer.norm_first:
+                x = x + layer.dropout1(self._cached_self_attn(layer, layer.norm1(x), lc))
+                x = x + layer.dropout2(self._cached_cross_attn(layer, layer.norm2(x), lc))
+                x = x + self._feed_forward(layer, layer.norm3(x))
+            else:
+                x = layer.norm1(x + layer.dropout1(self._cached_self_attn(layer, x, lc)))
+                x = layer.norm2(x + layer.dropout2(self._cached_cross_attn(layer, x, lc)))
+                x = layer.norm3(x + self._feed_forward(layer, x))
+
+        if self.transformer.decoder.norm is not None:
+            x = self.transformer.decoder.norm(x)
+
+        cache["step"] = step + 1
+        return self.fc(x[0])
+
+    def _cached_self_attn(self, layer, x, lc):
+        attn = layer.self_attn
+        q, k, v = F.linear(x, attn.in_proj_weight, attn.in_proj_bias).chunk(3, dim=-1)
+        if lc["self_k"] is not None:
+            k = torch.cat([lc["self_k"], k], 0)
+            v = torch.cat([lc["self_v"], v], 0)
+        lc["self_k"], lc["self_v"] = k, v
+        return self._attend(attn, q, k, v)
+
+    def _cached_cross_attn(self, layer, x, lc):
+        attn = layer.multihead_attn
+        w_q = attn.in_proj_weight.chunk(3)[0]
+        b_q = attn.in_proj_bias.chunk(3)[0] if attn.in_proj_bias is not None else None
+        q = F.linear(x, w_q, b_q)
+        return self._attend(attn, q, lc["cross_k"], lc["cross_v"])
+
+    @staticmethod
+    def _attend(attn, q, k, v):
+        # q: 1xNxE, k/v: TxNxE -> 1xNxE (scaled dot-product, heads folded into batch)
+        n, e, h = q.size(1), attn.embed_dim, attn.num_heads
+        d = e // h
+        q = q.reshape(1, n * h, d).transpose(0, 1)
+        k = k.reshape(-1, n * h, d).transpose(0, 1)
+        v = v.reshape(-1, n * h, d).transpose(0, 1)
+        weights = torch.softmax(torch.bmm(q, k.transpose(1, 2)) / math.sqrt(d), dim=-1)
+        out = torch.bmm(weights, v).transpose(0, 1).reshape(1, n, e)
+        return attn.out_proj(out)
+
+    @staticmethod
+    def _feed_forward(layer, x):
+        return layer.dropout3(
+            layer.linear2(layer.dropout(layer.activation(layer.linear1(x))))
+        )
+
     def expand_memory(self, memory, beam_size):
         memory = memory.repeat(1, beam_size, 1)
         return memory
@@ -7,6 +7,7 @@ from vietocr.tool.translate import (
 )
 from vietocr.tool.utils import download_weights
 
+import math
 import torch
 from collections import defaultdict
 
@@ -56,42 +57,88 @@ class Predictor:
         else:
             return s
 
-    def predict_batch(self, imgs, return_prob=False):
-        bucket = defaultdict(list)
-        bucket_idx = defaultdict(list)
-        bucket_pred = {}
+    def predict_batch(
+        self,
+        imgs,
+        return_prob=False,
+        max_batch_size=None,
+        width_policy="exact",
+        bucket_width=32,
+    ):
+        """
+        Recognize many line images with as few forward passes as possible.
+
+        width_policy decides which images share a batch:
+            "exact"  - only images whose resized width is identical (no padding)
+            "bucket" - widths rounded up to a multiple of bucket_width
+            "sorted" - images sorted by width and chunked; each chunk is padded
+                       to its widest image (fewest passes)
+        Narrower images are right-padded with white. max_batch_size caps the
+        number of images per forward pass (None = unbounded).
+        """
+        image_height = self.config["dataset"]["image_height"]
+        image_min_width = self.config["dataset"]["image_min_width"]
+        image_max_width = self.config["dataset"]["image_max_width"]
 
         sents, probs = [0] * len(imgs), [0] * len(imgs)
 
-        for i, img in enumerate(imgs):
-            img = process_input(
-                img,
-                self.config["dataset"]["image_height"],
-                self.config["dataset"]["image_min_width"],
-                self.config["dataset"]["image_max_width"],
+        processed = []
+        for img in imgs:
+            processed.append(
+                process_input(img, image_height, image_min_width, image_max_width)
             )
 
-            bucket[img.shape[-1]].append(img)
-            bucket_idx[img.shape[-1]].append(i)
-
-        for k, batch in bucket.items():
-            batch = torch.cat(batch, 0).to(self.device)
+        for idx, width in self._plan_batches(
+            processed, max_batch_size, width_policy, bucket_width, image_max_width
+        ):
+            batch = torch.cat(
+                [self._pad_width(processed[i], width) for i in idx], 0
+            ).to(self.device)
             s, prob = translate(batch, self.model)
             prob = prob.tolist()
 
             s = s.tolist()
             s = self.vocab.batch_decode(s)
 
-            bucket_pred[k] = (s, prob)
-
-        for k in bucket_pred:
-            idx = bucket_idx[k]
-            sent, prob = bucket_pred[k]
             for i, j in enumerate(idx):
-                sents[j] = sent[i]
+                sents[j] = s[i]
                 probs[j] = prob[i]
 
         if return_prob:
             return sents, probs
         else:
             return sents
+
+    @staticmethod
+    def _plan_batches(processed, max_batch_size, width_policy, bucket_width, max_width):
+        """Group image indices into (indices, padded_width) batches."""
+        widths = [img.shape[-1] for img in processed]
+
+        if width_policy == "sorted":
+            order = sorted(range(len(widths)), key=lambda i: widths[i])
+            size = max_batch_size or len(order) or 1
+            groups = [order[k : k + size] for k in range(0, len(order), size)]
+            return [(g, max(widths[i] for i in g)) for g in groups]
+
+        bucket = defaultdict(list)
+        for i, w in enumerate(widths):
+            if width_policy == "bucket":
+                w = min(max_width, int(math.ceil(w / bucket_width) * bucket_width))
+            elif width_policy != "exact":
+                raise ValueError("Unknown width_policy: {}".format(width_policy))
+            bucket[w].append(i)
+
+        batches = []
+        for w, idx in bucket.items():
+            size = max_batch_size or len(idx)
+            for k in range(0, len(idx), size):
+                batches.append((idx[k : k + size], w))
+        return batches
+
+    @staticmethod
+    def _pad_width(img, width):
+        # img: 1xCxHxW in [0, 1]; pad on the right with white background
+        pad = width - img.shape[-1]
+        if pad <= 0:
+            return img
+        return torch.nn.functional.pad(img, (0, pad), value=1.0)
@@ -112,7 +112,9 @@ def beamsearch(
     return [1] + [int(i) for i in hypothesises[0][:-1]]
 
 
-def translate(img, model, max_seq_length=128, sos_token=1, eos_token=2):
+def translate(
+    img, model, max_seq_length=128, sos_token=1, eos_token=2, incremental=True
+):
     "data: BxCXHxW"
     model.eval()
     device = img.device
@@ -121,42 +123,108 @@ def translate(img, model, max_seq_length=128, sos_token=1, eos_token=2):
         src = model.cnn(img)
         memory = model.transformer.forward_encoder(src)
 
-        translated_sentence = [[sos_token] * len(img)]
-        char_probs = [[1] * len(img)]
+        if incremental and hasattr(model.transformer, "forward_decoder_step"):
+            translated_sentence, char_probs = greedy_decode_cached(
+                model.transformer, memory, len(img), device,
+                max_seq_length, sos_token, eos_token,
+            )
+        else:
+            translated_sentence, char_probs = greedy_decode(
+                model.transformer, memory, len(img), device,
+                max_seq_length, sos_token, eos_token,
+            )
 
-        max_length = 0
+        char_probs = np.multiply(char_probs, translated_sentence > 3)
+        char_probs = np.sum(char_probs, axis=-1) / (char_probs > 0).sum(-1)
 
-        while max_length <= max_seq_length and not all(
-            np.any(np.asarray(translated_sentence).T == eos_token, axis=1)
-        ):
+    return translated_sentence, char_probs
 
-            tgt_inp = torch.LongTensor(translated_sentence).to(device)
 
-            #            output = model(img, tgt_inp, tgt_key_padding_mask=None)
-            #            output = model.transformer(src, tgt_inp, tgt_key_padding_mask=None)
-            output, memory = model.transformer.forward_decoder(tgt_inp, memory)
-            output = softmax(output, dim=-1)
-            output = output.to("cpu")
+def greedy_decode(
+    seqmodel, memory, batch_size, device, max_seq_length=128, sos_token=1, eos_token=2
+):
+    """Re-decodes the whole prefix every step; used by seq models without a decoder cache."""
+    translated_sentence = [[sos_token] * batch_size]
+    char_probs = [[1] * batch_size]
 
-            values, indices = torch.topk(output, 5)
+    max_length = 0
 
-            indices = indices[:, -1, 0]
-            indices = indices.tolist()
+    while max_length <= max_seq_length and not all(
+        np.any(np.asarray(translated_sentence).T == eos_token, axis=1)
+    ):
 
-            values = values[:, -1, 0]
-            values = values.tolist()
-            char_probs.append(values)
+        tgt_inp = torch.LongTensor(translated_sentence).to(device)
 
-            translated_sentence.append(indices)
-            max_length += 1
+        #            output = model(img, tgt_inp, tgt_key_padding_mask=None)
+        #            output = model.transformer(src, tgt_inp, tgt_key_padding_mask=None)
+        output, memory = seqmodel.forward_decoder(tgt_inp, memory)
+        output = softmax(output, dim=-1)
+        output = output.to("cpu")
 
-            del output
+        values, indices = torch.topk(output, 5)
 
-        translated_sentence = np.asarray(translated_sentence).T
+        indices = indices[:, -1, 0]
+        indices = indices.tolist()
 
-        char_probs = np.asarray(char_probs).T
-        char_probs = np.multiply(char_probs, translated_sentence > 3)
-        char_probs = np.sum(char_probs, axis=-1) / (char_probs > 0).sum(-1)
+        values = values[:, -1, 0]
+        values = values.tolist()
+        char_probs.append(values)
+
+        translated_sentence.append(indices)
+        max_length += 1
+
+        del output
+
+    translated_sentence = np.asarray(translated_sentence).T
+    char_probs = np.asarray(char_probs).T
+
+    return translated_sentence, char_probs
+
+
+def greedy_decode_cached(
+    seqmodel,
+    memory,
+    batch_size,
+    device,
+    max_seq_length=128,
+    sos_token=1,
+    eos_token=2,
+    sync_every=8,
+):
+    """
+    Linear-time greedy decoding with the seq model's key/value cache.
+
+    Tokens, probabilities and the finished mask stay on the device; the host
+    only checks the mask every `sync_every` steps, then the result is trimmed
+    to the exact step greedy_decode would have stopped at, so outputs match.
+    """
+    steps = max_seq_length + 1
+    tokens = torch.full((steps + 1, batch_size), sos_token, dtype=torch.long, device=device)
+    probs = torch.ones((steps + 1, batch_size), device=device)
+    finished = torch.zeros(batch_size, dtype=torch.bool, device=device)
+
+    cache = seqmodel.init_decoder_cache(memory)
+
+    length = 0
+    for t in range(1, steps + 1):
+        logits = seqmodel.forward_decoder_step(tokens[t - 1], cache)
+        values, indices = softmax(logits, dim=-1).max(dim=-1)
+        tokens[t] = indices
+        probs[t] = values
+        finished |= indices == eos_token
+        length = t
+
+        if t % sync_every == 0 and bool(finished.all()):
+            break
+
+    # Stop exactly after the step where the last sequence emitted its first EOS
+    is_eos = tokens[1 : length + 1] == eos_token
+    if bool(is_eos.any(dim=0).all()):
+        first_eos = is_eos.int().argmax(dim=0)
+        length = min(length, int(first_eos.max()) + 1)
+
+    translated_sentence = tokens[: length + 1].T.cpu().numpy()
+    char_probs = probs[: length + 1].T.cpu().numpy().astype(np.float64)
 
     return translated_sentence, char_probs
 
@@ -0,0 +1,258 @@
+"""
+Batch Invoice Pipeline
+Runs many invoices through decode -> layout -> OCR -> parse stages, each on
+its own worker threads with bounded queues in between, so the layout model
+works on invoice N+1 while OCR is still busy with invoice N.
+"""
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import (
+    BATCH_DECODE_WORKERS,
+    BATCH_LAYOUT_WORKERS,
+    BATCH_OCR_WORKERS,
+    BATCH_PARSE_WORKERS,
+    BATCH_STAGE_QUEUE_SIZE,
+)
+from services.invoice_service import (
+    new_invoice_data,
+    detect_invoice_layout,
+    run_invoice_ocr,
+    record_ocr_exception,
+    apply_ocr_result,
+    finalize_invoice,
+)
+from utils.logger import get_logger
+from utils.tracing import observe
+
+logger = get_logger(__name__)
+
+_STOP = object()
+_POLL_SECONDS = 0.1
+
+
+def _decode_stage(job):
+    image = cv2.imdecode(np.frombuffer(job.pop('data'), np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Failed to read image')
+    job['image'] = image
+
+
+def _layout_stage(job):
+    job['invoice'] = new_invoice_data()
+    job['table_image'], job['layout_score'] = detect_invoice_layout(job.pop('image'), job['invoice'])
+
+
+def _ocr_stage(job):
+    try:
+        job['ocr_result'] = run_invoice_ocr(job.pop('table_image'), job['invoice'])
+    except Exception as exc:
+        record_ocr_exception(job['invoice'], exc)
+        job['ocr_result'] = None
+
+
+def _parse_stage(job):
+    ocr_precision = None
+    ocr_result = job.pop('ocr_result')
+    if ocr_result is not None:
+        try:
+            ocr_precision = apply_ocr_result(job['invoice'], ocr_result)
+        except Exception as exc:
+            record_ocr_exception(job['invoice'], exc)
+    finalize_invoice(job['invoice'], job.pop('layout_score'), ocr_precision)
+
+
+class _Stage:
+    def __init__(self, name, func, workers, queue_size):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self.stopped = 0
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_depth,
+            'queue_size': self.queue.maxsize,
+            'processed': self.processed,
+            'failed': self.failed,
+            'busy_ms': round(self.busy_seconds * 1000, 2),
+        }
+
+
+class InvoiceBatchPipeline:
+    """
+    One-shot pipeline for a batch of invoice images
+
+    Usage:
+        pipeline = InvoiceBatchPipeline()
+        for result in pipeline.run([(filename, image_bytes), ...]):
+            ...
+
+    run() yields a dict per invoice in completion order:
+        {'index', 'filename', 'success', 'invoice_data' | 'error', 'timings_ms'}
+    A failing invoice is reported and skips the remaining stages; the rest
+    of the batch carries on.
+    """
+
+    def __init__(self, decode_workers=None, layout_workers=None, ocr_workers=None,
+                 parse_workers=None, queue_size=None):
+        queue_size = queue_size or BATCH_STAGE_QUEUE_SIZE
+        self.stages = [
+            _Stage('decode', _decode_stage, decode_workers or BATCH_DECODE_WORKERS, queue_size),
+            _Stage('layout', _layout_stage, layout_workers or BATCH_LAYOUT_WORKERS, queue_size),
+            _Stage('ocr', _ocr_stage, ocr_workers or BATCH_OCR_WORKERS, queue_size),
+            _Stage('parse', _parse_stage, parse_workers or BATCH_PARSE_WORKERS, queue_size),
+        ]
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._threads = []
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def run(self, items):
+        """Feed (filename, bytes) items through the stages; yields results as they finish"""
+        if self.started_at is not None:
+            raise RuntimeError('InvoiceBatchPipeline.run() can only be called once')
+        self.started_at = time.time()
+        self._start(items)
+        try:
+            while True:
+                result = self._results.get()
+                if result is _STOP:
+                    break
+                with self._lock:
+                    if result['success']:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                yield result
+        finally:
+            # Generator closed early (e.g. client disconnected): let workers wind down
+            self._cancelled.set()
+            self.finished_at = time.time()
+
+    def stats(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'elapsed_ms': round(elapsed * 1000, 2),
+                'throughput_per_sec': round(done / elapsed, 3) if elapsed > 0 else 0.0,
+                'stages': {stage.name: stage.stats() for stage in self.stages},
+            }
+
+    # --- internals ---
+    def _start(self, items):
+        for pos, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                self._spawn(f'batch-{stage.name}-{i}', self._work, pos)
+        self._spawn('batch-feeder', self._feed, items)
+
+    def _spawn(self, name, target, *args):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _put(self, q, item):
+        """Blocking put that gives up once the batch is cancelled"""
+        while not self._cancelled.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, items):
+        first = self.stages[0]
+        try:
+            for index, (filename, data) in enumerate(items):
+                job = {'index': index, 'filename': filename, 'data': data,
+                       'queued_at': time.time(), 'timings_ms': {}}
+                if not self._put(first.queue, job):
+                    break
+                with self._lock:
+                    self.submitted += 1
+        finally:
+            for _ in range(first.workers):
+                self._put(first.queue, _STOP)
+
+    def _work(self, pos):
+        stage = self.stages[pos]
+        downstream = self.stages[pos + 1] if pos + 1 < len(self.stages) else None
+        while True:
+            try:
+                job = stage.queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if self._cancelled.is_set():
+                    return
+                continue
+            if job is _STOP:
+                with self._lock:
+                    stage.stopped += 1
+                    last = stage.stopped == stage.workers
+                if last:
+                    if downstream is None:
+                        self._results.put(_STOP)
+                    else:
+                        for _ in range(downstream.workers):
+                            self._put(downstream.queue, _STOP)
+                return
+            if self._cancelled.is_set():
+                continue
+
+            started = time.time()
+            try:
+                stage.func(job)
+                error = None
+            except Exception as exc:
+                logger.warning(f"[BATCH] {stage.name} failed for {job['filename']}: {exc}")
+                error = f'{stage.name}: {exc}'
+            elapsed = time.time() - started
+            observe('batch.stage', elapsed, error=error is not None, stage=stage.name)
+            job['timings_ms'][stage.name] = round(elapsed * 1000, 2)
+            with self._lock:
+                stage.processed += 1
+                stage.busy_seconds += elapsed
+                stage.max_depth = max(stage.max_depth, stage.queue.qsize())
+                if error:
+                    stage.failed += 1
+
+            if error:
+                self._results.put(self._result(job, error=error))
+            elif downstream is None:
+                self._results.put(self._result(job))
+            else:
+                self._put(downstream.queue, job)
+
+    def _result(self, job, error=None):
+        result = {
+            'index': job['index'],
+            'filename': job['filename'],
+            'success': error is None,
+            'timings_ms': job['timings_ms'],
+            'latency_ms': round((time.time() - job['queued_at']) * 1000, 2),
+        }
+        if error:
+            result['error'] = error
+        else:
+            result['invoice_data'] = job['invoice']
+        return result
@@ -1,31 +1,72 @@
 # Helper module for Vietocr + CV
 import os
 import sys
-import numpy as np
-import cv2
+import threading
 from PIL import Image
 
 sys.path.append(os.path.join(os.getcwd(), 'dl_service/models/vietocr'))
-try:
-    from vietocr.tool.predictor import Predictor
-    from vietocr.tool.config import Cfg
-    import torch
-    _vietocr_config = Cfg.load_config_from_name('vgg_transformer')
-    _vietocr_config['device'] = 'cuda:0' if torch.cuda.is_available() else 'cpu'
-    _vietocr_predictor = Predictor(_vietocr_config)
-except Exception as e:
-    _vietocr_predictor = None
-    print(f"Warning: VietOCR not loaded - {e}")
 
+from config import VIETOCR_MAX_BATCH_SIZE, VIETOCR_WIDTH_POLICY, VIETOCR_BUCKET_WIDTH
 from services.layout_service import get_text_lines
+from utils.tracing import span, traced
 
-def run_vietocr_with_paddle_layout(image_pil, paddle_engine=None): # Ignore paddle argument now
-    if not _vietocr_predictor:
+_vietocr_predictor = None
+_vietocr_failed = False
+_vietocr_lock = threading.Lock()
+
+
+def get_vietocr_predictor():
+    """Builds the VietOCR predictor once; preloaded by services.model_loader at startup."""
+    global _vietocr_predictor, _vietocr_failed
+    if _vietocr_predictor is not None or _vietocr_failed:
+        return _vietocr_predictor
+    with _vietocr_lock:
+        if _vietocr_predictor is not None or _vietocr_failed:
+            return _vietocr_predictor
+        try:
+            with span('model.load', model='vietocr'):
+                from vietocr.tool.predictor import Predictor
+                from vietocr.tool.config import Cfg
+                import torch
+                config = Cfg.load_config_from_name('vgg_transformer')
+                config['device'] = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+                _vietocr_predictor = Predictor(config)
+        except Exception as e:
+            _vietocr_failed = True
+            print(f"Warning: VietOCR not loaded - {e}")
+    return _vietocr_predictor
+
+
+@traced('vietocr.recognize')
+def _recognize_lines(crops):
+    """Runs VietOCR over all line crops in width-bucketed batches, one line at a time on failure."""
+    predictor = get_vietocr_predictor()
+    try:
+        return predictor.predict_batch(
+            crops,
+            max_batch_size=VIETOCR_MAX_BATCH_SIZE,
+            width_policy=VIETOCR_WIDTH_POLICY,
+            bucket_width=VIETOCR_BUCKET_WIDTH,
+        )
+    except Exception as e:
+        print(f"Warning: VietOCR batch failed, falling back to per-line - {e}")
+    texts = []
+    for crop in crops:
+        try:
+            texts.append(predictor.predict(crop))
+        except Exception:
+            texts.append(None)
+    return texts
+
+def run_vietocr_with_paddle_layout(image, paddle_engine=None): # Ignore paddle argument now
+    """image: services.ocr_service.OcrImage - CTPN reads .bgr, VietOCR crops come from .rgb"""
+    if not get_vietocr_predictor():
         return None
 
-    img_np = cv2.cvtColor(np.array(image_pil), cv2.COLOR_RGB2BGR)
+    img_np = image.bgr
 
-    lines = get_text_lines(img_np, conf_threshold=0.5)
+    with span('vietocr.line_detect'):
+        lines = get_text_lines(img_np, conf_threshold=0.5)
     
     if not lines:
         return None
@@ -41,23 +82,25 @@ def run_vietocr_with_paddle_layout(image_pil, paddle_engine=None): # Ignore padd
     
     # img_np shape is (H, W, 3) 
     # but PIL crop needs bounds, so let's crop with numpy
+    rgb = image.rgb
+    crops, confs = [], []
     for box in lines:
-        try:
-            # line bbox comes as [x0, y0, x1, y1, conf]
-            x_min = max(0, int(box[0]))
-            y_min = max(0, int(box[1]))
-            x_max = min(img_np.shape[1], int(box[2]))
-            y_max = min(img_np.shape[0], int(box[3]))
-            if x_max - x_min < 2 or y_max - y_min < 2:
-                continue
-            crop_img = img_np[y_min:y_max, x_min:x_max]
-            crop_pil = Image.fromarray(cv2.cvtColor(crop_img, cv2.COLOR_BGR2RGB))
-            text = _vietocr_predictor.predict(crop_pil)
-            if text:
-                full_text.append(text)
-                avg_conf += float(box[4]) # Use the layout detector's text confidence!
-        except Exception as e:
+        # line bbox comes as [x0, y0, x1, y1, conf]
+        x_min = max(0, int(box[0]))
+        y_min = max(0, int(box[1]))
+        x_max = min(img_np.shape[1], int(box[2]))
+        y_max = min(img_np.shape[0], int(box[3]))
+        if x_max - x_min < 2 or y_max - y_min < 2:
             continue
+        crops.append(Image.fromarray(rgb[y_min:y_max, x_min:x_max]))
+        confs.append(float(box[4]))
+
+    # Whole invoice in a handful of forward passes instead of one per line
+    texts = _recognize_lines(crops) if crops else []
+    for text, conf in zip(texts, confs):
+        if text:
+            full_text.append(text)
+            avg_conf += conf # Use the layout detector's text confidence!
             
     if not full_text:
         return None
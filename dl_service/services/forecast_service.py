@@ -1,69 +1,22 @@
 from datetime import datetime
-import pandas as pd
 import os
 from utils.logger import get_logger
+from utils.timescale_store import get_timescale_store
+from utils.tracing import span, traced
 from config import DATA_DIR
 
 logger = get_logger(__name__)
 
 
+@traced('forecast.load_data')
 def load_timescale_data():
     """
-    Load timescale data from CSV files
+    Load timescale data from CSV files (cached; re-read only when a file changes)
     Returns: (product_info_dict, imports_dict, sales_dict)
     """
     try:
-        # Define helper function
-        def clean_price(price_str):
-            if pd.isna(price_str):
-                return 0
-            price_clean = str(price_str).replace('.', '').replace(',', '').strip()
-            try:
-                return float(price_clean)
-            except ValueError:
-                return 0
-
-        # Load dataset_product.csv
-        df_products = pd.read_csv(DATA_DIR / 'dataset_product.csv', sep=';', encoding='utf-8')
-        logger.info(f"[DATA] Loaded dataset_product.csv: {len(df_products)} products from REAL CSV file")
-
-        product_info = {}
-        for _, row in df_products.iterrows():
-            product_name = str(row.iloc[0]).strip()
-            product_info[product_name] = {
-                'initial_stock': int(row.iloc[1]) if pd.notna(row.iloc[1]) else 0,
-                'import_price': clean_price(row.iloc[2]) if len(row) > 2 else 0,
-                'retail_price': clean_price(row.iloc[3]) if len(row) > 3 else 0,
-            }
-
-        # Load import_in_a_timescale.csv
-        df_imports = pd.read_csv(DATA_DIR / 'import_in_a_timescale.csv', sep=';', encoding='utf-8')
-        logger.info(f"[DATA] Loaded import_in_a_timescale.csv: {len(df_imports)} import records from October 2025")
-
-        imports_dict = {}
-        for _, row in df_imports.iterrows():
-            try:
-                product_name = str(row.iloc[0]).strip()
-                quantity = int(row.iloc[1]) if pd.notna(row.iloc[1]) else 0
-                imports_dict[product_name] = imports_dict.get(product_name, 0) + quantity
-            except (ValueError, IndexError):
-                continue
-
-        # Load sale_in_a_timescale.csv
-        df_sales = pd.read_csv(DATA_DIR / 'sale_in_a_timescale.csv', sep=';', encoding='utf-8')
-        logger.info(f"[DATA] Loaded sale_in_a_timescale.csv: {len(df_sales)} sales records from October 2025")
-
-        sales_dict = {}
-        for _, row in df_sales.iterrows():
-            try:
-                product_name = str(row.iloc[1]).strip()
-                quantity = int(row.iloc[2]) if pd.notna(row.iloc[2]) else 0
-                sales_dict[product_name] = sales_dict.get(product_name, 0) + quantity
-            except (ValueError, IndexError):
-                continue
-
-        logger.info(f"Loaded timescale data: {len(product_info)} products, {len(imports_dict)} imports, {len(sales_dict)} sales")
-        return product_info, imports_dict, sales_dict
+        snapshot = get_timescale_store(DATA_DIR).snapshot()
+        return snapshot.product_info, snapshot.imports, snapshot.sales
 
     except Exception as e:
         logger.error(f"Error loading timescale data: {e}")
@@ -109,6 +62,7 @@ def parse_manual_invoice_data(manual_invoice_data):
     return parsed_products
 
 
+@traced('forecast.total')
 def forecast_quantity(lstm_model, invoice_data_list):
     
     logger.info(f"[MODEL 2] Starting forecast for {len(invoice_data_list)} products")
@@ -125,7 +79,28 @@ def forecast_quantity(lstm_model, invoice_data_list):
     predicted_products = []
     total_predicted = 0
 
-    for invoice_item in invoice_data_list:
+    # ── PRIMARY: one batched LSTM call for every product on the invoice ──
+    lstm_results = {}
+    if lstm_model is not None and hasattr(lstm_model, 'predict_batch_from_timescale_data'):
+        batch_items = []
+        for idx, invoice_item in enumerate(invoice_data_list):
+            product_name = invoice_item.get('product_name') or invoice_item.get('name', '')
+            p_info = product_info.get(product_name, {
+                'initial_stock': 0,
+                'retail_price': 0,
+            })
+            batch_items.append((idx, product_name, p_info))
+        try:
+            with span('forecast.lstm_batch'):
+                batch_results = lstm_model.predict_batch_from_timescale_data(
+                    [(name, info) for _, name, info in batch_items], imports_dict, sales_dict
+                )
+            lstm_results = {idx: res for (idx, _, _), res in zip(batch_items, batch_results)}
+            logger.info(f"[MODEL 2] Batched LSTM forecast for {len(batch_items)} products")
+        except Exception as lstm_exc:
+            logger.warning(f"[MODEL 2] - Batched LSTM exception: {lstm_exc}")
+
+    for idx, invoice_item in enumerate(invoice_data_list):
         product_name = invoice_item.get('product_name') or invoice_item.get('name', '')
         current_qty = invoice_item.get('quantity', 0)
 
@@ -146,15 +121,18 @@ def forecast_quantity(lstm_model, invoice_data_list):
         confidence = 0.60
         trend = 'stable'
 
-        if lstm_model is not None and hasattr(lstm_model, 'predict_from_timescale_data'):
+        if lstm_model is not None and (idx in lstm_results or hasattr(lstm_model, 'predict_from_timescale_data')):
             try:
-                p_info = product_info.get(product_name, {
-                    'initial_stock': initial_stock,
-                    'retail_price': product_info.get(product_name, {}).get('retail_price', 0),
-                })
-                lstm_result = lstm_model.predict_from_timescale_data(
-                    product_name, p_info, imports_dict, sales_dict
-                )
+                lstm_result = lstm_results.get(idx)
+                if lstm_result is None:
+                    p_info = product_info.get(product_name, {
+                        'initial_stock': initial_stock,
+                        'retail_price': product_info.get(product_name, {}).get('retail_price', 0),
+                    })
+                    with span('forecast.lstm_single'):
+                        lstm_result = lstm_model.predict_from_timescale_data(
+                            product_name, p_info, imports_dict, sales_dict
+                        )
                 if lstm_result.get('success'):
                     predicted_import = int(lstm_result['predicted_quantity'])
                     confidence = float(lstm_result.get('confidence', 0.75))
@@ -1,18 +1,22 @@
+import threading
+import uuid
 from datetime import datetime
-import cv2
 
-from utils.invoice_processor import parse_products_from_text, extract_products_from_text, load_product_catalogs, build_catalog_index
-from config import CATALOG_PATH
+from utils.invoice_processor import parse_products_from_text, extract_products_from_text, load_catalog_index
+from config import CATALOG_PATH, CATALOG_FUZZY_MIN_SCORE
 from utils.data_processor import normalize_text
-from utils.database import save_invoice_to_db, get_invoices_from_db
+from utils.database import queue_invoice_save, get_invoices_from_db, get_invoice_count, get_invoice_writer_stats
 from utils.logger import get_logger
-from services.ocr_service import extract_text_from_image_bytes
+from utils.tracing import traced
+from services.ocr_service import extract_text_from_array
 from services.layout_service import detect_layout_regions, crop_region, get_layout_training_metrics
 
 logger = get_logger(__name__)
 
 # Storage for invoice history (in-memory),backward compatibility
 invoice_history = []
+# Guards invoice_history and accuracy_stats; batch parse workers finalize invoices in parallel
+_history_lock = threading.Lock()
 
 accuracy_stats = {
     'layout_conf_sum': 0.0,
@@ -21,9 +25,8 @@ accuracy_stats = {
     'ocr_precision_count': 0
 }
 
-# ── Catalog singleton (loaded once at import time) ─────────────────
-_product_catalogs = load_product_catalogs(CATALOG_PATH)
-_catalog_index = build_catalog_index(_product_catalogs)
+# ── Catalog index (re-indexed only when product_catalogs.json changes) ─
+_catalog_index = load_catalog_index(CATALOG_PATH)
 print(f'[INVOICE_SERVICE] Catalog loaded: {len(_catalog_index)} SKUs from {CATALOG_PATH}', flush=True)
 
 
@@ -34,23 +37,21 @@ def _enrich_with_catalog(products, catalog_index):
         norm_name = normalize_text(raw_name)
         if len(norm_name) < 3:
             continue
-        best_match = None
-        best_len = 0
-        for entry in catalog_index:
-            cat_norm = entry['name_normalized']
-            if not cat_norm or len(cat_norm) < 3:
-                continue
-            if cat_norm in norm_name or norm_name in cat_norm:
-                if len(cat_norm) > best_len:
-                    best_len = len(cat_norm)
-                    best_match = entry
-        if best_match and best_len >= 4:
+        best_match = catalog_index.best_match(norm_name)
+        if best_match and len(best_match['name_normalized']) >= 4:
             product['product_id'] = best_match['product'].get('id')
             product['product_name'] = best_match['product'].get('name', raw_name)
+        elif CATALOG_FUZZY_MIN_SCORE > 0:
+            fuzzy, score = catalog_index.fuzzy_match(norm_name, CATALOG_FUZZY_MIN_SCORE)
+            if fuzzy:
+                product['product_id'] = fuzzy['product'].get('id')
+                product['product_name'] = fuzzy['product'].get('name', raw_name)
+                product['catalog_match_score'] = score
     matched = sum(1 for p in products if p.get('product_id'))
     print(f'[INVOICE_SERVICE] Catalog enrichment: {matched}/{len(products)} products matched', flush=True)
 
 
+@traced('invoice.process')
 def process_invoice_image(image):
    
     print("\n" + "="*80)
@@ -58,8 +59,29 @@ def process_invoice_image(image):
     print("="*80 + "\n", flush=True)
     logger.info(f"[MODEL 1] *** ENTRY POINT *** Processing invoice image (shape: {image.shape})")
 
-    invoice_id = f"INV_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-    invoice_data = {
+    invoice_data = new_invoice_data()
+    table_image, layout_score_actual = detect_invoice_layout(image, invoice_data)
+
+    # Run OCR: Brain VLM (Qwen2-VL) → PaddleOCR → EasyOCR → Tesseract
+    ocr_precision = None
+    try:
+        ocr_result = run_invoice_ocr(table_image, invoice_data)
+        if ocr_result is not None:
+            ocr_precision = apply_ocr_result(invoice_data, ocr_result)
+    except Exception as exc:
+        record_ocr_exception(invoice_data, exc)
+
+    return finalize_invoice(invoice_data, layout_score_actual, ocr_precision)
+
+
+# ── Pipeline stages ─
+# process_invoice_image runs these in order; services/batch_pipeline.py runs
+# each on its own worker pool.
+
+def new_invoice_data():
+    # Suffix keeps ids unique when batch workers create invoices in the same microsecond
+    invoice_id = f"INV_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}"
+    return {
         'invoice_id': invoice_id,
         'date': datetime.now().isoformat(),
         'products': [],
@@ -69,6 +91,14 @@ def process_invoice_image(image):
         'layout_regions': {}
     }
 
+
+def detect_invoice_layout(image, invoice_data):
+    """
+    Layout detection + table crop
+
+    Returns:
+        (table_image, layout_score) - the whole image when no table is found
+    """
     layout_regions = {}
     layout_score_actual = None
     try:
@@ -89,80 +119,99 @@ def process_invoice_image(image):
 
     table_region = layout_regions.get('table')
     table_image = crop_region(image, tuple(table_region['bbox'])) if table_region else image
+    return table_image, layout_score_actual
 
-    # Run OCR: Brain VLM (Qwen2-VL) → PaddleOCR → EasyOCR → Tesseract
+
+def run_invoice_ocr(table_image, invoice_data):
+    """
+    OCR cascade on the table crop (BGR ndarray, passed through without re-encoding)
+
+    Returns:
+        OCR result dict
+    """
     logger.info("[OCR] Starting OCR extraction attempt...")
+    print(f"[INVOICE_SERVICE] Table crop shape={table_image.shape}", flush=True)
+    ocr_result = extract_text_from_array(table_image)
+    print(f"[INVOICE_SERVICE] OCR result: success={ocr_result.get('success')}, backend={ocr_result.get('backend')}, text_len={len(ocr_result.get('text',''))}, error={ocr_result.get('error')}", flush=True)
+    return ocr_result
+
+
+def record_ocr_exception(invoice_data, exc):
+    logger.error(f"[OCR] Exception during OCR processing: {exc}", exc_info=True)
+    invoice_data['products_source'] = 'ocr'
+    invoice_data['ocr_error'] = str(exc)
+
+
+def apply_ocr_result(invoice_data, ocr_result):
+    """
+    Parse products from OCR text and enrich them with the catalog
+
+    Returns:
+        Estimated OCR precision, or None when nothing was parsed
+    """
     ocr_precision = None
-    try:
-        ok, buffer = cv2.imencode('.png', table_image)
-        if ok:
-            print(f"[INVOICE_SERVICE] Table crop encoded OK, buffer size={len(buffer.tobytes())} bytes", flush=True)
-            ocr_result = extract_text_from_image_bytes(buffer.tobytes())
-            print(f"[INVOICE_SERVICE] OCR result: success={ocr_result.get('success')}, backend={ocr_result.get('backend')}, text_len={len(ocr_result.get('text',''))}, error={ocr_result.get('error')}", flush=True)
-            if ocr_result.get('success'):
-                invoice_data['ocr_text'] = text = ocr_result.get('text', '').strip()
-                invoice_data['ocr_backend'] = ocr_result.get('backend')
-                invoice_data['ocr_confidence'] = float(ocr_result.get('confidence', 0.0))
-                
-                print(f"[INVOICE_SERVICE] Full OCR text:\n{text}\n{'='*80}", flush=True)
-
-                # Step 1: Structural parsing — correct qty/price/total via LINE_REGEX
-                parsed_products = parse_products_from_text(text)
-                print(f"[INVOICE_SERVICE] Structural parser found {len(parsed_products)} products", flush=True)
-
-                # Step 2: Enrich with catalog names/IDs (keeps parsed numbers)
-                if parsed_products and _catalog_index:
-                    _enrich_with_catalog(parsed_products, _catalog_index)
-                elif not parsed_products and _catalog_index:
-                    catalog_products, _ = extract_products_from_text(text, _catalog_index)
-                    if catalog_products:
-                        parsed_products = catalog_products
-                        print(f"[INVOICE_SERVICE] Fallback catalog extraction found {len(catalog_products)} products", flush=True)
-
-                print(f"[INVOICE_SERVICE] Parser found {len(parsed_products)} products", flush=True)
-                if parsed_products:
-                    for idx, p in enumerate(parsed_products[:3], 1):
-                        print(f"  [{idx}] {p['product_name'][:30]} qty={p['quantity']} unit={p['unit_price']} total={p['line_total']}", flush=True)
-                logger.info(
-                    "[OCR] Backend=%s confidence=%.3f parsed_items=%d",
-                    invoice_data['ocr_backend'],
-                    invoice_data['ocr_confidence'],
-                    len(parsed_products)
-                )
-                if parsed_products:
-                    invoice_data['products'] = []
-                    total = 0.0
-                    for idx, product in enumerate(parsed_products, start=1):
-                        qty = max(1, int(round(product['quantity'])))
-                        unit_price = float(product['unit_price'])
-                        line_total = float(product['line_total']) or (unit_price * qty)
-                        total += line_total
-                        invoice_data['products'].append({
-                            'product_id': f"OCR_{idx}",
-                            'product_name': product['product_name'],
-                            'quantity': qty,
-                            'unit_price': round(unit_price, 2),
-                            'line_total': round(line_total, 2)
-                        })
-                    invoice_data['total_amount'] = round(total, 2)
-                    ocr_precision = _estimate_ocr_precision(text, len(parsed_products))
-                else:
-                    invoice_data['products_source'] = 'ocr'
-                    invoice_data['ocr_warning'] = 'OCR succeeded but no line items detected'
-                    print(f"[INVOICE_SERVICE] Parser returned 0 products from text length {len(text)}", flush=True)
-            else:
-                invoice_data['products_source'] = 'ocr'
-                invoice_data['ocr_error'] = ocr_result.get('error', 'OCR failed')
-                print(f"[INVOICE_SERVICE] OCR failed: {ocr_result.get('error')}", flush=True)
+    if ocr_result.get('success'):
+        invoice_data['ocr_text'] = text = ocr_result.get('text', '').strip()
+        invoice_data['ocr_backend'] = ocr_result.get('backend')
+        invoice_data['ocr_confidence'] = float(ocr_result.get('confidence', 0.0))
+        invoice_data['ocr_backend_latency_ms'] = ocr_result.get('backend_latency_ms', {})
+        
+        print(f"[INVOICE_SERVICE] Full OCR text:\n{text}\n{'='*80}", flush=True)
+
+        # Step 1: Structural parsing — correct qty/price/total via LINE_REGEX
+        parsed_products = parse_products_from_text(text)
+        print(f"[INVOICE_SERVICE] Structural parser found {len(parsed_products)} products", flush=True)
+
+        # Step 2: Enrich with catalog names/IDs (keeps parsed numbers)
+        catalog_index = load_catalog_index(CATALOG_PATH)
+        if parsed_products and catalog_index:
+            _enrich_with_catalog(parsed_products, catalog_index)
+        elif not parsed_products and catalog_index:
+            catalog_products, _ = extract_products_from_text(text, catalog_index)
+            if catalog_products:
+                parsed_products = catalog_products
+                print(f"[INVOICE_SERVICE] Fallback catalog extraction found {len(catalog_products)} products", flush=True)
+
+        print(f"[INVOICE_SERVICE] Parser found {len(parsed_products)} products", flush=True)
+        if parsed_products:
+            for idx, p in enumerate(parsed_products[:3], 1):
+                print(f"  [{idx}] {p['product_name'][:30]} qty={p['quantity']} unit={p['unit_price']} total={p['line_total']}", flush=True)
+        logger.info(
+            "[OCR] Backend=%s confidence=%.3f parsed_items=%d",
+            invoice_data['ocr_backend'],
+            invoice_data['ocr_confidence'],
+            len(parsed_products)
+        )
+        if parsed_products:
+            invoice_data['products'] = []
+            total = 0.0
+            for idx, product in enumerate(parsed_products, start=1):
+                qty = max(1, int(round(product['quantity'])))
+                unit_price = float(product['unit_price'])
+                line_total = float(product['line_total']) or (unit_price * qty)
+                total += line_total
+                invoice_data['products'].append({
+                    'product_id': f"OCR_{idx}",
+                    'product_name': product['product_name'],
+                    'quantity': qty,
+                    'unit_price': round(unit_price, 2),
+                    'line_total': round(line_total, 2)
+                })
+            invoice_data['total_amount'] = round(total, 2)
+            ocr_precision = _estimate_ocr_precision(text, len(parsed_products))
         else:
             invoice_data['products_source'] = 'ocr'
-            invoice_data['ocr_error'] = 'Failed to encode image for OCR'
-            print("[INVOICE_SERVICE] cv2.imencode failed", flush=True)
-    except Exception as exc:
-        logger.error(f"[OCR] Exception during OCR processing: {exc}", exc_info=True)
+            invoice_data['ocr_warning'] = 'OCR succeeded but no line items detected'
+            print(f"[INVOICE_SERVICE] Parser returned 0 products from text length {len(text)}", flush=True)
+    else:
         invoice_data['products_source'] = 'ocr'
-        invoice_data['ocr_error'] = str(exc)
+        invoice_data['ocr_error'] = ocr_result.get('error', 'OCR failed')
+        print(f"[INVOICE_SERVICE] OCR failed: {ocr_result.get('error')}", flush=True)
+    return ocr_precision
+
 
+def finalize_invoice(invoice_data, layout_score_actual, ocr_precision):
+    """Metrics, history and (queued) persistence; returns invoice_data"""
     if not invoice_data['products']:
         invoice_data['products_source'] = 'layout'
 
@@ -181,15 +230,16 @@ def process_invoice_image(image):
     
     # Store last 50 invoices + Create time-series sequences
     try:
-        save_invoice_to_db(invoice_data)
-        logger.info(f"[DATABASE] Saved Y1 output to INVOICE HISTORY DATABASE: {invoice_data['invoice_id']}")
+        queue_invoice_save(invoice_data)
+        logger.info(f"[DATABASE] Queued Y1 output for INVOICE HISTORY DATABASE: {invoice_data['invoice_id']}")
     except Exception as e:
-        logger.warning(f"[DATABASE] Failed to save to database: {e}")
+        logger.warning(f"[DATABASE] Failed to queue database save: {e}")
 
     # save to memory history (backward compatibility)
-    invoice_history.append(invoice_data)
-    if len(invoice_history) > 50:#Keep50 invoices
-        invoice_history.pop(0)
+    with _history_lock:
+        invoice_history.append(invoice_data)
+        if len(invoice_history) > 50:#Keep50 invoices
+            invoice_history.pop(0)
 
     logger.info(f"[MODEL 1] Invoice detection completed:")
     logger.info(f" - Invoice ID: {invoice_data['invoice_id']}")
@@ -197,7 +247,7 @@ def process_invoice_image(image):
     logger.info(f" - Products detected: {len(invoice_data['products'])}")
     logger.info(f" - Total amount: {int(invoice_data['total_amount']):,} VND")
     logger.info(f" - Confidence: {invoice_data['detection_confidence']:.3f}")
-    logger.info(f" - Total in DATABASE: {len(get_invoices_from_db(limit=1000))}")
+    logger.info(f" - Total in DATABASE: {get_invoice_count()} (+{get_invoice_writer_stats()['pending']} queued)")
 
     return invoice_data
 
@@ -258,18 +308,20 @@ def get_invoice_history(limit=10):
     except Exception as e:
         logger.warning(f"Failed to get from database, using memory: {e}")
         # Fallback to memory
+        with _history_lock:
+            invoices = invoice_history[-limit:] if limit else list(invoice_history)
         return {
             'success': True,
-            'count': len(invoice_history),
-            'invoices': invoice_history[-limit:] if limit else invoice_history,
+            'count': len(invoices),
+            'invoices': invoices,
             'source': 'memory'
         }
 
 
 def clear_invoice_history():
     
-    global invoice_history
-    invoice_history = []
+    with _history_lock:
+        invoice_history.clear()
 
     try:
         from utils.database import clear_database
@@ -290,12 +342,13 @@ def get_history_count():
 
 
 def _record_accuracy_metrics(layout_score: float | None, ocr_precision: float | None):
-    if layout_score is not None:
-        accuracy_stats['layout_conf_sum'] += layout_score
-        accuracy_stats['layout_conf_count'] += 1
-    if ocr_precision is not None:
-        accuracy_stats['ocr_precision_sum'] += max(0.0, min(1.0, ocr_precision))
-        accuracy_stats['ocr_precision_count'] += 1
+    with _history_lock:
+        if layout_score is not None:
+            accuracy_stats['layout_conf_sum'] += layout_score
+            accuracy_stats['layout_conf_count'] += 1
+        if ocr_precision is not None:
+            accuracy_stats['ocr_precision_sum'] += max(0.0, min(1.0, ocr_precision))
+            accuracy_stats['ocr_precision_count'] += 1
 
 
 def _estimate_ocr_precision(text: str, detected_items: int) -> float:
@@ -309,14 +362,16 @@ def _estimate_ocr_precision(text: str, detected_items: int) -> float:
 
 
 def get_accuracy_metrics():
+    with _history_lock:
+        stats = dict(accuracy_stats)
     running = {}
-    if accuracy_stats['layout_conf_count']:
+    if stats['layout_conf_count']:
         running['layout_confidence_avg'] = round(
-            accuracy_stats['layout_conf_sum'] / accuracy_stats['layout_conf_count'], 4
+            stats['layout_conf_sum'] / stats['layout_conf_count'], 4
         )
-    if accuracy_stats['ocr_precision_count']:
+    if stats['ocr_precision_count']:
         running['ocr_precision_avg'] = round(
-            accuracy_stats['ocr_precision_sum'] / accuracy_stats['ocr_precision_count'], 4
+            stats['ocr_precision_sum'] / stats['ocr_precision_count'], 4
         )
 
     payload = {}
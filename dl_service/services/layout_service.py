@@ -8,6 +8,7 @@ from typing import Dict, Tuple
 
 from config import LAYOUT_INFER_DEVICE
 from utils.logger import get_logger
+from utils.tracing import span, traced
 import os
 
 # Import the newly copied model
@@ -39,10 +40,12 @@ def get_layout_model():
         model_path = os.path.join(os.getcwd(), 'saved_models/cpt_vision/task1_best.pth')
     
     logger.info(f"[LAYOUT] Loading CTPN layout model from {model_path}")
-    _layout_model = CtpnModel(N_ANCHOR).to(_layout_device)
-    ckpt = torch.load(model_path, map_location=_layout_device, weights_only=False)
-    _layout_model.load_state_dict(ckpt["model_state_dict"])
-    _layout_model.eval()
+    with span('model.load', model='layout'):
+        model = CtpnModel(N_ANCHOR).to(_layout_device)
+        ckpt = torch.load(model_path, map_location=_layout_device, weights_only=False)
+        model.load_state_dict(ckpt["model_state_dict"])
+        model.eval()
+    _layout_model = model
     return _layout_model
 
 def get_layout_training_metrics():
@@ -57,105 +60,138 @@ def crop_region(image: np.ndarray, bbox: Tuple[int, int, int, int], padding: int
     y2 = min(h, y2 + padding)
     return image[y1:y2, x1:x2].copy()
 
-def _iou(a, b):
-    x0 = max(a[0], b[0])
-    y0 = max(a[1], b[1])
-    x1 = min(a[2], b[2])
-    y1 = min(a[3], b[3])
-    inter = max(0, x1 - x0) * max(0, y1 - y0)
-    area_a = (a[2] - a[0]) * (a[3] - a[1])
-    area_b = (b[2] - b[0]) * (b[3] - b[1])
-    union = area_a + area_b - inter
-    return inter / union if union > 0 else 0
-
-def _merge_horizontal(boxes, y_overlap=0.5, x_gap_ratio=2.0):
-    if not boxes: return boxes
-    boxes = sorted(boxes, key=lambda b: ((b[1] + b[3]) / 2, b[0]))
+def _nms(boxes: np.ndarray, iou_threshold: float = 0.3) -> np.ndarray:
+    """Greedy NMS over an (N, 5) [x0, y0, x1, y1, score] array; returns kept rows by score."""
+    if len(boxes) == 0:
+        return boxes
+    boxes = boxes[np.argsort(-boxes[:, 4], kind='stable')]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.arange(len(boxes))
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.maximum(0, np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]))
+        ih = np.maximum(0, np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]))
+        inter = iw * ih
+        union = areas[i] + areas[rest] - inter
+        iou = np.where(union > 0, inter / np.where(union > 0, union, 1), 0)
+        order = rest[iou <= iou_threshold]
+    return boxes[keep]
+
+def _merge_horizontal(boxes: np.ndarray, y_overlap=0.5, x_gap_ratio=2.0) -> np.ndarray:
+    """
+    Greedily merges boxes on the same text line, left to right.
+
+    Same semantics as the old per-pair loop: boxes are visited in (center-y, x0)
+    order and each seed absorbs later boxes one at a time, but every step tests
+    all remaining candidates against the growing box in one NumPy pass.
+    """
+    if len(boxes) == 0:
+        return boxes
+    boxes = boxes[np.lexsort((boxes[:, 0], (boxes[:, 1] + boxes[:, 3]) / 2))]
+    heights = boxes[:, 3] - boxes[:, 1]
+    used = np.zeros(len(boxes), dtype=bool)
     merged = []
-    used = [False] * len(boxes)
     for i in range(len(boxes)):
         if used[i]: continue
-        cur = list(boxes[i])
+        cur = boxes[i].copy()
         used[i] = True
-        h = cur[3] - cur[1]
-        for j in range(i + 1, len(boxes)):
-            if used[j]: continue
+        h = heights[i]
+        start = i + 1
+        while start < len(boxes):
+            cand = boxes[start:]
+            overlap = np.minimum(cur[3], cand[:, 3]) - np.maximum(cur[1], cand[:, 1])
+            gap = cand[:, 0] - cur[2]
+            ok = (~used[start:]
+                  & (overlap >= y_overlap * np.minimum(h, heights[start:]))
+                  & (gap <= x_gap_ratio * np.maximum(h, heights[start:])))
+            hits = np.flatnonzero(ok)
+            if hits.size == 0: break
+            j = start + hits[0]
             bj = boxes[j]
-            hj = bj[3] - bj[1]
-            overlap = min(cur[3], bj[3]) - max(cur[1], bj[1])
-            if overlap < y_overlap * min(h, hj): continue
-            gap = bj[0] - cur[2]
-            if gap > x_gap_ratio * max(h, hj): continue
             cur[0] = min(cur[0], bj[0])
             cur[1] = min(cur[1], bj[1])
             cur[2] = max(cur[2], bj[2])
             cur[3] = max(cur[3], bj[3])
             cur[4] = max(cur[4], bj[4])
             used[j] = True
+            start = j + 1
         merged.append(cur)
-    return merged
+    return np.stack(merged)
 
-def detect_layout_regions(image: np.ndarray, conf_threshold: float = 0.70) -> Dict[str, LayoutRegion]:
+def _run_ctpn(image: np.ndarray):
+    """Runs the CTPN model on a BGR image; returns raw outputs and the original size."""
     model = get_layout_model()
-    
+
     # Convert cv2 numpy image to PIL for CTPN transform
     rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     image_pil = Image.fromarray(rgb)
     orig_w, orig_h = image_pil.size
-    
+
     transform = transforms.Compose([
         transforms.Resize((CFG_IMG_H, CFG_IMG_W)),
         transforms.ToTensor(),
     ])
     img_tensor = transform(image_pil).unsqueeze(0).to(_layout_device)
 
-    with torch.no_grad():
+    with span('layout.ctpn_forward'), torch.no_grad():
         out_1, out_2, out_3 = model(img_tensor)
-        
-    scores = torch.softmax(out_1, dim=-1)[..., 1]
-    anchors = [5 * (2 ** (i / 2)) for i in range(N_ANCHOR)]
-    
-    boxes = []
+    return out_1, out_2, out_3, orig_w, orig_h
+
+def _decode_ctpn(out_1, out_2, out_3, orig_w, orig_h, conf_threshold: float) -> np.ndarray:
+    """
+    Decodes CTPN outputs into (N, 5) [x0, y0, x1, y1, score] proposals in image coordinates.
+
+    Thresholding and gathering happen on the model's device; only the surviving
+    proposals are copied to the host, once.
+    """
     stride = 16
-    grid_h, grid_w = scores.size(1), scores.size(2)
-    for h_idx in range(grid_h):
-        for w_idx in range(grid_w):
-            for a_idx, ah in enumerate(anchors):
-                score = scores[0, h_idx, w_idx, a_idx].item()
-                if score < conf_threshold: continue
-                cx_anc, cy_anc = w_idx * stride + stride / 2, h_idx * stride + stride / 2
-                v_c = out_2[0, h_idx, w_idx, a_idx, 0].item()
-                v_h = out_2[0, h_idx, w_idx, a_idx, 1].item()
-                cy = v_c * ah + cy_anc
-                h = min(np.exp(v_h) * ah, CFG_IMG_H)
-                o = out_3[0, h_idx, w_idx, a_idx].item()
-                cx = cx_anc + o * stride
-                x0, y0, x1, y1 = cx - stride / 2, cy - h / 2, cx + stride / 2, cy + h / 2
-                x0, x1 = x0 / CFG_IMG_W * orig_w, x1 / CFG_IMG_W * orig_w
-                y0, y1 = y0 / CFG_IMG_H * orig_h, y1 / CFG_IMG_H * orig_h
-                boxes.append([x0, y0, x1, y1, score])
-                
-    if not boxes: return {}
-    
-    boxes = sorted(boxes, key=lambda b: b[4], reverse=True)
-    keep = []
-    suppressed = set()
-    for i, bi in enumerate(boxes):
-        if i in suppressed: continue
-        keep.append(bi)
-        for j in range(i + 1, len(boxes)):
-            if j in suppressed: continue
-            if _iou(bi, boxes[j]) > 0.3: suppressed.add(j)
-            
-    merged = _merge_horizontal(keep)
-    
+    scores = torch.softmax(out_1, dim=-1)[0, ..., 1]
+    idx = torch.nonzero(scores >= conf_threshold, as_tuple=True)
+    if idx[0].numel() == 0:
+        return np.zeros((0, 5))
+    h_idx, w_idx, a_idx = idx
+    packed = torch.stack([
+        h_idx.to(scores.dtype), w_idx.to(scores.dtype), a_idx.to(scores.dtype),
+        scores[idx], out_2[0][idx][:, 0], out_2[0][idx][:, 1], out_3[0][idx].reshape(-1),
+    ], dim=1)
+    h_idx, w_idx, a_idx, score, v_c, v_h, o = packed.cpu().numpy().astype(np.float64).T
+
+    anchors = 5 * (2 ** (np.arange(N_ANCHOR) / 2))
+    ah = anchors[a_idx.astype(np.int64)]
+    cx_anc = w_idx * stride + stride / 2
+    cy_anc = h_idx * stride + stride / 2
+    cy = v_c * ah + cy_anc
+    h = np.minimum(np.exp(v_h) * ah, CFG_IMG_H)
+    cx = cx_anc + o * stride
+    x0 = (cx - stride / 2) / CFG_IMG_W * orig_w
+    x1 = (cx + stride / 2) / CFG_IMG_W * orig_w
+    y0 = (cy - h / 2) / CFG_IMG_H * orig_h
+    y1 = (cy + h / 2) / CFG_IMG_H * orig_h
+    return np.stack([x0, y0, x1, y1, score], axis=1)
+
+def _detect_text_boxes(image: np.ndarray, conf_threshold: float) -> Tuple[np.ndarray, int, int]:
+    """Shared CTPN path: forward pass, batched decode, NMS and horizontal line merge."""
+    out_1, out_2, out_3, orig_w, orig_h = _run_ctpn(image)
+    with span('layout.ctpn_decode'):
+        boxes = _decode_ctpn(out_1, out_2, out_3, orig_w, orig_h, conf_threshold)
+        if len(boxes) == 0:
+            return boxes, orig_w, orig_h
+        return _merge_horizontal(_nms(boxes, 0.3)), orig_w, orig_h
+
+@traced('layout.detect')
+def detect_layout_regions(image: np.ndarray, conf_threshold: float = 0.70) -> Dict[str, LayoutRegion]:
+    merged, orig_w, orig_h = _detect_text_boxes(image, conf_threshold)
+
     # Rather than returning a list of text lines, we will compute the macro bounding box 
     # of ALL text lines combined to act as the "table" crop so the rest of the OCR pipeline succeeds.
-    if merged:
-        min_x = int(min([b[0] for b in merged]))
-        min_y = int(min([b[1] for b in merged]))
-        max_x = int(max([b[2] for b in merged]))
-        max_y = int(max([b[3] for b in merged]))
+    if len(merged):
+        min_x = int(merged[:, 0].min())
+        min_y = int(merged[:, 1].min())
+        max_x = int(merged[:, 2].max())
+        max_y = int(merged[:, 3].max())
         
         # Give a little padding around the entire text block wrapper
         padding = 10
@@ -163,7 +199,7 @@ def detect_layout_regions(image: np.ndarray, conf_threshold: float = 0.70) -> Di
         min_y = max(0, min_y - padding)
         max_x = min(orig_w, max_x + padding)
         max_y = min(orig_h, max_y + padding)
-        avg_conf = sum([b[4] for b in merged]) / len(merged)
+        avg_conf = float(merged[:, 4].mean())
         
         return {
             'table': LayoutRegion(
@@ -181,54 +217,5 @@ def initialize_layout_detector():
 
 def get_text_lines(image: np.ndarray, conf_threshold: float = 0.5):
     """Returns horizontal bounding boxes of text lines using CTPN."""
-    model = get_layout_model()
-    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image_pil = Image.fromarray(rgb)
-    orig_w, orig_h = image_pil.size
-    
-    transform = transforms.Compose([
-        transforms.Resize((CFG_IMG_H, CFG_IMG_W)),
-        transforms.ToTensor(),
-    ])
-    img_tensor = transform(image_pil).unsqueeze(0).to(_layout_device)
-
-    with torch.no_grad():
-        out_1, out_2, out_3 = model(img_tensor)
-        
-    scores = torch.softmax(out_1, dim=-1)[..., 1]
-    anchors = [5 * (2 ** (i / 2)) for i in range(N_ANCHOR)]
-    
-    boxes = []
-    stride = 16
-    grid_h, grid_w = scores.size(1), scores.size(2)
-    for h_idx in range(grid_h):
-        for w_idx in range(grid_w):
-            for a_idx, ah in enumerate(anchors):
-                score = scores[0, h_idx, w_idx, a_idx].item()
-                if score < conf_threshold: continue
-                cx_anc, cy_anc = w_idx * stride + stride / 2, h_idx * stride + stride / 2
-                v_c = out_2[0, h_idx, w_idx, a_idx, 0].item()
-                v_h = out_2[0, h_idx, w_idx, a_idx, 1].item()
-                cy = v_c * ah + cy_anc
-                h = min(np.exp(v_h) * ah, CFG_IMG_H)
-                o = out_3[0, h_idx, w_idx, a_idx].item()
-                cx = cx_anc + o * stride
-                x0, y0, x1, y1 = cx - stride / 2, cy - h / 2, cx + stride / 2, cy + h / 2
-                x0, x1 = x0 / CFG_IMG_W * orig_w, x1 / CFG_IMG_W * orig_w
-                y0, y1 = y0 / CFG_IMG_H * orig_h, y1 / CFG_IMG_H * orig_h
-                boxes.append([x0, y0, x1, y1, score])
-                
-    if not boxes: return []
-    
-    boxes = sorted(boxes, key=lambda b: b[4], reverse=True)
-    keep = []
-    suppressed = set()
-    for i, bi in enumerate(boxes):
-        if i in suppressed: continue
-        keep.append(bi)
-        for j in range(i + 1, len(boxes)):
-            if j in suppressed: continue
-            if _iou(bi, boxes[j]) > 0.3: suppressed.add(j)
-            
-    merged = _merge_horizontal(keep)
-    return merged
+    merged, _, _ = _detect_text_boxes(image, conf_threshold)
+    return merged.tolist()
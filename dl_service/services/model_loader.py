@@ -4,14 +4,115 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
 from models.lstm_model import ImportForecastLSTM
-from config import LSTM_MODEL_PATH, LSTM_SEQUENCE_LENGTH, LSTM_NUM_FEATURES, LAYOUT_WEIGHTS_PATH
+from config import (
+    LSTM_MODEL_PATH, LSTM_SEQUENCE_LENGTH, LSTM_NUM_FEATURES, LAYOUT_WEIGHTS_PATH,
+    OCR_PRELOAD_ENGINES, OCR_WARMUP_WORKERS
+)
 from services.layout_service import initialize_layout_detector
 
 # Global model instances
 lstm_model = None
 layout_ready = False
 
+# OCR warm pool: engine name -> Future resolving to the engine (None if unavailable)
+_ocr_engines = {}
+_ocr_engine_times = {}
+_ocr_engines_lock = threading.Lock()
+_ocr_warmup_executor = None
+
+
+def _ocr_engine_loaders():
+    # Imported lazily: the OCR modules import this one for readiness checks
+    from services.ocr_service import _get_easyocr_reader, _get_paddle_engine
+    from services.cpt_ocr import get_vietocr_predictor
+    return {
+        'easyocr': _get_easyocr_reader,
+        'paddleocr': _get_paddle_engine,
+        'vietocr': get_vietocr_predictor,
+    }
+
+
+def _load_ocr_engine(name, loader):
+    start = time.perf_counter()
+    print(f"   [WARMUP] Loading OCR engine '{name}'...", flush=True)
+    try:
+        engine = loader()
+    except Exception as exc:
+        print(f"   [WARNING] OCR engine '{name}' failed to load: {exc}", flush=True)
+        engine = None
+    elapsed = time.perf_counter() - start
+    _ocr_engine_times[name] = round(elapsed, 2)
+    status = 'ready' if engine is not None else 'unavailable'
+    print(f"   [WARMUP] OCR engine '{name}' {status} in {elapsed:.1f}s", flush=True)
+    return engine
+
+
+def start_ocr_warmup(names=None):
+    """
+    Preload OCR engines in background threads so the first request doesn't build them inline.
+
+    Args:
+        names: Engine names to load (default: OCR_PRELOAD_ENGINES)
+
+    Returns:
+        Dict of engine name -> Future
+    """
+    global _ocr_warmup_executor
+    loaders = _ocr_engine_loaders()
+    names = OCR_PRELOAD_ENGINES if names is None else names
+    with _ocr_engines_lock:
+        if _ocr_warmup_executor is None:
+            _ocr_warmup_executor = ThreadPoolExecutor(
+                max_workers=OCR_WARMUP_WORKERS, thread_name_prefix='ocr-warmup'
+            )
+        for name in names:
+            if name in _ocr_engines or name not in loaders:
+                continue
+            _ocr_engines[name] = _ocr_warmup_executor.submit(_load_ocr_engine, name, loaders[name])
+        return dict(_ocr_engines)
+
+
+def get_ocr_engine_status(name):
+    """'ready', 'loading', 'unavailable', or 'cold' (never preloaded)"""
+    future = _ocr_engines.get(name)
+    if future is None:
+        return 'cold'
+    if not future.done():
+        return 'loading'
+    return 'ready' if future.result() is not None else 'unavailable'
+
+
+def wait_for_ocr_engine(name, timeout=None):
+    """
+    Block until a preloading engine is ready.
+
+    Returns:
+        True if the engine is ready (or was never preloaded, so callers may build it inline),
+        False if it is still loading after timeout or failed to load
+    """
+    future = _ocr_engines.get(name)
+    if future is None:
+        return True
+    try:
+        return future.result(timeout=timeout) is not None
+    except FutureTimeout:
+        return False
+
+
+def get_ocr_engines_info():
+    return {
+        name: {
+            'status': get_ocr_engine_status(name),
+            'load_seconds': _ocr_engine_times.get(name)
+        }
+        for name in _ocr_engines
+    }
+
 
 def initialize_models():
     
@@ -47,6 +148,11 @@ def initialize_models():
         lstm_model = ImportForecastLSTM(lookback=LSTM_SEQUENCE_LENGTH, features=LSTM_NUM_FEATURES)
         lstm_model.build_model()
     
+    # OCR engines: warm up in the background, requests check readiness per engine
+    if OCR_PRELOAD_ENGINES:
+        print(f"Preloading OCR engines in background: {', '.join(OCR_PRELOAD_ENGINES)}")
+        start_ocr_warmup()
+
     print("="*60)
     print("MODELS INITIALIZED - READY TO BUILD ON DEMAND")
     print("="*60 + "\n")
@@ -90,5 +196,6 @@ def get_models_info():
             'lookback': lstm_model.lookback if lstm_model else 'Not loaded',
             'features': lstm_model.features if lstm_model else 'Not loaded',
             'weights': str(LSTM_MODEL_PATH) if LSTM_MODEL_PATH.exists() else 'In-memory'
-        }
+        },
+        'ocr_engines': get_ocr_engines_info()
     }
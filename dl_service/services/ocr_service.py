@@ -2,12 +2,16 @@ from io import BytesIO
 import logging
 import os
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import Optional
 
 # Fix PaddlePaddle PIR compiler crash on Windows CPU (oneDNN + PIR incompatibility)
 os.environ.setdefault('FLAGS_enable_pir_api', '0')
 os.environ.setdefault('FLAGS_enable_pir_in_executor', '0')
 
+import cv2
 import numpy as np
 from PIL import Image
 import requests
@@ -22,10 +26,81 @@ _paddle_engine = None
 _paddle_disabled = False
 _easyocr_reader = None
 _easyocr_disabled = False
+_paddle_init_lock = threading.Lock()
+_easyocr_init_lock = threading.Lock()
+_paddle_infer_lock = threading.Lock()
+
+_race_executors = {}  # backend name -> ThreadPoolExecutor
+_race_executor_lock = threading.Lock()
+_RACE_POLL_SECONDS = 0.05
 
 from services.cpt_ocr import run_vietocr_with_paddle_layout
+from utils.ocr_cache import get_ocr_cache, make_cache_key, make_array_cache_key
+from utils.tracing import span, observe
+from config import (
+    OCR_ENGINE_WAIT_SECONDS,
+    OCR_CASCADE_MODE,
+    OCR_RACE_MAX_WORKERS,
+    OCR_RACE_MIN_CONFIDENCE,
+    OCR_RACE_DEFAULT_BUDGET,
+    OCR_BACKEND_BUDGETS
+)
+
+
+class OcrImage:
+    """
+    Decoded pixels shared by every backend in one cascade run
+
+    Built from whichever color order the caller already has; the other one is
+    converted lazily, at most once, and reused by all backends:
+        .bgr - uint8 (H, W, 3), OpenCV order (CTPN, PaddleOCR, PNG encode)
+        .rgb - uint8 (H, W, 3) (EasyOCR, Tesseract, VietOCR crops)
+    The arrays are shared with concurrently racing backends: read-only.
+    """
 
-def _vietocr_ocr(image: Image.Image) -> Optional[dict]:
+    def __init__(self, bgr=None, rgb=None):
+        if bgr is None and rgb is None:
+            raise ValueError('OcrImage needs bgr or rgb pixels')
+        self._bgr = bgr
+        self._rgb = rgb
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_array(cls, image):
+        """BGR (or grayscale / BGRA) uint8 ndarray, as produced by cv2.imdecode and crop_region"""
+        image = np.asarray(image)
+        if image.dtype != np.uint8:
+            raise ValueError(f'Expected uint8 pixels, got {image.dtype}')
+        if image.ndim == 2:
+            return cls(bgr=cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
+        if image.ndim == 3 and image.shape[2] == 4:
+            return cls(bgr=cv2.cvtColor(image, cv2.COLOR_BGRA2BGR))
+        if image.ndim == 3 and image.shape[2] == 3:
+            return cls(bgr=image)
+        raise ValueError(f'Unsupported image shape {image.shape}')
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            with self._lock:
+                if self._bgr is None:
+                    self._bgr = cv2.cvtColor(self._rgb, cv2.COLOR_RGB2BGR)
+        return self._bgr
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            with self._lock:
+                if self._rgb is None:
+                    self._rgb = cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def shape(self):
+        return (self._bgr if self._bgr is not None else self._rgb).shape
+
+
+def _vietocr_ocr(image: OcrImage) -> Optional[dict]:
     engine = _get_paddle_engine()
     if engine is None:
         return None
@@ -69,7 +144,7 @@ def _get_brain_url():
         return None
 
 
-def _brain_vlm_ocr(image: Image.Image) -> Optional[dict]:
+def _brain_vlm_ocr(image: OcrImage) -> Optional[dict]:
     """
     Primary OCR: send image to the Brain's Qwen2-VL / VisionAgent endpoint.
     Returns extracted text or None if the Brain is unreachable.
@@ -81,16 +156,19 @@ def _brain_vlm_ocr(image: Image.Image) -> Optional[dict]:
         return None
     print(f"[OCR] Brain VLM: attempting Qwen2-VL OCR via {url}/ocr ...", flush=True)
     try:
-        buf = BytesIO()
-        image.save(buf, format='PNG')
-        buf.seek(0)
-
-        resp = requests.post(
-            f"{url}/ocr",
-            files={'file': ('invoice.png', buf, 'image/png')},
-            headers={"ngrok-skip-browser-warning": "true"},
-            timeout=30,
-        )
+        ok, png = cv2.imencode('.png', image.bgr)
+        if not ok:
+            print("[OCR] Brain VLM: failed to encode image, falling back", flush=True)
+            return None
+        buf = BytesIO(png.tobytes())
+
+        with span('ocr.brain_request'):
+            resp = requests.post(
+                f"{url}/ocr",
+                files={'file': ('invoice.png', buf, 'image/png')},
+                headers={"ngrok-skip-browser-warning": "true"},
+                timeout=30,
+            )
         if resp.status_code != 200:
             print(f"[OCR] Brain VLM: server returned HTTP {resp.status_code}, falling back", flush=True)
             logger.info("Brain OCR returned status %d, falling back", resp.status_code)
@@ -137,11 +215,21 @@ _PADDLE_LANG = os.getenv('PADDLE_OCR_LANG', 'en')  # PaddleOCR 'en' model suppor
 
 
 def _get_paddle_engine():
+    if _paddle_engine is not None or _paddle_disabled:
+        return _paddle_engine
+    # Backends may run concurrently (OCR_CASCADE_MODE=race); build the engine once
+    with _paddle_init_lock:
+        return _build_paddle_engine()
+
+
+def _build_paddle_engine():
     global _paddle_engine, _paddle_disabled
     if _paddle_disabled:
         return None
     if _paddle_engine is not None:
         return _paddle_engine
+    # Timed from here so lock waits and the already-built path are not counted as load time
+    start = time.perf_counter()
     try:
         from paddleocr import PaddleOCR
         resolved_device = _PADDLE_DEVICE or ('gpu:0' if _PADDLE_USE_GPU else 'cpu')
@@ -181,23 +269,28 @@ def _get_paddle_engine():
     except Exception as exc:  # pragma: no cover - environment specific
         _paddle_disabled = True
         logger.warning("PaddleOCR unavailable: %s", exc)
+        observe('model.load', time.perf_counter() - start, error=True, model='paddleocr')
         return None
+    observe('model.load', time.perf_counter() - start, model='paddleocr')
     return _paddle_engine
 
 
-def _paddle_ocr(image: Image.Image) -> Optional[dict]:
+def _paddle_ocr(image: OcrImage) -> Optional[dict]:
     engine = _get_paddle_engine()
     if engine is None:
         return None
     try:
         # PaddleOCR v3.4+ removed cls kwarg from ocr()/predict()
-        try:
-            result = engine.ocr(np.array(image), cls=True)
-        except TypeError:
+        # The predictor is not thread-safe; serialize calls when backends race
+        with _paddle_infer_lock:
+            # PaddleOCR reads ndarrays in OpenCV (BGR) order
             try:
-                result = engine.ocr(np.array(image))
-            except Exception:
-                result = list(engine.predict(np.array(image)))
+                result = engine.ocr(image.bgr, cls=True)
+            except TypeError:
+                try:
+                    result = engine.ocr(image.bgr)
+                except Exception:
+                    result = list(engine.predict(image.bgr))
              
         if not result:
             logger.info("PaddleOCR returned no text; falling back")
@@ -245,11 +338,19 @@ def _paddle_ocr(image: Image.Image) -> Optional[dict]:
 
 
 def _get_easyocr_reader():
+    if _easyocr_reader is not None or _easyocr_disabled:
+        return _easyocr_reader
+    with _easyocr_init_lock:
+        return _build_easyocr_reader()
+
+
+def _build_easyocr_reader():
     global _easyocr_reader, _easyocr_disabled
     if _easyocr_disabled:
         return None
     if _easyocr_reader is not None:
         return _easyocr_reader
+    start = time.perf_counter()
     try:
         import easyocr
 
@@ -258,16 +359,18 @@ def _get_easyocr_reader():
     except Exception as exc:
         _easyocr_disabled = True
         logger.warning("EasyOCR unavailable: %s", exc)
+        observe('model.load', time.perf_counter() - start, error=True, model='easyocr')
         return None
+    observe('model.load', time.perf_counter() - start, model='easyocr')
     return _easyocr_reader
 
 
-def _easyocr_ocr(image: Image.Image) -> Optional[dict]:
+def _easyocr_ocr(image: OcrImage) -> Optional[dict]:
     reader = _get_easyocr_reader()
     if reader is None:
         return None
     try:
-        results = reader.readtext(np.array(image.convert('RGB')))
+        results = reader.readtext(image.rgb)
         if not results:
             return None
         texts = []
@@ -291,14 +394,14 @@ def _easyocr_ocr(image: Image.Image) -> Optional[dict]:
         return None
 
 
-def _pytesseract_ocr(image: Image.Image) -> Optional[dict]:
+def _pytesseract_ocr(image: OcrImage) -> Optional[dict]:
     try:
         import pytesseract
     except Exception as exc:
         logger.debug("pytesseract import failed: %s", exc)
         return None
     try:
-        text = pytesseract.image_to_string(image).strip()
+        text = pytesseract.image_to_string(image.rgb).strip()
         if not text:
             return None
         return {
@@ -312,42 +415,260 @@ def _pytesseract_ocr(image: Image.Image) -> Optional[dict]:
 
 
 def extract_text_from_image_bytes(image_bytes):
-    """Extract text using Qwen2-VL (Brain) → PaddleOCR → EasyOCR → Tesseract fallback."""
+    """Extract text using Qwen2-VL (Brain) → PaddleOCR → EasyOCR → Tesseract fallback.
+
+    Successful results are cached by image content hash + OCR_BACKEND_VERSION,
+    so re-uploads of the same photo skip the whole cascade.
+    """
+    cache = get_ocr_cache()
+    cache_key = make_cache_key(image_bytes) if cache is not None else None
+
+    def load():
+        try:
+            pil_image = Image.open(BytesIO(image_bytes)).convert('RGB')
+        except Exception as exc:
+            raise ValueError(f'Failed to open image: {exc}')
+        return OcrImage(rgb=np.asarray(pil_image))
+
+    return _extract_cached(cache, cache_key, load)
+
+
+def extract_text_from_array(image):
+    """
+    Array-native counterpart of extract_text_from_image_bytes
+
+    Args:
+        image: uint8 ndarray in OpenCV color order - (H, W, 3) BGR, as returned by
+            cv2.imdecode / crop_region; (H, W) grayscale and (H, W, 4) BGRA are
+            converted to BGR. Views (e.g. a crop) are fine; pixels are not copied
+            or re-encoded, and backends needing RGB share one conversion.
+
+    Returns:
+        Same result dict as extract_text_from_image_bytes; cached by pixel hash
+    """
+    cache = get_ocr_cache()
+    cache_key = None
+    if cache is not None and isinstance(image, np.ndarray):
+        cache_key = make_array_cache_key(image)
+    return _extract_cached(cache, cache_key, lambda: OcrImage.from_array(image))
+
+
+def _extract_cached(cache, cache_key, load):
+    """Cache lookup, then load() -> OcrImage and the cascade; cache_key None skips the cache"""
+    if cache_key is not None:
+        with span('ocr.cache_lookup'):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"[OCR] ✓ Cache hit (backend={cached.get('backend')}, len={len(cached.get('text', ''))})", flush=True)
+            cached['cached'] = True
+            return cached
 
     try:
-        image = Image.open(BytesIO(image_bytes)).convert('RGB')
-    except Exception as exc:
-        return {'success': False, 'text': '', 'error': f'Failed to open image: {exc}'}
+        image = load()
+    except ValueError as exc:
+        return {'success': False, 'text': '', 'error': str(exc)}
 
+    with span('ocr.cascade', mode=OCR_CASCADE_MODE):
+        result = _run_ocr_cascade(image)
+    if cache_key is not None and result.get('success'):
+        cache.set(cache_key, result)
+    return result
+
+
+def _ocr_backends():
     # Build cascade: prefer fast local engines first, remote/slow backends last.
     # EasyOCR is the most reliable local backend on Windows.
     # PaddleOCR 3.4 has oneDNN/PIR crash on Windows CPU — try but expect failure.
     # Brain VLM requires a remote server (30s timeout) — only try if configured.
-    backends = [
+    return [
         ('EasyOCR',                             _easyocr_ocr),
         ('PaddleOCR',                           _paddle_ocr),
         ('VietOCR + ComputerVision',            _vietocr_ocr),
         ('Brain VLM (Qwen2-VL)',                _brain_vlm_ocr),
         ('Tesseract',                           _pytesseract_ocr),
     ]
-    print(f"[OCR] Fallback chain: {' → '.join(n for n, _ in backends)}", flush=True)
-    for name, runner in backends:
+
+
+def _get_race_executor(name):
+    """Race pool for one backend; a backend's abandoned runs never delay the others"""
+    with _race_executor_lock:
+        executor = _race_executors.get(name)
+        if executor is None:
+            executor = _race_executors[name] = ThreadPoolExecutor(
+                max_workers=OCR_RACE_MAX_WORKERS,
+                thread_name_prefix=f"ocr-race-{name.split()[0].lower()}"
+            )
+    return executor
+
+
+def _timed_run(name, runner, image):
+    start = time.perf_counter()
+    error = False
+    try:
         result = runner(image)
+    except Exception as exc:
+        logger.info("OCR backend raised: %s", exc)
+        result = None
+        error = True
+    elapsed = time.perf_counter() - start
+    status = 'ok' if result and result.get('text') else 'empty'
+    observe('ocr.backend', elapsed, error=error, backend=name, status=status)
+    return result, elapsed * 1000
+
+
+# Warm-pool engines each cascade backend needs (see services/model_loader.py)
+_BACKEND_ENGINES = {
+    'EasyOCR': ('easyocr',),
+    'PaddleOCR': ('paddleocr',),
+    'VietOCR + ComputerVision': ('vietocr', 'paddleocr'),
+}
+
+
+def _backend_loading(name):
+    # Imported lazily: model_loader pulls in TensorFlow for the forecast model
+    from services.model_loader import get_ocr_engine_status
+    return any(get_ocr_engine_status(e) == 'loading' for e in _BACKEND_ENGINES.get(name, ()))
+
+
+def _cascade_sequential(image, backends):
+    """
+    Try backends one after another; first one that returns text wins.
+
+    Backends whose engine is still warming up are moved to the end of the chain,
+    so already-warm backends get a chance first; only then do we wait (up to
+    OCR_ENGINE_WAIT_SECONDS) for the cold ones instead of building them inline.
+    """
+    timings = {}
+    warm = [b for b in backends if not _backend_loading(b[0])]
+    deferred = [b for b in backends if _backend_loading(b[0])]
+    if deferred:
+        print(f"[OCR] Still warming up, trying last: {', '.join(n for n, _ in deferred)}", flush=True)
+    for name, runner in warm + deferred:
+        if (name, runner) in deferred:
+            start = time.perf_counter()
+            from services.model_loader import wait_for_ocr_engine
+            with span('ocr.engine_wait', backend=name):
+                for engine in _BACKEND_ENGINES[name]:
+                    wait_for_ocr_engine(engine, OCR_ENGINE_WAIT_SECONDS)
+            if _backend_loading(name):
+                timings[name] = {'status': 'loading', 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+                continue
+        result, elapsed = _timed_run(name, runner, image)
         if result and result.get('text'):
-            print(f"[OCR] ✓ Text extracted by: {name} (backend={result.get('backend')}, len={len(result['text'])}, conf={result.get('confidence',0):.3f})", flush=True)
-            logger.info(
-                "OCR success via %s (len=%d, confidence=%.3f)",
-                result.get('backend'),
-                len(result.get('text', '')),
-                float(result.get('confidence', 0.0))
-            )
-            return {
-                'success': True,
-                'text': result['text'],
-                'error': '',
-                'backend': result.get('backend'),
-                'confidence': float(result.get('confidence', 0.0))
-            }
+            timings[name] = {'status': 'ok', 'latency_ms': round(elapsed, 1)}
+            return name, result, timings
+        timings[name] = {'status': 'empty', 'latency_ms': round(elapsed, 1)}
+    return None, None, timings
+
+
+def _cascade_race(image, backends):
+    """
+    Run every backend concurrently, each with its own latency budget.
+
+    The first result whose confidence reaches OCR_RACE_MIN_CONFIDENCE wins and
+    queued backends are cancelled; backends already running are abandoned (their
+    threads finish in the background and the result is dropped). If nothing
+    clears the threshold, the best text in cascade order is used.
+
+    Each backend runs on its own small pool, so runs abandoned by earlier
+    requests only hold up that backend. Each budget counts from when a worker
+    actually starts the backend, so queueing is not charged to it, but no
+    backend runs past the largest budget measured from submission; one still
+    queued by then is given up on ('queued'). Worst-case latency is therefore
+    the largest budget instead of the sum of all backends.
+    """
+    start = time.perf_counter()
+    order = {name: i for i, (name, _) in enumerate(backends)}
+    budgets = {name: OCR_BACKEND_BUDGETS.get(name, OCR_RACE_DEFAULT_BUDGET) for name, _ in backends}
+    overall_deadline = start + max(budgets.values(), default=OCR_RACE_DEFAULT_BUDGET)
+    started = {}  # name -> perf_counter when a worker picked the backend up
+
+    def run(name, runner):
+        started[name] = time.perf_counter()
+        return _timed_run(name, runner, image)
+
+    pending = {_get_race_executor(name).submit(run, name, runner): name for name, runner in backends}
+
+    timings = {}
+    fallback = None  # (cascade index, name, result) of best below-threshold text
+    winner = None
+    while pending and winner is None:
+        now = time.perf_counter()
+        deadlines = []
+        for future, name in list(pending.items()):
+            if future.done():
+                deadlines.append(now)
+                continue
+            began = started.get(name)
+            if began is None:
+                # Its budget starts once a worker picks it up; look again shortly
+                deadlines.append(now + _RACE_POLL_SECONDS)
+            deadline = min(began + budgets[name], overall_deadline) if began is not None else overall_deadline
+            if now >= deadline:
+                future.cancel()
+                timings[name] = {'status': 'timeout' if began is not None else 'queued',
+                                 'latency_ms': round((now - start) * 1000, 1)}
+                del pending[future]
+            else:
+                deadlines.append(deadline)
+        if not pending:
+            break
+        done, _ = wait(list(pending), timeout=max(0.0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            result, elapsed = future.result()
+            if not (result and result.get('text')):
+                timings[name] = {'status': 'empty', 'latency_ms': round(elapsed, 1)}
+                continue
+            if float(result.get('confidence', 0.0)) >= OCR_RACE_MIN_CONFIDENCE:
+                timings[name] = {'status': 'ok', 'latency_ms': round(elapsed, 1)}
+                if winner is None or order[name] < order[winner[0]]:
+                    winner = (name, result)
+                continue
+            timings[name] = {'status': 'low_confidence', 'latency_ms': round(elapsed, 1)}
+            if fallback is None or order[name] < fallback[0]:
+                fallback = (order[name], name, result)
+
+    for future, name in pending.items():
+        future.cancel()
+        timings[name] = {'status': 'cancelled', 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+    if winner is not None:
+        return winner[0], winner[1], timings
+    if fallback is not None:
+        timings[fallback[1]]['status'] = 'ok'
+        return fallback[1], fallback[2], timings
+    return None, None, timings
+
+
+def _run_ocr_cascade(image):
+    backends = _ocr_backends()
+    if OCR_CASCADE_MODE == 'race':
+        print(f"[OCR] Racing backends: {', '.join(n for n, _ in backends)}", flush=True)
+        name, result, timings = _cascade_race(image, backends)
+    else:
+        print(f"[OCR] Fallback chain: {' → '.join(n for n, _ in backends)}", flush=True)
+        name, result, timings = _cascade_sequential(image, backends)
+
+    latency = {n: t['latency_ms'] for n, t in timings.items()}
+    if result is not None:
+        print(f"[OCR] ✓ Text extracted by: {name} (backend={result.get('backend')}, len={len(result['text'])}, conf={result.get('confidence',0):.3f})", flush=True)
+        logger.info(
+            "OCR success via %s (len=%d, confidence=%.3f)",
+            result.get('backend'),
+            len(result.get('text', '')),
+            float(result.get('confidence', 0.0))
+        )
+        return {
+            'success': True,
+            'text': result['text'],
+            'error': '',
+            'backend': result.get('backend'),
+            'confidence': float(result.get('confidence', 0.0)),
+            'ocr_mode': OCR_CASCADE_MODE,
+            'backend_latency_ms': latency,
+            'backend_status': {n: t['status'] for n, t in timings.items()}
+        }
 
     logger.error('All OCR backends failed')
     return {
@@ -356,5 +677,8 @@ def extract_text_from_image_bytes(image_bytes):
         'error': (
             'No OCR backend available. Install `paddleocr` (preferred), or `easyocr` / '
             '`pytesseract` with the Tesseract engine.'
-        )
+        ),
+        'ocr_mode': OCR_CASCADE_MODE,
+        'backend_latency_ms': latency,
+        'backend_status': {n: t['status'] for n, t in timings.items()}
     }
@@ -12,6 +12,7 @@ from .data_processor import (
 from .invoice_processor import (
     load_product_catalogs,
     build_catalog_index,
+    load_catalog_index,
     lookup_catalog_price,
     extract_products_from_text,
     build_invoice_data,
@@ -26,6 +27,7 @@ __all__ = [
     'build_dataframe_from_invoices',
     'load_product_catalogs',
     'build_catalog_index',
+    'load_catalog_index',
     'lookup_catalog_price',
     'extract_products_from_text',
     'build_invoice_data',
@@ -0,0 +1,167 @@
+"""
+Catalog Matcher
+Indexed lookup of catalog products inside normalized invoice text
+"""
+from collections import defaultdict, deque
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CatalogIndex(list):
+    """
+    Catalog entries ({'store', 'product', 'name_normalized'}) plus match indexes
+
+    Still a list of entries, so existing loops over the catalog keep working.
+    Built once per catalog; do not mutate it afterwards.
+
+    - Aho-Corasick automaton over normalized names: every catalog name that
+      occurs inside a text in one pass over the text
+    - trigram inverted index: catalog names that contain a text fragment,
+      and trigram-similarity (fuzzy) lookups
+    - id -> entry and normalized name -> entry dicts for price lookups
+    """
+
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self.by_id = {}
+        self.by_name = {}
+        self._names = []         # distinct non-empty normalized names
+        self._name_entries = []  # name id -> entry positions, in catalog order
+        name_ids = {}
+        for pos, entry in enumerate(self):
+            product_id = entry['product'].get('id')
+            self.by_id.setdefault(product_id, entry)
+            name = entry['name_normalized']
+            self.by_name.setdefault(name, entry)
+            if not name:
+                continue
+            if name not in name_ids:
+                name_ids[name] = len(self._names)
+                self._names.append(name)
+                self._name_entries.append([])
+            self._name_entries[name_ids[name]].append(pos)
+
+        self._trigram_index = defaultdict(set)
+        for name_id, name in enumerate(self._names):
+            for gram in _trigrams(name):
+                self._trigram_index[gram].add(name_id)
+
+        self._build_automaton()
+
+    def _build_automaton(self):
+        goto = [{}]
+        output = [-1]  # name id ending at this state (names are distinct)
+        for name_id, name in enumerate(self._names):
+            state = 0
+            for ch in name:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    output.append(-1)
+                state = nxt
+            output[state] = name_id
+
+        fail = [0] * len(goto)
+        dict_link = [-1] * len(goto)  # nearest proper suffix state that ends a name
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                link = goto[f].get(ch, 0)
+                if link == nxt:  # depth-1 states fail to the root
+                    link = 0
+                fail[nxt] = link
+                dict_link[nxt] = link if output[link] >= 0 else dict_link[link]
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        self._dict_link = dict_link
+
+    def names_in(self, text):
+        """Ids of every distinct catalog name that occurs as a substring of text"""
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = state if output[state] >= 0 else dict_link[state]
+            while hit > 0:
+                found.add(output[hit])
+                hit = dict_link[hit]
+        return found
+
+    def names_containing(self, fragment):
+        """Ids of every distinct catalog name that contains fragment (len >= 3)"""
+        grams = sorted((self._trigram_index.get(g, set()) for g in _trigrams(fragment)), key=len)
+        if not grams:
+            return set()
+        candidates = set(grams[0])
+        for posting in grams[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return {i for i in candidates if fragment in self._names[i]}
+
+    def find_entries(self, text):
+        """Entries whose normalized name occurs in text, in catalog order"""
+        positions = []
+        for name_id in self.names_in(text):
+            positions.extend(self._name_entries[name_id])
+        return [self[pos] for pos in sorted(positions)]
+
+    def best_match(self, norm_name, min_name_len=3):
+        """
+        Longest catalog name that contains, or is contained in, norm_name
+
+        Ties go to the earliest catalog entry, matching the original linear scan.
+        """
+        if len(norm_name) < min_name_len:
+            return None
+        candidates = self.names_in(norm_name)
+        if len(norm_name) >= 3:
+            candidates |= self.names_containing(norm_name)
+        best = None
+        for name_id in candidates:
+            name = self._names[name_id]
+            if len(name) < min_name_len:
+                continue
+            key = (-len(name), self._name_entries[name_id][0])
+            if best is None or key < best:
+                best = key
+        return self[best[1]] if best else None
+
+    def fuzzy_match(self, norm_name, min_score=0.6):
+        """
+        Entry whose name has the highest trigram Dice similarity to norm_name
+
+        Returns:
+            (entry, score) or (None, 0.0) if nothing reaches min_score
+        """
+        grams = _trigrams(norm_name)
+        if not grams:
+            return None, 0.0
+        shared = defaultdict(int)
+        for gram in grams:
+            for name_id in self._trigram_index.get(gram, ()):
+                shared[name_id] += 1
+        best_id, best_score = None, 0.0
+        for name_id, count in shared.items():
+            name_grams = max(len(self._names[name_id]) - 2, 1)
+            score = 2.0 * count / (len(grams) + name_grams)
+            if score > best_score or (score == best_score and best_id is not None
+                                      and self._name_entries[name_id][0] < self._name_entries[best_id][0]):
+                best_id, best_score = name_id, score
+        if best_id is None or best_score < min_score:
+            return None, 0.0
+        return self[self._name_entries[best_id][0]], round(best_score, 4)
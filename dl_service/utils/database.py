@@ -2,14 +2,19 @@
 Database Module
 SQLite database for persistent storage
 """
+import atexit
 import sqlite3
 import json
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 from contextlib import contextmanager
 
-from config import BASE_DIR
+from config import BASE_DIR, INVOICE_WRITE_BATCH_SIZE, INVOICE_WRITE_FLUSH_INTERVAL
 from utils.logger import get_logger
+from utils.tracing import span, traced
 
 logger = get_logger(__name__)
 
@@ -22,8 +27,9 @@ DB_PATH = DB_DIR / 'invoices.db'
 @contextmanager
 def get_db_connection():
     """Context manager for database connections"""
-    conn = sqlite3.connect(str(DB_PATH))
+    conn = sqlite3.connect(str(DB_PATH), timeout=30)
     conn.row_factory = sqlite3.Row  # Access columns by name
+    conn.execute('PRAGMA synchronous=NORMAL')  # safe with WAL, one fsync per checkpoint
     try:
         yield conn
         conn.commit()
@@ -39,6 +45,9 @@ def init_database():
     """Initialize database tables"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
+
+        # WAL lets history reads run while the invoice writer commits (persists in the file)
+        cursor.execute('PRAGMA journal_mode=WAL')
         
         # Invoices table
         cursor.execute('''
@@ -71,9 +80,148 @@ def init_database():
         logger.info("Database initialized successfully")
 
 
+INSERT_INVOICE_SQL = '''
+    INSERT OR REPLACE INTO invoices 
+    (invoice_id, store_name, store_key, total_amount, confidence, products, extracted_text)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _invoice_row(invoice_data):
+    return (
+        invoice_data.get('invoice_id'),
+        invoice_data.get('store_name'),
+        invoice_data.get('store_key'),
+        invoice_data.get('total_amount'),
+        invoice_data.get('detection_confidence'),
+        json.dumps(invoice_data.get('products', []), ensure_ascii=False),
+        invoice_data.get('extracted_text')
+    )
+
+
+class InvoiceWriteQueue:
+    """
+    Write-behind persistence for invoices
+
+    A single writer thread drains queued rows and commits them in batches with
+    executemany. Rows are keyed by invoice_id, so re-saving an invoice that is
+    still queued just replaces its row. Rows are serialized at enqueue time, so
+    later changes to the invoice dict are not persisted.
+    """
+
+    def __init__(self, batch_size=50, flush_interval=0.2):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending = OrderedDict()  # invoice_id -> row
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._thread = None
+        self._stats = {'enqueued': 0, 'deduplicated': 0, 'written': 0, 'batches': 0, 'errors': 0}
+
+    def enqueue(self, invoice_data):
+        row = _invoice_row(invoice_data)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Invoice writer is closed')
+            self._ensure_thread()
+            if row[0] in self._pending:
+                self._stats['deduplicated'] += 1
+                self._pending.move_to_end(row[0])
+            self._pending[row[0]] = row
+            self._stats['enqueued'] += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far is committed; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def discard_pending(self):
+        with self._cond:
+            self._pending.clear()
+
+    def close(self, timeout=10.0):
+        """Flush and stop the writer thread (registered with atexit)"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if not flushed:
+            logger.warning(f"Invoice writer closed with {len(self._pending)} unsaved invoices")
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending) + self._in_flight)
+
+    def _ensure_thread(self):
+        # Caller holds self._cond
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='invoice-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return  # closed and drained
+                if len(self._pending) < self.batch_size and not self._closed:
+                    # Let a burst accumulate into one commit
+                    self._cond.wait(self.flush_interval)
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popitem(last=False)[1])
+                self._in_flight = len(batch)
+
+            try:
+                with span('db.write_batch'), get_db_connection() as conn:
+                    conn.executemany(INSERT_INVOICE_SQL, batch)
+                with self._cond:
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                logger.info(f"Saved {len(batch)} invoices to database")
+            except Exception as e:
+                with self._cond:
+                    self._stats['errors'] += 1
+                logger.error(f"Error saving {len(batch)} invoices: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+
+_invoice_writer = InvoiceWriteQueue(INVOICE_WRITE_BATCH_SIZE, INVOICE_WRITE_FLUSH_INTERVAL)
+atexit.register(_invoice_writer.close)
+
+
+def queue_invoice_save(invoice_data):
+    """Queue an invoice for the background writer; returns immediately"""
+    _invoice_writer.enqueue(invoice_data)
+
+
+def flush_invoice_writes(timeout=10.0):
+    return _invoice_writer.flush(timeout)
+
+
+def get_invoice_writer_stats():
+    return _invoice_writer.stats()
+
+
+@traced('db.query', op='save_invoice')
 def save_invoice_to_db(invoice_data):
     """
-    Save invoice to database
+    Save invoice to database synchronously
+    (the detection path uses queue_invoice_save instead)
     
     Args:
         invoice_data: Invoice dictionary
@@ -86,19 +234,7 @@ def save_invoice_to_db(invoice_data):
             cursor = conn.cursor()
             
             # Use INSERT OR REPLACE to handle duplicates
-            cursor.execute('''
-                INSERT OR REPLACE INTO invoices 
-                (invoice_id, store_name, store_key, total_amount, confidence, products, extracted_text)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                invoice_data.get('invoice_id'),
-                invoice_data.get('store_name'),
-                invoice_data.get('store_key'),
-                invoice_data.get('total_amount'),
-                invoice_data.get('detection_confidence'),
-                json.dumps(invoice_data.get('products', []), ensure_ascii=False),
-                invoice_data.get('extracted_text')
-            ))
+            cursor.execute(INSERT_INVOICE_SQL, _invoice_row(invoice_data))
             
             logger.info(f"Saved invoice {invoice_data.get('invoice_id')} to database")
             return cursor.lastrowid
@@ -111,6 +247,7 @@ def save_invoice_to_db(invoice_data):
         raise
 
 
+@traced('db.query', op='save_forecast')
 def save_forecast_to_db(forecast_data):
     """
     Save forecast to database
@@ -145,6 +282,7 @@ def save_forecast_to_db(forecast_data):
         raise
 
 
+@traced('db.query', op='get_invoices')
 def get_invoices_from_db(limit=100, offset=0):
     """
     Get invoices from database
@@ -156,6 +294,7 @@ def get_invoices_from_db(limit=100, offset=0):
     Returns:
         list: List of invoice dictionaries
     """
+    flush_invoice_writes()  # read-your-writes for invoices still queued
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -190,6 +329,7 @@ def get_invoices_from_db(limit=100, offset=0):
         return []
 
 
+@traced('db.query', op='get_invoice')
 def get_invoice_by_id(invoice_id):
     """
     Get single invoice by ID
@@ -200,6 +340,7 @@ def get_invoice_by_id(invoice_id):
     Returns:
         dict: Invoice data or None
     """
+    flush_invoice_writes()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -229,6 +370,7 @@ def get_invoice_by_id(invoice_id):
         return None
 
 
+@traced('db.query', op='get_forecasts')
 def get_forecasts_from_db(limit=50):
     """
     Get forecasts from database
@@ -257,6 +399,24 @@ def get_forecasts_from_db(limit=50):
         return []
 
 
+@traced('db.query', op='invoice_count')
+def get_invoice_count():
+    """
+    Number of invoices committed to the database; queued writes are
+    reported by get_invoice_writer_stats()['pending']
+    
+    Returns:
+        int: Invoice count
+    """
+    try:
+        with get_db_connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM invoices').fetchone()[0]
+    except Exception as e:
+        logger.error(f"Error counting invoices: {e}")
+        return 0
+
+
+@traced('db.query', op='statistics')
 def get_statistics():
     """
     Get database statistics
@@ -264,6 +424,7 @@ def get_statistics():
     Returns:
         dict: Statistics
     """
+    flush_invoice_writes()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -298,6 +459,8 @@ def get_statistics():
 
 def clear_database():
     """Clear all data from database"""
+    _invoice_writer.discard_pending()
+    flush_invoice_writes()
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
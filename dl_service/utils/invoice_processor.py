@@ -9,7 +9,10 @@ from utils.data_processor import (
     normalize_text, extract_quantity_from_line,
     extract_price_candidates
 )
+from utils.catalog_matcher import CatalogIndex
+from utils.tracing import traced
 import re
+import threading
 from typing import List, Dict
 
 
@@ -38,11 +41,52 @@ def build_catalog_index(product_catalogs):
                 'product': product,
                 'name_normalized': normalize_text(product.get('name', ''))
             })
-    return catalog_index
+    return CatalogIndex(catalog_index)
+
+
+_catalog_cache = {}
+_catalog_cache_lock = threading.Lock()
+
+
+@traced('invoice.catalog_load')
+def load_catalog_index(catalog_file: Path):
+    """
+    Load and index a catalog file, rebuilding only when the file changes
+
+    Args:
+        catalog_file: Path to product_catalogs.json
+
+    Returns:
+        CatalogIndex (empty if the file is missing or invalid)
+    """
+    try:
+        stat = catalog_file.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        signature = None
+
+    key = str(catalog_file)
+    cached = _catalog_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with _catalog_cache_lock:
+        cached = _catalog_cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        catalog_index = build_catalog_index(load_product_catalogs(catalog_file))
+        _catalog_cache[key] = (signature, catalog_index)
+        print(f"[CATALOG] Indexed {len(catalog_index)} SKUs from {catalog_file}", flush=True)
+        return catalog_index
 
 
 def lookup_catalog_price(catalog_index, product_id=None, product_name=None):
     """Lookup price in catalog by ID or name"""
+    if isinstance(catalog_index, CatalogIndex):
+        entry = catalog_index.by_id.get(product_id) if product_id else None
+        if entry is None and product_name:
+            entry = catalog_index.by_name.get(normalize_text(product_name))
+        return entry['product'].get('price', 0) if entry else 0
+
     if product_id:
         for entry in catalog_index:
             if entry['product'].get('id') == product_id:
@@ -56,6 +100,7 @@ def lookup_catalog_price(catalog_index, product_id=None, product_name=None):
     return 0
 
 
+@traced('invoice.catalog_extract')
 def extract_products_from_text(text, catalog_index):
     """Extract products from invoice text"""
     lines = [line.strip() for line in text.splitlines() if line.strip()]
@@ -64,12 +109,11 @@ def extract_products_from_text(text, catalog_index):
     aggregated = {}
     store_counts = {}
     
+    if not isinstance(catalog_index, CatalogIndex):
+        catalog_index = CatalogIndex(catalog_index)
+
     for original_line, normalized_line in zip(lines, normalized_lines):
-        for entry in catalog_index:
-            name_normalized = entry['name_normalized']
-            if not name_normalized or name_normalized not in normalized_line:
-                continue
-            
+        for entry in catalog_index.find_entries(normalized_line):
             store_key = entry['store']
             store_counts[store_key] = store_counts.get(store_key, 0) + 1
             
@@ -211,6 +255,7 @@ def _is_text_line(line: str) -> bool:
 _MIN_PRICE_VND = 500
 
 
+@traced('invoice.parse')
 def parse_products_from_text(ocr_text: str) -> List[Dict]:
     """Parse invoice products from OCR text with tolerant heuristics."""
     items: List[Dict] = []
@@ -0,0 +1,258 @@
+"""
+OCR Result Cache
+Content-addressed cache for OCR cascade results
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    OCR_CACHE_ENABLED,
+    OCR_CACHE_MAX_ITEMS,
+    OCR_CACHE_TTL_SECONDS,
+    OCR_CACHE_DISK_ENABLED,
+    OCR_CACHE_DISK_PATH,
+    OCR_CACHE_DISK_MAX_ITEMS,
+    OCR_BACKEND_VERSION
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def make_cache_key(image_bytes, version=OCR_BACKEND_VERSION):
+    """
+    Build the cache key for an uploaded image
+
+    Args:
+        image_bytes: Raw encoded image bytes
+        version: OCR backend version; bump it to invalidate old entries
+
+    Returns:
+        '<version>:<sha256 hex>' string
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{version}:{digest}"
+
+
+def make_array_cache_key(image, version=OCR_BACKEND_VERSION):
+    """
+    Build the cache key for decoded pixels (see ocr_service.extract_text_from_array)
+
+    Args:
+        image: uint8 ndarray; crops are hashed row by row, without copying
+        version: OCR backend version; bump it to invalidate old entries
+
+    Returns:
+        '<version>:px:<sha256 hex>' string; shape is part of the hash
+    """
+    digest = hashlib.sha256(repr(image.shape).encode())
+    if image.flags.c_contiguous:
+        digest.update(memoryview(image).cast('B'))
+    else:
+        # Rows of a crop view are contiguous; only unusual strides get copied, a row at a time
+        for row in image:
+            digest.update(memoryview(np.ascontiguousarray(row)).cast('B'))
+    return f"{version}:px:{digest.hexdigest()}"
+
+
+class OCRResultCache:
+    """
+    Two-tier cache for OCR results
+
+    - memory: LRU of at most max_items entries
+    - disk: optional SQLite table shared across restarts, capped at
+      disk_max_items rows (least recently used rows are evicted first)
+    Entries older than ttl seconds are treated as misses in both tiers.
+    """
+
+    def __init__(self, max_items=256, ttl=86400, disk_path=None, disk_max_items=5000):
+        self.max_items = max(1, int(max_items))
+        self.ttl = ttl
+        self.disk_max_items = max(1, int(disk_max_items))
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (stored_at, result)
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'disk_errors': 0
+        }
+        self._disk = None
+        if disk_path:
+            try:
+                Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+                self._disk = sqlite3.connect(str(disk_path), check_same_thread=False)
+                self._disk.execute('PRAGMA journal_mode=WAL')
+                self._disk.execute('''
+                    CREATE TABLE IF NOT EXISTS ocr_cache (
+                        key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        stored_at REAL NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                ''')
+                self._disk.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_ocr_cache_access ON ocr_cache(last_access)'
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[OCR_CACHE] Disk tier disabled: {e}")
+                self._disk = None
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if self._fresh(stored_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return dict(result)
+                del self._memory[key]
+
+            result = self._disk_get(key, now)
+            if result is not None:
+                self._stats['disk_hits'] += 1
+                self._memory_put(key, result, now)
+                return dict(result)
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, result):
+        """Store an OCR result dict in every enabled tier"""
+        now = time.time()
+        result = dict(result)
+        with self._lock:
+            self._stats['stores'] += 1
+            self._memory_put(key, result, now)
+            self._disk_put(key, result, now)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                try:
+                    self._disk.execute('DELETE FROM ocr_cache')
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    self._stats['disk_errors'] += 1
+                    logger.warning(f"[OCR_CACHE] Disk clear failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['memory_items'] = len(self._memory)
+            s['disk_items'] = self._disk_count()
+        lookups = s['memory_hits'] + s['disk_hits'] + s['misses']
+        s.update({
+            'enabled': True,
+            'disk_enabled': self._disk is not None,
+            'max_items': self.max_items,
+            'disk_max_items': self.disk_max_items,
+            'ttl_seconds': self.ttl,
+            'version': OCR_BACKEND_VERSION,
+            'hit_rate': round((s['memory_hits'] + s['disk_hits']) / lookups, 4) if lookups else 0.0
+        })
+        return s
+
+    # --- internals (caller holds self._lock) ---
+    def _fresh(self, stored_at, now):
+        return not self.ttl or now - stored_at <= self.ttl
+
+    def _memory_put(self, key, result, stored_at):
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _disk_get(self, key, now):
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute(
+                'SELECT result, stored_at FROM ocr_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not self._fresh(row[1], now):
+                self._disk.execute('DELETE FROM ocr_cache WHERE key = ?', (key,))
+                self._disk.commit()
+                return None
+            self._disk.execute('UPDATE ocr_cache SET last_access = ? WHERE key = ?', (now, key))
+            self._disk.commit()
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            self._stats['disk_errors'] += 1
+            logger.warning(f"[OCR_CACHE] Disk read failed: {e}")
+            return None
+
+    def _disk_put(self, key, result, now):
+        if self._disk is None:
+            return
+        try:
+            self._disk.execute(
+                'INSERT OR REPLACE INTO ocr_cache (key, result, stored_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(result, ensure_ascii=False), now, now)
+            )
+            if self.ttl:
+                self._disk.execute('DELETE FROM ocr_cache WHERE stored_at < ?', (now - self.ttl,))
+            self._disk.execute('''
+                DELETE FROM ocr_cache WHERE key IN (
+                    SELECT key FROM ocr_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.disk_max_items,))
+            self._disk.commit()
+        except sqlite3.Error as e:
+            self._stats['disk_errors'] += 1
+            logger.warning(f"[OCR_CACHE] Disk write failed: {e}")
+
+    def _disk_count(self):
+        if self._disk is None:
+            return 0
+        try:
+            return self._disk.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Process-wide OCR cache, or None when OCR_CACHE_ENABLED is off"""
+    global _ocr_cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    if _ocr_cache is None:
+        with _ocr_cache_lock:
+            if _ocr_cache is None:
+                _ocr_cache = OCRResultCache(
+                    max_items=OCR_CACHE_MAX_ITEMS,
+                    ttl=OCR_CACHE_TTL_SECONDS,
+                    disk_path=OCR_CACHE_DISK_PATH if OCR_CACHE_DISK_ENABLED else None,
+                    disk_max_items=OCR_CACHE_DISK_MAX_ITEMS
+                )
+    return _ocr_cache
+
+
+def get_ocr_cache_stats():
+    """Stats payload for /api/models/info"""
+    cache = get_ocr_cache()
+    if cache is None:
+        return {'enabled': False}
+    return cache.stats()
@@ -0,0 +1,167 @@
+"""
+Timescale History Store
+Cached, vectorized view of the Model 2 product / import / sales CSV files
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PRODUCT_FILE = 'dataset_product.csv'
+IMPORT_FILE = 'import_in_a_timescale.csv'
+SALES_FILE = 'sale_in_a_timescale.csv'
+
+
+def _clean_price(price_str):
+    if pd.isna(price_str):
+        return 0
+    price_clean = str(price_str).replace('.', '').replace(',', '').strip()
+    try:
+        return float(price_clean)
+    except ValueError:
+        return 0
+
+
+def _to_python(series):
+    return dict(zip(series.index, series.to_numpy().tolist()))
+
+
+class TimescaleSnapshot:
+    """
+    Immutable result of one load of the three CSV files
+
+    - product_info: name -> {'initial_stock', 'import_price', 'retail_price'}
+    - imports / sales: name -> total quantity over the whole file
+    - import_series / sales_series: name -> (dates, quantities) numpy arrays,
+      one entry per day, sorted by date
+    """
+
+    def __init__(self, product_info, imports, sales, import_series, sales_series):
+        self.product_info = product_info
+        self.imports = imports
+        self.sales = sales
+        self.import_series = import_series
+        self.sales_series = sales_series
+
+    def sales_history(self, product_name):
+        return self.sales_series.get(product_name, (np.array([], dtype='datetime64[ns]'), np.array([], dtype=np.int64)))
+
+    def import_history(self, product_name):
+        return self.import_series.get(product_name, (np.array([], dtype='datetime64[ns]'), np.array([], dtype=np.int64)))
+
+
+class TimescaleHistoryStore:
+    """
+    Loads the timescale CSVs once and re-reads them only when a file's
+    mtime or size changes. Thread-safe; callers share the same snapshot.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._signature = None
+        self._snapshot = None
+        self.loads = 0
+
+    def _file_signature(self):
+        signature = []
+        for name in (PRODUCT_FILE, IMPORT_FILE, SALES_FILE):
+            try:
+                stat = (self.data_dir / name).stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def snapshot(self):
+        """Current TimescaleSnapshot, reloading first if any CSV changed"""
+        signature = self._file_signature()
+        if self._snapshot is not None and signature == self._signature:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or signature != self._signature:
+                self._snapshot = self._load()
+                self._signature = signature
+                self.loads += 1
+            return self._snapshot
+
+    # --- loading ---
+    def _load(self):
+        df_products = pd.read_csv(self.data_dir / PRODUCT_FILE, sep=';', encoding='utf-8')
+        logger.info(f"[DATA] Loaded {PRODUCT_FILE}: {len(df_products)} products from REAL CSV file")
+        product_info = self._product_info(df_products)
+
+        # Columns: date; product name; quantity[; unit price]
+        df_imports = pd.read_csv(self.data_dir / IMPORT_FILE, sep=';', encoding='utf-8')
+        logger.info(f"[DATA] Loaded {IMPORT_FILE}: {len(df_imports)} import records")
+        imports, import_series = self._aggregate(df_imports)
+
+        df_sales = pd.read_csv(self.data_dir / SALES_FILE, sep=';', encoding='utf-8')
+        logger.info(f"[DATA] Loaded {SALES_FILE}: {len(df_sales)} sales records")
+        sales, sales_series = self._aggregate(df_sales)
+
+        logger.info(f"Loaded timescale data: {len(product_info)} products, {len(imports)} imports, {len(sales)} sales")
+        return TimescaleSnapshot(product_info, imports, sales, import_series, sales_series)
+
+    @staticmethod
+    def _product_info(df):
+        names = df.iloc[:, 0].astype(str).str.strip()
+        stock = pd.to_numeric(df.iloc[:, 1], errors='coerce').fillna(0).astype(int)
+        zeros = pd.Series(0, index=df.index)
+        import_price = df.iloc[:, 2].map(_clean_price) if df.shape[1] > 2 else zeros
+        retail_price = df.iloc[:, 3].map(_clean_price) if df.shape[1] > 3 else zeros
+        return {
+            name: {'initial_stock': s, 'import_price': ip, 'retail_price': rp}
+            for name, s, ip, rp in zip(
+                names, stock.tolist(), import_price.tolist(), retail_price.tolist()
+            )
+        }
+
+    @staticmethod
+    def _aggregate(df):
+        """Per-product totals and per-day series from a date;name;quantity frame"""
+        if df.shape[1] < 3 or df.empty:
+            return {}, {}
+        raw_qty = df.iloc[:, 2]
+        qty = pd.to_numeric(raw_qty, errors='coerce')
+        valid = raw_qty.isna() | qty.notna()  # unparseable quantities are skipped
+        frame = pd.DataFrame({
+            'name': df.iloc[:, 1].astype(str).str.strip(),
+            'date': pd.to_datetime(df.iloc[:, 0], format='%d/%m/%Y', errors='coerce'),
+            'qty': qty.fillna(0).astype(np.int64),
+        })[valid]
+
+        totals = _to_python(frame.groupby('name', sort=False)['qty'].sum())
+
+        daily = (frame.dropna(subset=['date'])
+                 .groupby(['name', 'date'], sort=True)['qty'].sum()
+                 .reset_index())
+        series = {}
+        if not daily.empty:
+            names = daily['name'].to_numpy()
+            dates = daily['date'].to_numpy()
+            quantities = daily['qty'].to_numpy()
+            bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+            starts = np.concatenate(([0], bounds))
+            ends = np.concatenate((bounds, [len(names)]))
+            for start, end in zip(starts, ends):
+                series[names[start]] = (dates[start:end], quantities[start:end])
+        return totals, series
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_timescale_store(data_dir):
+    """Process-wide TimescaleHistoryStore for data_dir"""
+    global _store
+    if _store is None or _store.data_dir != data_dir:
+        with _store_lock:
+            if _store is None or _store.data_dir != data_dir:
+                _store = TimescaleHistoryStore(data_dir)
+    return _store
@@ -0,0 +1,170 @@
+"""
+Latency Tracing
+In-process span timers aggregated into latency histograms, rendered as
+Prometheus text for the /metrics endpoint
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from config import TRACE_BUCKETS, TRACE_SLOW_SPAN_MS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_BUCKETS = tuple(sorted(TRACE_BUCKETS))
+
+
+class _Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max', 'errors')
+
+    def __init__(self):
+        self.counts = [0] * len(_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error):
+        for i, bound in enumerate(_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+
+
+_histograms = {}  # (name, ((label, value), ...)) -> _Histogram
+_lock = threading.Lock()
+
+
+def observe(name, seconds, error=False, **labels):
+    """
+    Record one timing
+
+    Args:
+        name: Span name, dotted by component (e.g. 'ocr.backend')
+        seconds: Duration in seconds
+        error: Whether the timed operation raised
+        **labels: Extra dimensions (e.g. backend='EasyOCR'); keep them low-cardinality
+    """
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(seconds, error)
+    if TRACE_SLOW_SPAN_MS and seconds * 1000 >= TRACE_SLOW_SPAN_MS:
+        logger.info(f"[TRACE] Slow span {name} {dict(key[1])}: {seconds * 1000:.1f}ms")
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Time a block
+
+    Usage:
+        with span('layout.ctpn'):
+            ...
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, error=error, **labels)
+
+
+def traced(name, **labels):
+    """Decorator form of span()"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_span_stats():
+    """Summary per span: {'name{label=value}': {'count', 'errors', 'avg_ms', 'max_ms'}}"""
+    with _lock:
+        items = [(key, h.count, h.errors, h.total, h.max) for key, h in _histograms.items()]
+    stats = {}
+    for (name, labels), count, errors, total, peak in sorted(items):
+        label_str = ','.join(f'{k}={v}' for k, v in labels)
+        stats[f'{name}{{{label_str}}}' if label_str else name] = {
+            'count': count,
+            'errors': errors,
+            'avg_ms': round(total / count * 1000, 2) if count else 0.0,
+            'max_ms': round(peak * 1000, 2),
+        }
+    return stats
+
+
+def reset_spans():
+    with _lock:
+        _histograms.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(gauges=None):
+    """
+    Prometheus text exposition of all span histograms plus extra gauges
+
+    Args:
+        gauges: Optional {metric_name: (help, [(labels_dict, value), ...])}
+
+    Returns:
+        str in text format 0.0.4
+    """
+    with _lock:
+        snapshot = [(key, list(h.counts), h.count, h.total, h.errors) for key, h in _histograms.items()]
+
+    lines = [
+        '# HELP dl_span_duration_seconds Latency of traced operations',
+        '# TYPE dl_span_duration_seconds histogram',
+    ]
+    for (name, labels), counts, count, total, _ in sorted(snapshot):
+        base = (('span', name),) + labels
+        cumulative = 0
+        for bound, bucket_count in zip(_BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'dl_span_duration_seconds_bucket{_format_labels(base + (("le", repr(float(bound))),))} {cumulative}')
+        lines.append(f'dl_span_duration_seconds_bucket{_format_labels(base + (("le", "+Inf"),))} {count}')
+        lines.append(f'dl_span_duration_seconds_sum{_format_labels(base)} {total!r}')
+        lines.append(f'dl_span_duration_seconds_count{_format_labels(base)} {count}')
+
+    lines.append('# HELP dl_span_errors_total Traced operations that raised')
+    lines.append('# TYPE dl_span_errors_total counter')
+    for (name, labels), _, _, _, errors in sorted(snapshot):
+        lines.append(f'dl_span_errors_total{_format_labels((("span", name),) + labels)} {errors}')
+
+    for metric, (help_text, samples) in (gauges or {}).items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        for labels, value in samples:
+            lines.append(f'{metric}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
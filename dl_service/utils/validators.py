@@ -6,6 +6,10 @@ import re
 from werkzeug.datastructures import FileStorage
 
 
+# Largest accepted image upload (also applied to each image inside a batch zip)
+MAX_IMAGE_SIZE = 16 * 1024 * 1024  # 16MB
+
+
 class ValidationError(Exception):
     """Custom validation error"""
     pass
@@ -47,7 +51,7 @@ def validate_image_file(file):
     size = file.tell()
     file.seek(0)  # Reset
     
-    max_size = 16 * 1024 * 1024  # 16MB
+    max_size = MAX_IMAGE_SIZE
     if size > max_size:
         raise ValidationError(f"File too large ({size} bytes). Max: {max_size} bytes")
     
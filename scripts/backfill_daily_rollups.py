@@ -0,0 +1,15 @@
+import sys
+import os
+
+# Add root directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.database import Database
+
+print("🔧 Rebuilding daily_rollups from export/import/sales transactions...")
+
+db = Database()
+db.ensure_rollups_schema()
+days = db.rebuild_daily_rollups()
+
+print(f"✅ daily_rollups rebuilt for {days} days.")
@@ -0,0 +1,14 @@
+import sys
+import os
+
+# Add root directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.database import Database
+
+print("🔧 Backfilling item_count / total_qty for existing sales...")
+
+db = Database()
+count = db.backfill_sale_item_counts()
+
+print(f"✅ Item counts filled for {count} sales.")